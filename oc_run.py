@@ -5,7 +5,8 @@ from scr.oc_products import oc_export_products, download_supplier_price_list, \
                             process_supplier_1_price_list, process_supplier_2_price_list, process_supplier_3_price_list
 from scr.oc_suppliers_1 import find_new_products, find_change_art_shtrihcod, find_product_url, parse_product_attributes, apply_final_standardization, \
                                 fill_auxiliary_columns, refill_product_category, separate_existing_products, assign_new_sku_to_products, \
-                                process_phase_1_download, process_phase_2_finish, translate_and_prepare_csv, prepare_slugs, import_products_to_db
+                                process_phase_1_download, process_phase_2_finish, translate_and_prepare_csv, prepare_slugs, import_products_to_db, \
+                                harvest_new_product_pages
 
 
 def main():
@@ -51,6 +52,26 @@ def main():
         help="Обробка прайс-листа для постачальника 3 (конвертація .xls в .csv)."
     )
 
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Разом з --process-supplier-N: обробити файли, навіть якщо прайс-лист не змінився. "
+             "Разом з --find-product-url: шукати URL і для рядків, де він уже є."
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Разом з --find-product-url: продовжити перерваний пошук з журналу."
+    )
+
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="Разом з --find-product-url / --harvest-pages / --parse-attributes / --download-images: брати сторінки постачальника "
+             "лише з локального кешу, без запитів до сайту (офлайн-повторна обробка)."
+    )
+
     # Оновлений аргумент для перевірки CSV
     parser.add_argument(
         "--check-csv",
@@ -79,6 +100,13 @@ def main():
         help="Знайти URL нових товарів."
     )
 
+    parser.add_argument(
+        "--harvest-pages",
+        action="store_true",
+        help="Один раз завантажити та розібрати сторінки нових товарів (характеристики та зображення) "
+             "для --parse-attributes і --download-images. Разом з --force — зібрати повторно."
+    )
+
     # ✨ Додаємо новий аргумент для парсингу атрибутів
     parser.add_argument(
         "--parse-attributes",
@@ -181,13 +209,13 @@ def main():
         download_supplier_price_list(args.download_supplier)
     elif args.process_supplier_1:
         print("⚙️ Запускаю обробку прайс-листа постачальника 1...")
-        process_supplier_1_price_list()
+        process_supplier_1_price_list(force=args.force)
     elif args.process_supplier_2:
         print("⚙️ Запускаю обробку прайс-листа постачальника 2...")
-        process_supplier_2_price_list()
+        process_supplier_2_price_list(force=args.force)
     elif args.process_supplier_3:
         print("⚙️ Запускаю обробку прайс-листа постачальника 3...")
-        process_supplier_3_price_list()
+        process_supplier_3_price_list(force=args.force)
     elif args.find_new_products:
         print("🔍 Запускаю пошук нових товарів...")
         find_new_products()
@@ -196,10 +224,13 @@ def main():
         find_change_art_shtrihcod()
     elif args.find_product_url:
         print("🔍 Запускаю пошук урл товару...")
-        find_product_url()
+        find_product_url(cache_only=args.cache_only, resume=args.resume, force=args.force)
+    elif args.harvest_pages:
+        print("📄 Запускаю збір сторінок нових товарів...")
+        harvest_new_product_pages(force=args.force, cache_only=args.cache_only)
     elif args.parse_attributes:
         print("⚙️ Запускаю парсинг атрибутів...")
-        parse_product_attributes()
+        parse_product_attributes(cache_only=args.cache_only)
     elif args.import_categories:
         print("📂 Імпорт категорій у OpenCart...")
         oc_import_categories_from_csv()
@@ -220,7 +251,7 @@ def main():
         assign_new_sku_to_products()
     elif args.download_images:
         print("📸 Запускаю ЕТАП 1: Завантаження зображень...")
-        process_phase_1_download()
+        process_phase_1_download(cache_only=args.cache_only)
     elif args.process_images:
         print("⚙️ Запускаю ЕТАП 2: Обробка та копіювання зображень...")
         process_phase_2_finish()
@@ -2,15 +2,17 @@ import argparse
 from scr.base_function import check_version, check_csv_data, export_product_by_id, update_image_seo_by_sku, translate_csv_to_ru, \
                         log_global_attributes, convert_local_attributes_to_global, test_search_console_access, \
                         check_and_index_url_in_google, process_indexing_for_new_products, recheck_none_indexed_pages, \
-                        preload_cache_from_urls
-from scr.products import export_products, download_supplier_price_list, process_supplier_1_price_list, \
-                        process_supplier_2_price_list, process_supplier_3_price_list, process_and_combine_all_data, \
+                        preload_cache_from_urls, log_http_metrics, benchmark_parsers
+from scr.products import export_products, download_supplier_price_list, download_all_supplier_price_lists, \
+                        process_supplier_1_price_list, process_supplier_2_price_list, process_supplier_3_price_list, \
+                        normalize_all_suppliers, process_and_combine_all_data, verify_combine_engines, \
                         prepare_for_website_upload, update_products
 from scr.suppliers_1 import find_new_products, find_product_data, parse_product_attributes, apply_final_standardization, \
                         fill_product_category, refill_product_category, separate_existing_products, assign_new_sku_to_products, \
                         download_images_for_product, create_new_products_import_file, update_existing_products_batch, \
                         create_new_products_batch, update_image_seo_from_csv, translate_and_prepare_new_prod_csv, \
-                        upload_ru_translation_to_wp, fill_wpml_translation_group, update_image_seo_ru_from_csv
+                        upload_ru_translation_to_wp, fill_wpml_translation_group, update_image_seo_ru_from_csv, \
+                        harvest_new_product_pages
 
 
 def main():
@@ -26,6 +28,18 @@ def main():
         action="store_true", 
         help="Експортувати всі товари магазину у CSV файл."
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Разом з --export: завантажити лише змінені з минулого запуску товари та злити їх у zalishki.csv."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["rest", "sql"],
+        default="rest",
+        help="Разом з --export: джерело даних — WooCommerce REST API (rest) або напряму база даних (sql). "
+             "Разом з --update-products 1: запис залишків і цін напряму в базу (sql)."
+    )
     parser.add_argument(
         "--check-version", 
         action="store_true", 
@@ -47,6 +61,12 @@ def main():
         help="Завантажити прайс-лист від постачальника за його ID (наприклад, --download-supplier 1)."
     )
 
+    parser.add_argument(
+        "--download-suppliers",
+        type=str,
+        help="Паралельно завантажити прайс-листи постачальників: 'all' або ID через кому (наприклад, --download-suppliers 1,3)."
+    )
+
     parser.add_argument(
         "--process-supplier-1",
         action="store_true",
@@ -65,17 +85,58 @@ def main():
         help="Обробка прайс-листа для постачальника 3 (конвертація .xls в .csv)."
     )
 
+    parser.add_argument(
+        "--process-suppliers",
+        type=str,
+        help="Паралельно обробити прайс-листи за правилами з settings.json: 'all' або ID через кому."
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Разом з --process-supplier(s) / --combine-tables: обробити файли, навіть якщо прайс-лист не змінився. "
+             "Разом з --update-products: надіслати всі рядки, ігноруючи знімок відправленого стану. "
+             "Разом з --find-product-data: шукати URL і для рядків, де він уже є."
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Разом з --update-products / --update-old-products / --create-new-products / --find-product-data: "
+             "продовжити перерване завдання з журналу."
+    )
+
     parser.add_argument(
         "--combine-tables",
         action="store_true",
         help="Об'єднати всі прайси та залишки в одну зведену таблицю."
     )
+    parser.add_argument(
+        "--engine",
+        choices=["python", "vectorized"],
+        help="Разом з --combine-tables: рушій об'єднання (за замовчуванням з settings.json, інакше python)."
+    )
+    parser.add_argument(
+        "--check-combine-engines",
+        action="store_true",
+        help="Запустити обидва рушії об'єднання та перевірити, що зведена таблиця однакова."
+    )
     # Додаємо новий аргумент для підготовки файлу для завантаження
     parser.add_argument(
         "--prepare-upload",
         action="store_true",
         help="Підготувати файл для завантаження на сайт."
     )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Разом з --prepare-upload: зерно генератора знижок для відтворюваного результату."
+    )
+    parser.add_argument(
+        "--debug-csv",
+        action="store_true",
+        help="Разом з --prepare-upload: додатково записати проміжний файл na_sait.csv."
+    )
     # Додано новий аргумент для запуску функції оновлення товарів
     parser.add_argument(    
         "--update-products", 
@@ -97,12 +158,33 @@ def main():
         help="Знайти URL, штрих-код та атрибути для нових товарів."
     )
 
+    parser.add_argument(
+        "--harvest-pages",
+        action="store_true",
+        help="Один раз завантажити та розібрати сторінки нових товарів (характеристики та зображення) "
+             "для --parse-attributes і --download-images. Разом з --force — зібрати повторно."
+    )
+
     # ✨ Додаємо новий аргумент для парсингу атрибутів
     parser.add_argument(
         "--parse-attributes",
         action="store_true",
         help="Парсити сторінки товарів для вилучення атрибутів."
     )
+    parser.add_argument(
+        "--benchmark-parsers",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Порівняти рушії розбору HTML (bs4 / lxml) на збережених сторінках постачальника: "
+             "однаковість результатів і швидкість. За замовчуванням — кеш сторінок."
+    )
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="Разом з --find-product-data / --harvest-pages / --parse-attributes / --download-images: брати сторінки постачальника "
+             "лише з локального кешу, без запитів до сайту (офлайн-повторна обробка)."
+    )
 
     # ✨ НОВИЙ АРГУМЕНТ для фінальної стандартизації
     parser.add_argument(
@@ -276,16 +358,22 @@ def main():
     # 4. Вибір функції для запуску на основі аргументів
     if args.export:
         print("🚀 Запускаю експорт товарів...")
-        export_products()
+        export_products(incremental=args.incremental, backend=args.backend)
     elif args.check_version:
         print("🔍 Запускаю перевірку версії WooCommerce...")
         check_version()
     elif args.download_supplier:
         print(f"🌐 Запускаю завантаження прайс-листа постачальника з ID {args.download_supplier}...")
         download_supplier_price_list(args.download_supplier)
+    elif args.download_suppliers:
+        print(f"🌐 Запускаю паралельне завантаження прайс-листів постачальників ({args.download_suppliers})...")
+        download_all_supplier_price_lists(args.download_suppliers)
+    elif args.process_suppliers:
+        print(f"⚙️ Запускаю паралельну обробку прайс-листів постачальників ({args.process_suppliers})...")
+        normalize_all_suppliers(args.process_suppliers, force=args.force)
     elif args.process_supplier_1:
         print("⚙️ Запускаю обробку прайс-листа постачальника 1...")
-        process_supplier_1_price_list()
+        process_supplier_1_price_list(force=args.force)
         # Оновлена логіка для check-csv
     elif args.check_csv:
         print(f"⚙️ Запускаю перевірку CSV-файлу з профілем '{args.check_csv}'...")
@@ -295,20 +383,23 @@ def main():
             print("❌ Перевірка не пройшла. Перегляньте лог-файл для деталей.")
     elif args.process_supplier_2:
         print("⚙️ Запускаю обробку прайс-листа постачальника 2...")
-        process_supplier_2_price_list()
+        process_supplier_2_price_list(force=args.force)
     elif args.process_supplier_3:
         print("⚙️ Запускаю обробку прайс-листа постачальника 3...")
-        process_supplier_3_price_list()
+        process_supplier_3_price_list(force=args.force)
     elif args.combine_tables:
         print("⚙️ Запускаю створення зведеної таблиці...")
-        process_and_combine_all_data()
+        process_and_combine_all_data(force=args.force, engine=args.engine)
+    elif args.check_combine_engines:
+        print("⚙️ Порівнюю рушії об'єднання зведеної таблиці...")
+        verify_combine_engines()
     elif args.prepare_upload:
         print("⚙️ Запускаю підготовку файлу для завантаження на сайт...")
-        prepare_for_website_upload()
+        prepare_for_website_upload(seed=args.seed, debug_csv=args.debug_csv or None)
     elif args.update_products: 
         print("📦 Запускаю оновлення товарів на сайті...")
         # ТЕПЕР МИ ПЕРЕДАЄМО ЗНАЧЕННЯ АРГУМЕНТУ ДО ФУНКЦІЇ update_products
-        update_products(str(args.update_products))
+        update_products(str(args.update_products), force=args.force, resume=args.resume, backend=args.backend)
     
         
     # ✨ Нова логіка для пошуку нових товарів
@@ -319,11 +410,18 @@ def main():
     # ✨ Додаємо новий elif блок для запуску нової функції
     elif args.find_product_data:
         print("🔍 Запускаю пошук даних про товари...")
-        find_product_data()
+        find_product_data(cache_only=args.cache_only, resume=args.resume, force=args.force)
 
+    elif args.benchmark_parsers is not None:
+        print("⏱️ Порівнюю рушії розбору HTML...")
+        benchmark_parsers(args.benchmark_parsers or None)
+
+    elif args.harvest_pages:
+        print("📄 Запускаю збір сторінок нових товарів...")
+        harvest_new_product_pages(force=args.force, cache_only=args.cache_only)
     elif args.parse_attributes:
         print("⚙️ Запускаю парсинг атрибутів...")
-        parse_product_attributes()
+        parse_product_attributes(cache_only=args.cache_only)
 
     # ✨ Додаємо новий elif блок для фінальної стандартизації
     elif args.standardize_final:
@@ -353,7 +451,7 @@ def main():
     # ✨ Додаємо новий elif блок для завантаження зображень
     elif args.download_images:
         print("🖼️ Запускаю комплексний процес завантаження, перейменування та сортування зображень...")
-        download_images_for_product()
+        download_images_for_product(cache_only=args.cache_only)
 
     # ✨ Додаємо новий elif блок для створення файлу імпорту
     elif args.create_import_file:
@@ -363,11 +461,11 @@ def main():
     # --- НОВИЙ ВИКЛИК ---
     elif args.update_old_products:
         print("⬆️ Починаю пакетне оновлення існуючих товарів...")
-        update_existing_products_batch()
+        update_existing_products_batch(resume=args.resume)
 
     elif args.create_new_products:
         print("✨ Починаю пакетне створення нових товарів...")
-        create_new_products_batch()
+        create_new_products_batch(resume=args.resume)
 
     elif args.export_product_by_id:
         print("✨ Запуск функції для парсингу всіх данних товару по його ID...")
@@ -435,6 +533,9 @@ def main():
         print("❌ Не вказано жодної дії. Використайте -h або --help для довідки.")
         parser.print_help()
 
+    # Зведена статистика HTTP-запитів до WooCommerce / WordPress за цей запуск
+    log_http_metrics()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
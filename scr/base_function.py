@@ -1,15 +1,17 @@
-from woocommerce import API
 import json
-import os, csv, shutil, logging, requests, mimetypes, glob, sys, subprocess
+import os, csv, shutil, logging, requests, mimetypes, glob, sys, subprocess, threading, hashlib, random, bisect, sqlite3
 import html
 import re
 import mysql.connector
 from datetime import datetime
 from typing import Dict, Tuple, List, Optional, Any
 from PIL import Image
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import time
 import pymysql
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse
 from time import sleep
 
 
@@ -30,23 +32,415 @@ def load_settings():
         return None
 
 # --- ПІДКЛЮЧЕННЯ ДО WOOCOMMERCE API ---
-def get_wc_api(settings):
+def get_wc_api(settings=None):
     """
-    Завантаження конфігурації з settings.json
+    Повертає спільний WooClient (пул з'єднань, ліміти, повтори) для налаштувань з settings.json.
+    Один клієнт на процес: усі етапи ділять з'єднання та статистику.
     """
-    config_path = os.path.join(os.path.dirname(__file__), "..", "config", "settings.json")
-    with open(config_path, "r", encoding="utf-8") as f:
-        settings = json.load(f)
-
-    wcapi = API(
-        url=settings["url"],
-        consumer_key=settings["consumer_key"],
-        consumer_secret=settings["consumer_secret"],
-        version="wc/v3",
-        timeout=120,
-        query_string_auth=False  # Змінив з True 👈 використовує Basic Auth (рекомендовано) 
+    global _wc_client
+    if not settings:
+        settings = load_settings()
+
+    with _wc_client_lock:
+        if (_wc_client is None or _wc_client.url != settings["url"]
+                or _wc_client.consumer_key != settings["consumer_key"]):
+            wp_auth = (settings["login"], settings["pass"]) if settings.get("login") and settings.get("pass") else None
+            _wc_client = WooClient(
+                url=settings["url"],
+                consumer_key=settings["consumer_key"],
+                consumer_secret=settings["consumer_secret"],
+                version="wc/v3",
+                timeout=120,
+                wp_auth=wp_auth,
+                http_conf=settings.get("http", {})
+            )
+    return _wc_client
+
+# --- HTTP-СЕСІЯ З ПУЛОМ З'ЄДНАНЬ ТА ОБМЕЖЕННЯ ШВИДКОСТІ ---
+def create_http_session(pool_size: int = 10, auth: Optional[Tuple[str, str]] = None) -> requests.Session:
+    """
+    Створює requests.Session з пулом keep-alive з'єднань, розрахованим
+    на pool_size паралельних потоків.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if auth:
+        session.auth = auth
+    return session
+
+class RateLimiter:
+    """
+    Потокобезпечний обмежувач швидкості (token bucket).
+    rate  — кількість запитів на секунду (0 або менше — без обмеження);
+    burst — скільки запитів можна виконати одразу без очікування.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate or 0)
+        self.capacity = max(1, int(burst or 1))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# --- СПІЛЬНИЙ КЛІЄНТ WOOCOMMERCE / WORDPRESS REST API ---
+class WooClient:
+    """
+    Єдиний HTTP-клієнт для wc/v3 та wp/v2: спільний пул keep-alive з'єднань,
+    авторизація, ліміт паралельних запитів, обмеження швидкості за ендпоінтами,
+    повтори ідемпотентних запитів та статистика часу відповідей.
+
+    Сумісний з woocommerce.API: get/post/put/delete(endpoint, ...) повертають requests.Response.
+    Налаштування — settings["http"]: pool_size, max_concurrency, timeout, retries,
+    backoff_base, backoff_max, rate_limits ({"wc/v3/products/batch": 2, ...} — запитів/сек).
+    """
+    RETRY_METHODS = ("GET", "PUT", "DELETE", "HEAD", "OPTIONS")
+
+    def __init__(self, url: str, consumer_key: str, consumer_secret: str, version: str = "wc/v3",
+                 timeout: int = 120, wp_auth: Optional[Tuple[str, str]] = None,
+                 http_conf: Optional[Dict[str, Any]] = None):
+        http_conf = http_conf or {}
+        self.url = url
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.version = version
+        self.timeout = http_conf.get("timeout", timeout)
+        self.wp_auth = wp_auth or (consumer_key, consumer_secret)
+        self.retries = int(http_conf.get("retries", 3))
+        self.backoff_base = float(http_conf.get("backoff_base", 1))
+        self.backoff_max = float(http_conf.get("backoff_max", 30))
+
+        max_concurrency = max(1, int(http_conf.get("max_concurrency", 8)))
+        self.session = create_http_session(pool_size=max(max_concurrency, int(http_conf.get("pool_size", 10))),
+                                           auth=(consumer_key, consumer_secret))
+        self.session.headers.update({"Accept": "application/json"})
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Довший префікс перевіряється першим: "wc/v3/products/batch" важливіший за "wc/v3"
+        self._limiters = sorted(
+            ((prefix.strip("/"), RateLimiter(rate, burst=max(1, int(rate)))) for prefix, rate in http_conf.get("rate_limits", {}).items()),
+            key=lambda item: len(item[0]), reverse=True
+        )
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._metrics_lock = threading.Lock()
+
+    def _api_url(self, endpoint: str, namespace: Optional[str]) -> str:
+        return f"{self.url.rstrip('/')}/wp-json/{namespace or self.version}/{endpoint.lstrip('/')}"
+
+    def _record(self, key: str, elapsed: float, failed: bool):
+        with self._metrics_lock:
+            stats = self._metrics.setdefault(key, {"requests": 0, "errors": 0, "seconds": 0.0, "max": 0.0})
+            stats["requests"] += 1
+            stats["errors"] += int(failed)
+            stats["seconds"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    def request(self, method: str, endpoint: str, data: Any = None, params: Optional[Dict[str, Any]] = None,
+                namespace: Optional[str] = None, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """
+        Виконує запит до /wp-json/<namespace>/<endpoint> (namespace за замовчуванням — wc/v3).
+        Таймаути, помилки з'єднання, 429 та 5xx повторюються для ідемпотентних методів
+        з експоненційною затримкою та розкидом. POST не повторюється (за це відповідає
+        post_batch_with_retry, який знає, як ділити пакет).
+        """
+        method = method.upper()
+        namespace = (namespace or self.version).strip("/")
+        path = f"{namespace}/{endpoint.strip('/')}"
+        metric_key = f"{method} {re.sub(r'/[0-9]+(?=/|$)', '/{id}', path)}"
+        limiter = next((limiter for prefix, limiter in self._limiters if path.startswith(prefix)), None)
+        if retries is None:
+            retries = self.retries if method in self.RETRY_METHODS else 0
+        kwargs.setdefault("timeout", self.timeout)
+        if data is not None:
+            kwargs["json"] = data
+
+        attempt = 0
+        while True:
+            if limiter:
+                limiter.acquire()
+            start_time = time.monotonic()
+            response = None
+            try:
+                with self._slots:
+                    response = self.session.request(method, self._api_url(endpoint, namespace), params=params, **kwargs)
+                error = None if response.status_code != 429 and response.status_code < 500 else f"HTTP {response.status_code}"
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempt >= retries:
+                    self._record(metric_key, time.monotonic() - start_time, True)
+                    raise
+            self._record(metric_key, time.monotonic() - start_time, error is not None)
+
+            if error is None or attempt >= retries:
+                return response
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+            attempt += 1
+            logging.warning(f"🔁 {method} {path}: {error}. Повтор {attempt}/{retries} через {delay:.1f} сек.")
+            time.sleep(delay)
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, data: Any = None, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, data=data, **kwargs)
+
+    def put(self, endpoint: str, data: Any = None, **kwargs) -> requests.Response:
+        return self.request("PUT", endpoint, data=data, **kwargs)
+
+    def delete(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", endpoint, **kwargs)
+
+    def wp(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """
+        Запит до WordPress REST API (wp/v2) з обліковими даними WordPress (login/pass).
+        auth=False — анонімний запит (без заголовка Authorization).
+        """
+        kwargs.setdefault("auth", self.wp_auth)
+        if kwargs["auth"] is False:
+            kwargs["auth"] = lambda prepared: prepared  # перекриває авторизацію сесії
+        return self.request(method, endpoint, namespace="wp/v2", **kwargs)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._metrics_lock:
+            return {key: dict(stats) for key, stats in self._metrics.items()}
+
+    def log_metrics(self):
+        """Пише в лог зведення за ендпоінтами: кількість запитів, помилки, середній та максимальний час."""
+        metrics = self.metrics()
+        if not metrics:
+            return
+        logging.info("--- 📊 Статистика HTTP-запитів ---")
+        for key, stats in sorted(metrics.items(), key=lambda item: item[1]["seconds"], reverse=True):
+            average = stats["seconds"] / stats["requests"]
+            logging.info(f"{key}: {int(stats['requests'])} запитів, помилок {int(stats['errors'])}, "
+                         f"сер. {average:.2f} сек., макс. {stats['max']:.2f} сек., всього {stats['seconds']:.1f} сек.")
+
+_wc_client: Optional[WooClient] = None
+_wc_client_lock = threading.Lock()
+
+def log_http_metrics():
+    """Пише в лог статистику спільного клієнта, якщо він створювався під час запуску."""
+    if _wc_client:
+        _wc_client.log_metrics()
+
+# --- КОНКУРЕНТНИЙ ЗБІР СТОРІНОК ПОСТАЧАЛЬНИКІВ ---
+class HostRateLimiter:
+    """Окремий token bucket (RateLimiter) на кожен хост: rate запитів/сек, burst — одразу без очікування."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate, self.burst)
+        limiter.acquire()
+
+class PageNotCachedError(requests.RequestException):
+    """Режим --cache-only: сторінки немає в локальному кеші, а мережу використовувати не можна."""
+
+class PageCache:
+    """
+    Кеш відповідей постачальника на диску, спільний для всіх етапів збору.
+    Ключ — SHA-256 від URL: тіло в <path>/<ab>/<key>.body, метадані (url, час, ETag,
+    Last-Modified, Content-Type, кодування) — у <key>.json поруч.
+    Запис свіжий ttl_hours годин; застарілий можна перевалідувати умовним GET.
+    """
+    def __init__(self, path: str, ttl_hours: float = 24):
+        self.path = path
+        self.ttl = float(ttl_hours) * 3600
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        folder = os.path.join(self.path, key[:2])
+        return os.path.join(folder, key + ".body"), os.path.join(folder, key + ".json")
+
+    def load(self, url: str) -> Optional[Dict[str, Any]]:
+        """Метадані запису з тілом у 'content' та ознакою 'fresh', або None, якщо запису немає."""
+        body_path, meta_path = self._paths(url)
+        meta = load_json_state(meta_path)
+        if not meta or not os.path.exists(body_path):
+            return None
+        with open(body_path, "rb") as f:
+            meta["content"] = f.read()
+        meta["fresh"] = time.time() - meta.get("fetched_at", 0) < self.ttl
+        return meta
+
+    def store(self, url: str, response: requests.Response):
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        temp_path = f"{body_path}.{threading.get_ident()}.temp"
+        with open(temp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(temp_path, body_path)
+        save_json_state(meta_path, {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "encoding": response.encoding,
+        })
+
+    def touch(self, url: str, entry: Dict[str, Any]):
+        """Сервер відповів 304 — запис знову свіжий."""
+        _, meta_path = self._paths(url)
+        meta = {key: value for key, value in entry.items() if key not in ("content", "fresh")}
+        meta["fetched_at"] = time.time()
+        save_json_state(meta_path, meta)
+
+    @staticmethod
+    def to_response(url: str, entry: Dict[str, Any]) -> requests.Response:
+        """Відновлює requests.Response з запису кешу (для коду, що працює з .text / .content)."""
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response._content = entry["content"]
+        response.encoding = entry.get("encoding")
+        if entry.get("content_type"):
+            response.headers["Content-Type"] = entry["content_type"]
+        return response
+
+class SupplierScraper:
+    """
+    Паралельне завантаження сторінок постачальника: невеликий пул потоків,
+    спільна keep-alive сесія та обмеження швидкості на хост замість фіксованих пауз.
+    Налаштування — settings["scraping"]: workers (4), rate (1.0 запит/сек на хост),
+    burst (2), image_rate / image_burst (4 / 4 — окремий ліміт для файлів зображень),
+    timeout (30 сек.), user_agent; cache — кеш сторінок на диску:
+    enabled (true), ttl_hours (24), revalidate (true — умовний GET для застарілих записів).
+    cache_only=True — лише кеш, без мережі (для офлайн-повторної обробки).
+    parser — рушій розбору HTML: lxml (за замовчуванням, якщо встановлено) або bs4.
+    """
+    def __init__(self, conf: Optional[Dict[str, Any]] = None, cache_path: Optional[str] = None, cache_only: bool = False):
+        conf = conf or {}
+        cache_conf = conf.get("cache", {})
+        self.workers = max(1, int(conf.get("workers", 4)))
+        self.timeout = conf.get("timeout", 30)
+        self.limiter = HostRateLimiter(float(conf.get("rate", 1.0)), int(conf.get("burst", 2)))
+        self.image_limiter = HostRateLimiter(float(conf.get("image_rate", 4.0)), int(conf.get("image_burst", 4)))
+        self.session = create_http_session(pool_size=self.workers)
+        if conf.get("user_agent"):
+            self.session.headers["User-Agent"] = conf["user_agent"]
+        self.cache = PageCache(cache_path, cache_conf.get("ttl_hours", 24)) \
+            if cache_path and cache_conf.get("enabled", True) else None
+        self.revalidate = cache_conf.get("revalidate", True)
+        self.parser = resolve_parser(conf.get("parser", "lxml"))
+        self.cache_only = cache_only
+        if cache_only and not self.cache:
+            raise ValueError("Режим --cache-only потребує увімкненого кешу сторінок (scraping.cache.enabled).")
+        self.stats = {"cache": 0, "revalidated": 0, "network": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get(self, url: str) -> requests.Response:
+        """
+        GET через кеш сторінок: свіжий запис віддається без запиту, застарілий — перевалідовується
+        (If-None-Match / If-Modified-Since), інакше звичайний запит з урахуванням ліміту хоста.
+        При HTTP-помилці — requests.HTTPError; у режиму cache_only без запису — PageNotCachedError.
+        """
+        entry = self.cache.load(url) if self.cache else None
+        if entry and (entry["fresh"] or self.cache_only):
+            self._count("cache")
+            return PageCache.to_response(url, entry)
+        if self.cache_only:
+            raise PageNotCachedError(f"Сторінки немає в кеші (--cache-only): {url}")
+
+        headers = {}
+        if entry and self.revalidate:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        self.limiter.acquire(url)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry:
+            self.cache.touch(url, entry)
+            self._count("revalidated")
+            return PageCache.to_response(url, entry)
+        response.raise_for_status()
+        self._count("network")
+        if self.cache:
+            self.cache.store(url, response)
+        return response
+
+    def open_image(self, url: str) -> requests.Response:
+        """
+        Потоковий GET файлу зображення (stream=True) з окремим лімітом хоста; використовувати через with.
+        У режимі cache_only мережа недоступна — PageNotCachedError (файли беруться лише зі сховища зображень).
+        """
+        if self.cache_only:
+            raise PageNotCachedError(f"Зображення не в сховищі: {url}")
+        self.image_limiter.acquire(url)
+        response = self.session.get(url, timeout=self.timeout, stream=True)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def map_ordered(self, func, items):
+        """
+        Виконує func(item) у пулі потоків і віддає результати в порядку items.
+        Одночасно в роботі не більше workers * 2 елементів, тож великі файли не читаються в пам'ять повністю.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self):
+        self.session.close()
+        if self.cache:
+            logging.info(f"🗄️ Кеш сторінок: з кешу {self.stats['cache']}, перевалідовано (304) {self.stats['revalidated']}, "
+                         f"завантажено {self.stats['network']}.")
+
+def get_supplier_scraper(settings: Dict[str, Any], cache_only: bool = False) -> SupplierScraper:
+    """Скрапер з налаштувань 'scraping'; кеш сторінок — paths.http_cache (за замовчуванням csv/process/http_cache)."""
+    cache_path = get_state_path(settings, "http_cache", "csv/process/http_cache")
+    return SupplierScraper(settings.get("scraping", {}), cache_path, cache_only=cache_only)
+
+# --- ПІДКЛЮЧЕННЯ ДО БАЗИ ДАНИХ WORDPRESS ---
+def connect_wp_db(db_conf: Dict[str, Any], streaming: bool = False):
+    """
+    Відкриває pymysql-з'єднання з базою сайту за параметрами settings['db'].
+    streaming=True — курсор на боці сервера (SSDictCursor): рядки читаються
+    по одному, без завантаження всього результату в пам'ять.
+    """
+    return pymysql.connect(
+        host=db_conf["host"],
+        user=db_conf["user"],
+        password=db_conf["password"],
+        database=db_conf["database"],
+        charset="utf8mb4",
+        cursorclass=pymysql.cursors.SSDictCursor if streaming else pymysql.cursors.DictCursor
     )
-    return wcapi
 
 # --- ПЕРЕВІРКА ВЕРСІЇ WOOCOMMERCE ---
 def check_version():
@@ -490,6 +884,566 @@ def load_poznachky_csv():
         logging.error(f"Виникла помилка при завантаженні poznachky.csv: {e}")
         return []
 
+# --- СЛУЖБОВІ JSON-ФАЙЛИ СТАНУ (водяні знаки, хеші, знімки) ---
+def get_state_path(settings: Dict[str, Any], key: str, default: str) -> str:
+    """
+    Повертає абсолютний шлях до файлу стану з settings['paths'][key]
+    або зі шляху за замовчуванням (відносно кореня проєкту).
+    """
+    rel_path = settings.get("paths", {}).get(key, default)
+    return os.path.join(os.path.dirname(__file__), "..", rel_path)
+
+def load_json_state(path: str) -> Dict[str, Any]:
+    """Завантажує JSON-файл стану. Якщо файлу немає або він пошкоджений — порожній словник."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"⚠️ Файл стану {path} не прочитано ({e}). Починаю з порожнього стану.")
+        return {}
+
+def save_json_state(path: str, data: Dict[str, Any]):
+    """Атомарно записує JSON-файл стану (через тимчасовий файл)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + ".temp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+# --- УМОВНЕ ЗАВАНТАЖЕННЯ ФАЙЛІВ ТА МАРКЕРИ ЗМІН ---
+def _sidecar_path(path: str) -> str:
+    """Шлях до службового файлу з метаданими завантаження (поруч з основним файлом)."""
+    return path + ".meta.json"
+
+def download_file_conditional(url: str, dest_path: str, session: Optional[requests.Session] = None,
+                              timeout: int = 300) -> Dict[str, Any]:
+    """
+    Завантажує файл з умовним GET (If-None-Match / If-Modified-Since) та перевіркою SHA-256.
+    Відповідь пишеться потоково у тимчасовий файл і замінює dest_path атомарно,
+    тож невдале завантаження ніколи не залишає конвеєр без файлу.
+
+    Метадані (etag, last_modified, sha256, processed_sha256) зберігаються у <dest_path>.meta.json.
+    Повертає словник зі статусом:
+        "changed"      — отримано новий вміст, файл замінено;
+        "not_modified" — сервер відповів 304, файл не змінювався;
+        "unchanged"    — вміст збігся з попереднім за хешем, файл не чіпаємо.
+    """
+    meta_path = _sidecar_path(dest_path)
+    previous = load_json_state(meta_path) if os.path.exists(dest_path) else {}
+
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+
+    temp_path = dest_path + ".part"
+    http = session or requests
+    start = time.time()
+    size = 0
+
+    try:
+        with http.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304:
+                status = "not_modified"
+                meta = previous
+            else:
+                r.raise_for_status()
+                os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+                digest = hashlib.sha256()
+                with open(temp_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=256 * 1024):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                sha256 = digest.hexdigest()
+
+                if sha256 == previous.get("sha256"):
+                    # Вміст той самий — залишаємо файл (він міг бути вже оброблений на місці)
+                    os.remove(temp_path)
+                    status = "unchanged"
+                else:
+                    os.replace(temp_path, dest_path)
+                    status = "changed"
+
+                meta = {
+                    **previous,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "sha256": sha256,
+                }
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    meta["status"] = status
+    meta["checked_at"] = datetime.now().isoformat(timespec="seconds")
+    if status == "changed":
+        meta["downloaded_at"] = meta["checked_at"]
+    save_json_state(meta_path, meta)
+
+    return {"status": status, "changed": status == "changed", "bytes": size,
+            "elapsed": time.time() - start, "sha256": meta.get("sha256")}
+
+def file_sha256(path: str) -> str:
+    """SHA-256 вмісту файлу (читається блоками, без завантаження в пам'ять)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_already_processed(path: str) -> bool:
+    """
+    True, якщо поточний вміст файлу (за хешем з <path>.meta.json) уже був оброблений.
+    Для файлів без метаданих (завантажених вручну) завжди False.
+    """
+    meta = load_json_state(_sidecar_path(path))
+    return bool(meta.get("sha256")) and meta.get("processed_sha256") == meta.get("sha256")
+
+def mark_source_processed(path: str):
+    """Позначає поточний вміст файлу (його SHA-256) як оброблений."""
+    meta_path = _sidecar_path(path)
+    meta = load_json_state(meta_path)
+    if meta.get("sha256"):
+        meta["processed_sha256"] = meta["sha256"]
+        save_json_state(meta_path, meta)
+
+def _inputs_fingerprint(input_paths: List[str]) -> Dict[str, List[int]]:
+    """Відбиток вхідних файлів: розмір і час зміни кожного з них."""
+    fingerprint = {}
+    for path in input_paths:
+        stat = os.stat(path)
+        fingerprint[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+def inputs_unchanged(output_path: str, input_paths: List[str]) -> bool:
+    """
+    True, якщо output_path існує і жоден з input_paths не змінився
+    з моменту останнього save_inputs_fingerprint для цього output_path.
+    """
+    if not os.path.exists(output_path) or not all(os.path.exists(p) for p in input_paths):
+        return False
+    meta = load_json_state(_sidecar_path(output_path))
+    return meta.get("inputs") == _inputs_fingerprint(input_paths)
+
+def save_inputs_fingerprint(output_path: str, input_paths: List[str]):
+    """Запам'ятовує стан вхідних файлів, з яких щойно зібрано output_path."""
+    save_json_state(_sidecar_path(output_path), {"inputs": _inputs_fingerprint(input_paths)})
+
+# --- РОЗБІР HTML ПОСТАЧАЛЬНИКА: РУШІЇ bs4 / lxml ---
+# Обидва рушії повертають однакові структури; lxml швидший, bs4 (html.parser) — еталон і запасний варіант.
+_CLASS_XPATH = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+# SoupStrainer з class_='card-block' не бачить блоків з кількома класами ("card-block product-card")
+_CARD_BLOCK_CLASS = re.compile(r"(^|\s)card-block(\s|$)")
+_lxml_state: Dict[str, Any] = {}
+
+def _lxml_tools() -> Optional[Dict[str, Any]]:
+    """Парсер і XPath-вирази lxml, скомпільовані один раз за запуск; None — якщо lxml не встановлено."""
+    if "tools" not in _lxml_state:
+        try:
+            from lxml import etree
+        except ImportError:
+            _lxml_state["tools"] = None
+        else:
+            has_class = _CLASS_XPATH.format
+            _lxml_state["tools"] = {
+                "parser": etree.HTMLParser(encoding="utf-8"),
+                "fromstring": etree.fromstring,
+                "variant_inputs": etree.XPath(f"//input[{has_class('variant_control')} and @data-code]"),
+                "radio_divs": etree.XPath(f"//div[{has_class('radio')}]"),
+                "card_block": etree.XPath(f"ancestor::div[{has_class('card-block')}][1]"),
+                "card_link": etree.XPath(f"((.//h4[{has_class('card-title')}])[1]//a)[1]"),
+                "char_table": etree.XPath("(//div[@id='w0-tab0'])[1]"),
+                "first_table": etree.XPath("(.//table)[1]"),
+                "rows": etree.XPath(".//tr"),
+                "cells": etree.XPath(".//td"),
+                # get_text() у bs4 не включає вміст <script>, <style> і <template>
+                "texts": etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]"),
+                "main_image": etree.XPath(f"(//a[{has_class('main_image_container')}])[1]"),
+                "thumbs": etree.XPath(f"//a[{has_class('thumb_image_container')}]"),
+            }
+    return _lxml_state["tools"]
+
+def resolve_parser(name: str) -> str:
+    """Повертає доступний рушій: 'lxml' або 'bs4' (якщо lxml не встановлено — з попередженням)."""
+    if name == "lxml" and _lxml_tools() is None:
+        if not _lxml_state.get("warned"):
+            logging.warning("⚠️ lxml не встановлено (pip install lxml) — розбір HTML через BeautifulSoup.")
+            _lxml_state["warned"] = True
+        return "bs4"
+    return "lxml" if name == "lxml" else "bs4"
+
+def _lxml_root(html: str):
+    tools = _lxml_tools()
+    if not html or not html.strip():
+        return None
+    return tools["fromstring"](html.encode("utf-8"), tools["parser"])
+
+def _lxml_text(tools: Dict[str, Any], element) -> str:
+    """Аналог get_text(strip=True) з BeautifulSoup (без тексту скриптів і стилів)."""
+    return "".join(part.strip() for part in tools["texts"](element) if part.strip())
+
+def _search_results_bs4(html: str) -> Dict[str, List[Tuple[str, str]]]:
+    # Будуємо дерево лише з блоків card-block — решта сторінки пошуку не потрібна
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('div', class_=_CARD_BLOCK_CLASS))
+
+    def _card_link(tag) -> Optional[str]:
+        parent_div = tag.find_parent('div', class_='card-block')
+        title = parent_div.find('h4', class_='card-title') if parent_div else None
+        link_tag = title.find('a') if title else None
+        return link_tag['href'] if link_tag and link_tag.has_attr('href') else None
+
+    results = {"variant": [], "simple": []}
+    for input_tag in soup.find_all('input', class_='variant_control', attrs={'data-code': True}):
+        href = _card_link(input_tag)
+        if href is not None:
+            results["variant"].append((input_tag.get('data-code', '').strip(), href))
+    for div_tag in soup.find_all('div', class_='radio'):
+        href = _card_link(div_tag)
+        if href is not None:
+            results["simple"].append((div_tag.get_text(strip=True).strip(), href))
+    return results
+
+def _search_results_lxml(html: str) -> Dict[str, List[Tuple[str, str]]]:
+    tools = _lxml_tools()
+    root = _lxml_root(html)
+    results = {"variant": [], "simple": []}
+    if root is None:
+        return results
+
+    def _card_link(element) -> Optional[str]:
+        for parent_div in tools["card_block"](element):
+            for link in tools["card_link"](parent_div):
+                return link.get("href")
+        return None
+
+    for element in tools["variant_inputs"](root):
+        href = _card_link(element)
+        if href is not None:
+            results["variant"].append(((element.get("data-code") or "").strip(), href))
+    for element in tools["radio_divs"](root):
+        href = _card_link(element)
+        if href is not None:
+            results["simple"].append((_lxml_text(tools, element), href))
+    return results
+
+def _product_page_bs4(html: str) -> Dict[str, Any]:
+    soup = BeautifulSoup(html, 'html.parser')
+
+    attributes = {}
+    characteristics_div = soup.find('div', id='w0-tab0')
+    if characteristics_div and characteristics_div.find('table'):
+        for tr in characteristics_div.find('table').find_all('tr'):
+            cells = tr.find_all('td')
+            if len(cells) == 2:
+                key = cells[0].get_text(strip=True).replace(':', '')
+                attributes[key] = cells[1].get_text(strip=True)
+
+    main_tag = soup.find('a', class_='main_image_container')
+    thumbs = []
+    for a in soup.find_all('a', class_='thumb_image_container'):
+        link = a.get('href')
+        if link and link not in thumbs:
+            thumbs.append(link)
+
+    return {
+        "attributes": attributes,
+        "main_image": main_tag.get('href') if main_tag and main_tag.get('href') else None,
+        "thumbs": thumbs,
+    }
+
+def _product_page_lxml(html: str) -> Dict[str, Any]:
+    tools = _lxml_tools()
+    root = _lxml_root(html)
+    page = {"attributes": {}, "main_image": None, "thumbs": []}
+    if root is None:
+        return page
+
+    for characteristics_div in tools["char_table"](root):
+        for table in tools["first_table"](characteristics_div):
+            for tr in tools["rows"](table):
+                cells = tools["cells"](tr)
+                if len(cells) == 2:
+                    key = _lxml_text(tools, cells[0]).replace(':', '')
+                    page["attributes"][key] = _lxml_text(tools, cells[1])
+
+    for main_tag in tools["main_image"](root):
+        page["main_image"] = main_tag.get("href") or None
+    for a in tools["thumbs"](root):
+        link = a.get("href")
+        if link and link not in page["thumbs"]:
+            page["thumbs"].append(link)
+    return page
+
+_HTML_PARSERS = {
+    "bs4": {"search": _search_results_bs4, "product": _product_page_bs4},
+    "lxml": {"search": _search_results_lxml, "product": _product_page_lxml},
+}
+
+def extract_search_results(html: str, parser: str = "bs4") -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Сторінка пошуку постачальника → {'variant': [(data-code, href)], 'simple': [(текст div.radio, href)]}
+    у порядку документа. href — посилання з h4.card-title найближчого батьківського div.card-block;
+    елементи без такого посилання пропускаються.
+    """
+    return _HTML_PARSERS[resolve_parser(parser)]["search"](html)
+
+def find_product_link(html: str, file_sku: str, site_url: str, parser: str = "bs4") -> Tuple[Optional[str], Optional[str]]:
+    """
+    Шукає на сторінці пошуку посилання на товар з артикулом file_sku: спершу серед варіативних
+    (input.variant_control[data-code]), потім серед простих (div.radio).
+    Повертає (found_url, found_type), де found_type — 'variant', 'simple' або None.
+    """
+    results = extract_search_results(html, parser)
+    for found_type in ("variant", "simple"):
+        for site_sku, href in results[found_type]:
+            if site_sku == file_sku:
+                # Формуємо повний URL (додаємо site_url до відносного шляху)
+                return site_url + href, found_type
+    return None, None
+
+def benchmark_parsers(pages_dir: Optional[str] = None, repeat: int = 3) -> bool:
+    """
+    Порівнює рушії розбору на збережених сторінках постачальника (*.body з кешу сторінок, *.html):
+    перевіряє, що bs4 і lxml дають однаковий результат, і виводить час кожного рушія.
+    pages_dir — тека зі сторінками (за замовчуванням кеш сторінок paths.http_cache).
+    Повертає True, якщо результати збігаються на всіх сторінках.
+    """
+    if not pages_dir:
+        pages_dir = get_state_path(load_settings() or {}, "http_cache", "csv/process/http_cache")
+    files = sorted(glob.glob(os.path.join(pages_dir, "**", "*.body"), recursive=True)
+                   + glob.glob(os.path.join(pages_dir, "**", "*.html"), recursive=True))
+    if not files:
+        print(f"❌ У {pages_dir} немає збережених сторінок (*.body / *.html).")
+        return False
+    if resolve_parser("lxml") != "lxml":
+        print("❌ lxml не встановлено — порівнювати немає з чим. Встанови: pip install lxml")
+        return False
+
+    pages = []
+    for path in files:
+        with open(path, "rb") as f:
+            pages.append((path, f.read().decode("utf-8", errors="replace")))
+
+    timings = {name: 0.0 for name in _HTML_PARSERS}
+    outputs = {name: [] for name in _HTML_PARSERS}
+    for name, funcs in _HTML_PARSERS.items():
+        for attempt in range(repeat):
+            started = time.perf_counter()
+            results = [(funcs["search"](html), funcs["product"](html)) for _, html in pages]
+            timings[name] += time.perf_counter() - started
+            if attempt == 0:
+                outputs[name] = results
+
+    mismatches = [path for (path, _), a, b in zip(pages, outputs["bs4"], outputs["lxml"]) if a != b]
+    print(f"📊 Сторінок: {len(pages)}, повторів: {repeat}")
+    for name, seconds in timings.items():
+        print(f"   {name}: {seconds / repeat:.3f} сек. за прохід ({seconds / repeat / len(pages) * 1000:.2f} мс/сторінку)")
+    if timings["lxml"]:
+        print(f"   Прискорення lxml: ×{timings['bs4'] / timings['lxml']:.1f}")
+    if mismatches:
+        print(f"❌ Результати відрізняються на {len(mismatches)} сторінках:")
+        for path in mismatches[:20]:
+            print(f"   {path}")
+        return False
+    print("✅ Результати розбору однакові для обох рушіїв.")
+    return True
+
+# --- ЗБІР СТОРІНОК ТОВАРІВ (ОДИН РАЗ ДЛЯ АТРИБУТІВ І ЗОБРАЖЕНЬ) ---
+def parse_product_page(html: str, parser: str = "bs4") -> Dict[str, Any]:
+    """
+    Розбирає сторінку товару постачальника:
+    attributes — таблиця характеристик з div#w0-tab0 ({назва: значення}),
+    main_image — посилання a.main_image_container, thumbs — посилання a.thumb_image_container (без повторів).
+    """
+    return _HTML_PARSERS[resolve_parser(parser)]["product"](html)
+
+class ProductPageStore:
+    """
+    Сховище розібраних сторінок товарів у JSONL: один запис на рядок, ключ — URL
+    (при повторах перемагає останній). Записи дописуються одразу, тож перерваний збір нічого не втрачає.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # обірваний останній рядок після аварійної зупинки
+                    self.records[record["url"]] = record
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        return self.records.get(url)
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[record["url"]] = record
+
+def get_product_page_store(settings: Dict[str, Any]) -> ProductPageStore:
+    """Сховище сторінок товарів: paths.product_pages (за замовчуванням csv/process/product_pages.jsonl)."""
+    return ProductPageStore(get_state_path(settings, "product_pages", "csv/process/product_pages.jsonl"))
+
+def _product_page_record(url: str, sku: str, html: str, parser: str) -> Dict[str, Any]:
+    return {"url": url, "sku": sku, **parse_product_page(html, parser), "harvested_at": datetime.now().isoformat(timespec="seconds")}
+
+def get_product_page(url: str, pages: ProductPageStore, scraper: SupplierScraper, sku: str = "") -> Dict[str, Any]:
+    """Запис зі сховища; якщо сторінку ще не зібрано — завантажує, розбирає та зберігає її."""
+    record = pages.get(url)
+    if record is None:
+        record = _product_page_record(url, sku, scraper.get(url).text, scraper.parser)
+        pages.add(record)
+    return record
+
+def harvest_product_pages(items: List[Tuple[str, str]], settings: Dict[str, Any],
+                          force: bool = False, cache_only: bool = False) -> Dict[str, int]:
+    """
+    Паралельно завантажує та розбирає сторінки товарів (items — пари (url, sku)) і пише їх у сховище.
+    Уже зібрані URL пропускаються, якщо не force. Повертає статистику {harvested, skipped, failed}.
+    """
+    pages = get_product_page_store(settings)
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    stats = {"harvested": 0, "skipped": 0, "failed": 0}
+
+    todo, seen = [], set()
+    for url, sku in items:
+        if url in seen:
+            continue
+        seen.add(url)
+        if not force and pages.get(url) is not None:
+            stats["skipped"] += 1
+        else:
+            todo.append((url, sku))
+
+    def _harvest(item):
+        url, sku = item
+        try:
+            return _product_page_record(url, sku, scraper.get(url).text, scraper.parser), None
+        except Exception as e:
+            return {"url": url, "sku": sku}, e
+
+    try:
+        for record, error in scraper.map_ordered(_harvest, todo):
+            if error is not None:
+                stats["failed"] += 1
+                logging.warning(f"⚠️ Сторінку товару {record['sku']} не зібрано ({record['url']}): {error}")
+                continue
+            pages.add(record)
+            stats["harvested"] += 1
+    finally:
+        scraper.close()
+
+    logging.info(f"📄 Збір сторінок товарів: зібрано {stats['harvested']}, вже були {stats['skipped']}, помилок {stats['failed']}.")
+    return stats
+
+# --- СХОВИЩЕ ЗОБРАЖЕНЬ ЗА ХЕШЕМ ВМІСТУ ---
+class ImageBlobStore:
+    """
+    Зображення постачальника на диску за SHA-256 вмісту: <path>/<ab>/<sha256><ext>.
+    url_index.json пам'ятає URL → {sha256, ext, size}: повторні запуски та спільні для варіантів
+    зображення не завантажуються вдруге, а однаковий вміст з різних URL зберігається один раз.
+    """
+    SAVE_EVERY = 50  # як часто (нових URL) скидати індекс на диск
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index_path = os.path.join(path, "url_index.json")
+        self.index: Dict[str, Dict[str, Any]] = load_json_state(self.index_path)
+        self.stats = {"downloaded": 0, "reused": 0}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+    def blob_path(self, entry: Dict[str, Any]) -> str:
+        return os.path.join(self.path, entry["sha256"][:2], entry["sha256"] + entry["ext"])
+
+    def _lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self.index.get(url)
+        if entry:
+            blob = self.blob_path(entry)
+            if os.path.exists(blob) and os.path.getsize(blob) == entry["size"]:
+                return entry
+        return None
+
+    def fetch(self, url: str, scraper: "SupplierScraper") -> Dict[str, Any]:
+        """
+        Запис {sha256, ext, size} для URL: з індексу без запиту або потоковим завантаженням
+        (частинами по 64 КБ з хешуванням на льоту, без утримання файлу в пам'яті).
+        Один URL завантажується один раз, навіть якщо його одночасно просять кілька потоків.
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            entry = self._lookup(url)
+            if entry:
+                with self._lock:
+                    self.stats["reused"] += 1
+                return entry
+
+            digest = hashlib.sha256()
+            size = 0
+            temp_path = os.path.join(self.path, f".{threading.get_ident()}.part")
+            try:
+                with scraper.open_image(url) as response:
+                    content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip()
+                    ext = mimetypes.guess_extension(content_type) or '.jpg'
+                    with open(temp_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            if chunk:
+                                f.write(chunk)
+                                digest.update(chunk)
+                                size += len(chunk)
+                entry = {"sha256": digest.hexdigest(), "ext": ext, "size": size}
+                blob = self.blob_path(entry)
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(temp_path, blob)  # той самий вміст — той самий файл, дублікат просто перезаписується
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            with self._lock:
+                self.index[url] = entry
+                self.stats["downloaded"] += 1
+                self._unsaved += 1
+                if self._unsaved >= self.SAVE_EVERY:
+                    self._save_locked()
+            return entry
+
+    def materialize(self, entry: Dict[str, Any], dest_path: str) -> bool:
+        """Копіює зображення у dest_path. False — файл з таким самим розміром уже на місці."""
+        if os.path.exists(dest_path) and os.path.getsize(dest_path) == entry["size"]:
+            return False
+        shutil.copyfile(self.blob_path(entry), dest_path)
+        return True
+
+    def _save_locked(self):
+        save_json_state(self.index_path, self.index)
+        self._unsaved = 0
+
+    def save(self):
+        with self._lock:
+            if self._unsaved:
+                self._save_locked()
+        logging.info(f"🖼️ Сховище зображень: завантажено {self.stats['downloaded']}, "
+                     f"повторно використано {self.stats['reused']}.")
+
+def get_image_blob_store(settings: Dict[str, Any]) -> ImageBlobStore:
+    """Сховище зображень: paths.image_blobs (за замовчуванням csv/process/image_blobs)."""
+    return ImageBlobStore(get_state_path(settings, "image_blobs", "csv/process/image_blobs"))
+
 # --- ОБРОБКА ЗОБРАЖЕНЬ ---   
 def clear_directory(folder_path: str):
     """Очищає або створює директорію."""
@@ -522,17 +1476,81 @@ def move_gifs(src: str, dest: str) -> int:
     logging.info(f"🟣 Переміщено {moved} GIF-файлів.")
     return moved
 
-def convert_to_webp_square(src: str, dest: str) -> int:
+def _webp_encode(img_path: str, out_path: str, quality: int, max_side: int, cache_dir: Optional[str]) -> Tuple[str, str, float, str]:
     """
-    Конвертує JPG/PNG → WEBP, вирівнює зображення до квадрату
-    та коректно обробляє прозорість (RGBA / палітрові P-зображення).
+    Конвертує одне зображення (виконується у процесі пулу).
+    Повертає (out_path, статус 'converted' | 'cached' | 'error', секунди, текст помилки).
     """
-    import os
-    import logging
     from PIL import Image
 
-    converted = 0
+    start = time.perf_counter()
+    cache_blob = None
+    try:
+        # 🔹 Той самий вміст уже кодувався з тими самими параметрами — беремо готовий WEBP
+        if cache_dir:
+            digest = hashlib.sha256()
+            with open(img_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    digest.update(chunk)
+            sha = digest.hexdigest()
+            cache_blob = os.path.join(cache_dir, sha[:2], f"{sha}-q{quality}-m{max_side}.webp")
+            if os.path.exists(cache_blob):
+                shutil.copyfile(cache_blob, out_path)
+                return out_path, "cached", time.perf_counter() - start, ""
+
+        img = Image.open(img_path)
+
+        # 🔹 Конвертація кольорового режиму (для уникнення warning)
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+
+        # 🔹 Зменшення до max_side (до вирівнювання — менше пікселів для кодування)
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        w, h = img.size
+        side = max(w, h)
+
+        # 🔹 Якщо зображення має альфа-канал — створюємо прозоре полотно
+        if img.mode == "RGBA":
+            canvas = Image.new("RGBA", (side, side), (255, 255, 255, 0))
+        else:
+            canvas = Image.new("RGB", (side, side), (255, 255, 255))
+
+        # Центрування
+        canvas.paste(img, ((side - w) // 2, (side - h) // 2))
+
+        # 🔹 Збереження у форматі WEBP
+        canvas.save(out_path, 'webp', quality=quality)
+
+        if cache_blob:
+            os.makedirs(os.path.dirname(cache_blob), exist_ok=True)
+            temp_path = f"{cache_blob}.{os.getpid()}.part"
+            shutil.copyfile(out_path, temp_path)
+            os.replace(temp_path, cache_blob)
+        return out_path, "converted", time.perf_counter() - start, ""
+    except Exception as e:
+        return out_path, "error", time.perf_counter() - start, str(e)
+
+def convert_to_webp_square(src: str, dest: str, conf: Optional[Dict[str, Any]] = None,
+                           cache_path: Optional[str] = None) -> int:
+    """
+    Конвертує JPG/PNG → WEBP, вирівнює зображення до квадрату
+    та коректно обробляє прозорість (RGBA / палітрові P-зображення).
+    Налаштування — settings["webp"]: workers (кількість ядер; 1 — без пулу процесів),
+    quality (90), max_side (0 — без зменшення; інакше довша сторона обмежується до max_side).
+    Пропускаються файли, чий WEBP у dest новіший за джерело; cache_path — кеш готових WEBP
+    за SHA-256 джерела та параметрами, тож повторно завантажене те саме фото не кодується знову.
+    """
+    conf = conf or {}
+    workers = max(1, int(conf.get("workers") or os.cpu_count() or 1))
+    quality = int(conf.get("quality", 90))
+    max_side = int(conf.get("max_side", 0) or 0)
 
+    tasks = []
+    skipped = 0
     for root, _, files in os.walk(src):
         rel = os.path.relpath(root, src)
         out_dir = os.path.join(dest, rel)
@@ -541,72 +1559,83 @@ def convert_to_webp_square(src: str, dest: str) -> int:
         for f in files:
             if not f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
                 continue
+            img_path = os.path.join(root, f)
+            out_path = os.path.join(out_dir, os.path.splitext(f)[0] + '.webp')
+            # 🔹 Інкрементально: WEBP уже новіший за джерело
+            if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(img_path):
+                skipped += 1
+                continue
+            tasks.append((img_path, out_path, quality, max_side, cache_path))
 
-            try:
-                img_path = os.path.join(root, f)
-                img = Image.open(img_path)
-
-                # 🔹 Конвертація кольорового режиму (для уникнення warning)
-                if img.mode == "P":
-                    img = img.convert("RGBA")
-                elif img.mode not in ("RGB", "RGBA"):
-                    img = img.convert("RGB")
-
-                w, h = img.size
-                max_side = max(w, h)
-
-                # 🔹 Якщо зображення має альфа-канал — створюємо прозоре полотно
-                if img.mode == "RGBA":
-                    canvas = Image.new("RGBA", (max_side, max_side), (255, 255, 255, 0))
-                else:
-                    canvas = Image.new("RGB", (max_side, max_side), (255, 255, 255))
-
-                # Центрування
-                canvas.paste(img, ((max_side - w) // 2, (max_side - h) // 2))
-
-                # 🔹 Збереження у форматі WEBP
-                new_name = os.path.splitext(f)[0] + '.webp'
-                out_path = os.path.join(out_dir, new_name)
-                canvas.save(out_path, 'webp', quality=90)
-
-                converted += 1
-
-            except Exception as e:
-                logging.error(f"❌ WEBP-конвертація '{f}' не вдалася: {e}")
+    workers = min(workers, max(1, len(tasks)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_webp_encode, *zip(*tasks), chunksize=4))
+    else:
+        results = [_webp_encode(*task) for task in tasks]
 
-    logging.info(f"🟢 WEBP-конвертовано {converted} зображень.")
-    return converted
+    converted = cached = 0
+    timings = []
+    for out_path, status, seconds, error in results:
+        if status == "error":
+            logging.error(f"❌ WEBP-конвертація '{os.path.basename(out_path)}' не вдалася: {error}")
+            continue
+        if status == "cached":
+            cached += 1
+        else:
+            converted += 1
+            timings.append((seconds, out_path))
+
+    logging.info(f"🟢 WEBP-конвертовано {converted} зображень, з кешу {cached}, актуальних пропущено {skipped} "
+                 f"(процесів: {workers}).")
+    if timings:
+        timings.sort()
+        total = sum(t for t, _ in timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))][0]
+        slowest, slowest_path = timings[-1]
+        logging.info(f"⏱️ WEBP: сумарно {total:.1f} сек., в середньому {total / len(timings) * 1000:.0f} мс, "
+                     f"p95 {p95 * 1000:.0f} мс, найдовше {slowest * 1000:.0f} мс ({os.path.basename(slowest_path)}).")
+    return converted + cached
 
 # --- ЗАВАНТАЖЕННЯ ЗОБРАЖЕНЬ ТОВАРУ ---
-def download_product_images(url: str, sku: str, category: str, base_path: str, cat_map: Dict[str, str]) -> List[str]:
-    """Завантажує всі зображення товару з URL."""
+def download_product_images(url: str, sku: str, category: str, base_path: str, cat_map: Dict[str, str],
+                            scraper: SupplierScraper, blobs: ImageBlobStore,
+                            pages: Optional[ProductPageStore] = None) -> List[str]:
+    """
+    Завантажує всі зображення товару з URL.
+    Посилання беруться із зібраної сторінки товару (pages), інакше сторінка завантажується
+    через scraper (кеш сторінок, ліміт хоста). Файли беруться зі сховища blobs (завантаження
+    лише нових URL), однакові за вмістом зображення товару зберігаються один раз.
+    """
     cat_slug = cat_map.get(category.strip()) or category.strip().lower().replace(' ', '_').replace(',', '')
     dest = os.path.join(base_path, cat_slug)
     os.makedirs(dest, exist_ok=True)
 
     try:
-        page = requests.get(url, timeout=10)
-        page.raise_for_status()
+        if pages is not None:
+            record = get_product_page(url, pages, scraper, sku)
+        else:
+            record = parse_product_page(scraper.get(url).text, scraper.parser)
     except Exception as e:
         logging.warning(f"⚠️ Не вдалося завантажити сторінку {url}: {e}")
         return []
 
-    soup = BeautifulSoup(page.content, 'html.parser')
-    links = {a.get('href') for a in soup.find_all('a', class_='thumb_image_container') if a.get('href')}
+    links = record["thumbs"]
     files = []
+    seen_hashes = set()
 
-    for i, img_url in enumerate(links, 1):
+    for img_url in links:
         try:
-            r = requests.get(img_url, timeout=10)
-            r.raise_for_status()
-            mime = r.headers.get('Content-Type')
-            ext = mimetypes.guess_extension(mime) or '.jpg'
-            fname = f"{sku}-{i}{ext}"
-            with open(os.path.join(dest, fname), 'wb') as f:
-                f.write(r.content)
-            files.append(fname)
-        except Exception:
+            entry = blobs.fetch(img_url, scraper)
+            if entry["sha256"] in seen_hashes:
+                continue  # той самий вміст під іншим посиланням
+            fname = f"{sku}-{len(files) + 1}{entry['ext']}"
+            blobs.materialize(entry, os.path.join(dest, fname))
+        except Exception as e:
+            logging.debug(f"Не вдалося завантажити {img_url}: {e}")
             continue
+        seen_hashes.add(entry["sha256"])
+        files.append(fname)
 
     # 🟢 Логування результату
     logging.info(f"📸 Завантажено {len(files)} зображень для SKU {sku}: {', '.join(files)}")
@@ -668,97 +1697,449 @@ def copy_to_site(src: str, dest: str):
     logging.info(f"📦 Скопійовано {copied} файлів у {dest}.")
     return copied
 
+# --- ЖУРНАЛ ПАКЕТНИХ ЗАВДАНЬ ТА ПОВТОРИ З БЕКОФОМ ---
+class BatchJournal:
+    """
+    Журнал пакетного завдання у форматі JSON Lines: кожен рядок — результат
+    відправки групи товарів ({"status": "done"/"failed", "keys": [...], "error": ..., "data": ...}).
+    Дозволяє після збою продовжити завдання (resume=True), пропустивши вже
+    успішно відправлені товари. Без resume попередній журнал відкидається.
+    data — необов'язковий результат обробки ключа (наприклад, знайдений URL) або, для failed,
+    дані для повтору; доступний у self.data.
+    """
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done: set = set()
+        self.failed: Dict[str, str] = {}
+        self.data: Dict[str, Any] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # недописаний останній рядок після аварійного завершення
+                    for key in record.get("keys", []):
+                        if record.get("status") == "done":
+                            self.done.add(key)
+                            self.failed.pop(key, None)
+                        else:
+                            self.failed[key] = record.get("error", "")
+                        if "data" in record:
+                            self.data[key] = record["data"]
+            logging.info(f"♻️ Продовжую завдання з журналу {os.path.basename(path)}: "
+                         f"вже оброблено {len(self.done)}, з помилками {len(self.failed)}.")
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def is_done(self, key: Any) -> bool:
+        return str(key) in self.done
+
+    def record(self, keys: List[Any], status: str, error: Optional[str] = None, data: Any = None):
+        """Дописує результат у журнал одразу на диск, щоб пережити аварійне завершення."""
+        keys = [str(k) for k in keys]
+        if not keys:
+            return
+        entry = {"status": status, "keys": keys, "at": datetime.now().isoformat(timespec="seconds")}
+        if error:
+            entry["error"] = error
+        if data is not None:
+            entry["data"] = data
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for key in keys:
+            if status == "done":
+                self.done.add(key)
+                self.failed.pop(key, None)
+            else:
+                self.failed[key] = error or ""
+            if data is not None:
+                self.data[key] = data
+
+    def finish(self):
+        """Видаляє журнал, якщо всі товари відправлено без помилок."""
+        if not self.failed and os.path.exists(self.path):
+            os.remove(self.path)
+            logging.info(f"🧹 Завдання завершено без помилок, журнал {os.path.basename(self.path)} видалено.")
+        elif self.failed:
+            logging.warning(f"⚠️ У журналі {os.path.basename(self.path)} залишилось {len(self.failed)} товарів з помилками. "
+                            f"Повторіть запуск з --resume, щоб обробити лише їх.")
+
+def open_batch_journal(settings: Dict[str, Any], job_name: str, resume: bool = False) -> BatchJournal:
+    """Відкриває журнал завдання job_name у теці paths.jobs_dir (за замовчуванням csv/process/jobs)."""
+    jobs_dir = get_state_path(settings, "jobs_dir", "csv/process/jobs")
+    return BatchJournal(os.path.join(jobs_dir, f"{job_name}.jsonl"), resume=resume)
+
+def post_batch_with_retry(post, items: List[Dict[str, Any]], retry_conf: Optional[Dict[str, Any]] = None,
+                          label: str = "", before_retry=None) -> List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Відправляє пакет через post(items) -> requests.Response з повторами та поділом пакета.
+
+    - Таймаути, помилки з'єднання, 429 та 5xx повторюються з експоненційною
+      затримкою та випадковим розкидом (full jitter): retry_conf max_retries / backoff_base / backoff_max.
+    - Якщо пакет так і не пройшов (або сервер відхилив його з 4xx), він ділиться навпіл,
+      щоб ізолювати товар, який спричиняє помилку.
+    - before_retry(items) -> items — для неідемпотентних запитів (create): після таймауту чи 5xx
+      частина пакета могла вже записатися на сервері; функція повертає лише ті товари,
+      які ще треба надіслати (перед кожним повтором і перед поділом пакета).
+
+    Повертає список (товари, відповідь API або None, текст помилки або None) для кожної
+    частини, на яку довелося поділити пакет.
+    """
+    retry_conf = retry_conf or {}
+    max_retries = int(retry_conf.get("max_retries", 4))
+    backoff_base = float(retry_conf.get("backoff_base", 2))
+    backoff_max = float(retry_conf.get("backoff_max", 60))
+
+    attempt = 0
+    while True:
+        splittable = True
+        try:
+            response = post(items)
+            if response.status_code == 200:
+                try:
+                    return [(items, response.json(), None)]
+                except ValueError:
+                    error = "HTTP 200, але відповідь не є коректним JSON"
+                    retryable = True
+            else:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                retryable = response.status_code == 429 or response.status_code >= 500
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = f"{type(e).__name__}: {e}"
+            retryable = True
+        except requests.exceptions.RequestException as e:
+            error = f"{type(e).__name__}: {e}"
+            retryable = False
+            splittable = False
+
+        if retryable and attempt < max_retries:
+            delay = random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+            attempt += 1
+            logging.warning(f"🔁 Пакет {label} ({len(items)} товарів): {error}. Повтор {attempt}/{max_retries} через {delay:.1f} сек.")
+            time.sleep(delay)
+            if before_retry:
+                items = before_retry(items)
+                if not items:
+                    return []
+            continue
+        break
+
+    if retryable and before_retry:
+        items = before_retry(items)
+        if not items:
+            return []
+
+    if splittable and len(items) > 1:
+        middle = len(items) // 2
+        logging.warning(f"✂️ Пакет {label} ({len(items)} товарів) не пройшов: {error}. Ділю навпіл.")
+        # Половинки отримують скорочену кількість повторів: сервер уже довго відповідав помилкою
+        half_conf = dict(retry_conf, max_retries=min(max_retries, 1))
+        return (post_batch_with_retry(post, items[:middle], half_conf, label=f"{label}/1", before_retry=before_retry) +
+                post_batch_with_retry(post, items[middle:], half_conf, label=f"{label}/2", before_retry=before_retry))
+
+    return [(items, None, error)]
+
 # --- ДОПОМІЖНА ФУНКЦІЯ ДЛЯ ПАКЕТНОГО ЗАПИСУ (Оновлення) ---
-def _process_batch_update(wcapi: Any, batch_data: List[Dict[str, Any]], errors_list: List[str]) -> int:
-    """Виконує пакетний запит 'update' до WooCommerce API."""
-    
-    payload = {"update": batch_data}
+def _process_batch_update(wcapi: Any, batch_data: List[Dict[str, Any]], errors_list: List[str],
+                          journal: Optional[BatchJournal] = None, retry_conf: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Виконує пакетний запит 'update' до WooCommerce API.
+    Збої 5xx/таймаути повторюються з бекофом, пакет, що не проходить, ділиться навпіл;
+    результат кожного товару (за id) записується в journal, якщо його передано.
+    """
     
+    logging.info(f"Надсилаю пакет на оновлення ({len(batch_data)} товарів)...")
+    updated_count = 0
+
     try:
-        logging.info(f"Надсилаю пакет на оновлення ({len(batch_data)} товарів)...")
-        
-        response = wcapi.post("products/batch", data=payload) 
-        
-        if response.status_code == 200:
-            result = response.json()
-            updated_count = len(result.get('update', []))
-            
-            # Детальне логування помилок, які повернув API
-            api_errors = result.get('errors', [])
-            if api_errors:
-                for err in api_errors:
-                    err_msg = f"API-Помилка (ID: {err.get('id', 'N/A')}): {err.get('message', 'Невідома помилка')}"
-                    errors_list.append(err_msg)
-                    logging.error(err_msg)
-                
-            logging.info(f"✅ Пакет оновлено. Успішно оброблено API: {updated_count} товарів. Помилок у пакеті: {len(api_errors)}")
-            return updated_count
-        else:
-            err_msg = f"❌ Критична помилка API ({response.status_code}) при пакетному оновленні. Помилка: {response.text[:200]}..."
-            errors_list.append(err_msg)
-            logging.critical(err_msg)
-            return 0
-            
+        outcomes = post_batch_with_retry(lambda items: wcapi.post("products/batch", data={"update": items}),
+                                         batch_data, retry_conf, label=f"ID {batch_data[0].get('id')}…")
     except Exception as e:
         err_msg = f"❌ Непередбачена помилка під час відправки пакету: {e}"
         errors_list.append(err_msg)
         logging.critical(err_msg, exc_info=True)
         return 0
 
-# --- Глобальна HTTPS-сесія та кеш ---
-_session = requests.Session()
-_media_cache: Dict[str, int] = {}  # slug -> id
+    for items, result, error in outcomes:
+        if result is None:
+            err_msg = f"❌ Критична помилка API при пакетному оновленні ({len(items)} товарів). Помилка: {error}"
+            errors_list.append(err_msg)
+            logging.critical(err_msg)
+            if journal:
+                journal.record([item.get('id') for item in items], "failed", error)
+            continue
+
+        updated = result.get('update', [])
+        
+        # Детальне логування помилок, які повернув API
+        api_errors = result.get('errors', []) + [
+            {"id": item.get('id'), "message": item['error'].get('message')} for item in updated if item.get('error')
+        ]
+        for err in api_errors:
+            err_msg = f"API-Помилка (ID: {err.get('id', 'N/A')}): {err.get('message', 'Невідома помилка')}"
+            errors_list.append(err_msg)
+            logging.error(err_msg)
+
+        if journal:
+            failed_ids = {str(err.get('id')) for err in api_errors}
+            journal.record([item.get('id') for item in items if str(item.get('id')) not in failed_ids], "done")
+            journal.record([item.get('id') for item in items if str(item.get('id')) in failed_ids], "failed", "API-помилка товару")
+
+        updated_count += len(updated)
+        logging.info(f"✅ Пакет оновлено. Успішно оброблено API: {len(updated)} товарів. Помилок у пакеті: {len(api_errors)}")
 
-def _get_media_id_by_filename_sql(db_conf, filename):
+    return updated_count
+
+# --- ПОСТІЙНИЙ КЕШ MEDIA ID (SQLite) ---
+class MediaIdStore:
     """
-    Миттєвий пошук ID медіафайлу напряму у базі WordPress.
-    Працює у 50-100 разів швидше за REST.
+    Кеш на диску: slug файлу (нижній регістр) → ID вкладення WordPress з часом останньої перевірки.
+    Переживає перезапуски, тож повторні SEO- та create-запуски майже не шукають медіа.
+    Записи для видалених вкладень прибирає sweep().
     """
-    try:
-        clean_name = re.sub(r'-\d+x\d+(?=\.)', '', filename)
-        file_slug = os.path.splitext(clean_name)[0]
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS media (slug TEXT PRIMARY KEY, media_id INTEGER NOT NULL, verified_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, slugs: List[str]) -> Dict[str, int]:
+        """Повертає {slug у нижньому регістрі: media_id} для знайдених у кеші."""
+        keys = sorted({slug.lower() for slug in slugs})
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ", ".join(["?"] * len(chunk))
+                for slug, media_id in self._conn.execute(f"SELECT slug, media_id FROM media WHERE slug IN ({placeholders})", chunk):
+                    found[slug] = media_id
+        return found
+
+    def get(self, slug: str) -> Optional[int]:
+        return self.get_many([slug]).get(slug.lower())
+
+    def put_many(self, items: Dict[str, int]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO media (slug, media_id, verified_at) VALUES (?, ?, ?)",
+                [(slug.lower(), int(media_id), now) for slug, media_id in items.items() if media_id]
+            )
+            self._conn.commit()
 
-        conn = pymysql.connect(
-            host=db_conf["host"],
-            user=db_conf["user"],
-            password=db_conf["password"],
-            database=db_conf["database"],
-            charset="utf8mb4",
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        with conn.cursor() as cursor:
-            sql = """
-            SELECT ID 
-            FROM wp_posts 
-            WHERE post_name=%s AND post_type='attachment' 
-            LIMIT 1;
-            """
-            cursor.execute(sql, (file_slug,))
-            result = cursor.fetchone()
+    def put(self, slug: str, media_id: int):
+        self.put_many({slug: media_id})
+
+    def sweep(self, fetch_existing_ids, max_age_hours: float = 24):
+        """
+        Перевіряє записи, старші за max_age_hours: fetch_existing_ids(ids) -> множина ID,
+        які ще існують. Записи для видалених вкладень видаляються, решта — позначаються перевіреними.
+        """
+        threshold = time.time() - max_age_hours * 3600
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute("SELECT DISTINCT media_id FROM media WHERE verified_at < ?", (threshold,))]
+        if not stale:
+            return
+
+        removed = 0
+        for i in range(0, len(stale), 500):
+            chunk = stale[i:i + 500]
+            existing = {int(media_id) for media_id in fetch_existing_ids(chunk)}
+            gone = [media_id for media_id in chunk if media_id not in existing]
+            placeholders = ", ".join(["?"] * len(chunk))
+            with self._lock:
+                if gone:
+                    self._conn.execute(f"DELETE FROM media WHERE media_id IN ({', '.join(['?'] * len(gone))})", gone)
+                self._conn.execute(f"UPDATE media SET verified_at = ? WHERE media_id IN ({placeholders})", [time.time(), *chunk])
+                self._conn.commit()
+            removed += len(gone)
+        logging.info(f"🧹 Кеш media ID: перевірено {len(stale)} записів, видалено {removed} неіснуючих вкладень.")
+
+_media_stores: Dict[str, MediaIdStore] = {}
+
+def get_media_store(settings: Dict[str, Any], wcapi: Any = None) -> MediaIdStore:
+    """
+    Відкриває спільний кеш media ID (paths.media_cache, за замовчуванням csv/process/media_cache.sqlite)
+    і під час першого відкриття за запуск перевіряє застарілі записи
+    (media_cache.validate_after_hours, за замовчуванням 24): через SQL, якщо є блок 'db', інакше через wp/v2/media.
+    """
+    path = get_state_path(settings, "media_cache", "csv/process/media_cache.sqlite")
+    if path in _media_stores:
+        return _media_stores[path]
+
+    store = MediaIdStore(path)
+    _media_stores[path] = store
+    max_age_hours = float(settings.get("media_cache", {}).get("validate_after_hours", 24))
+    db_conf = settings.get("db")
+
+    def _existing_ids_sql(ids):
+        conn = connect_wp_db(db_conf)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT ID FROM wp_posts WHERE post_type = 'attachment' AND ID IN ({', '.join(['%s'] * len(ids))})", ids
+                )
+                return {record["ID"] for record in cursor.fetchall()}
+        finally:
             conn.close()
 
-            if result:
-                media_id = result["ID"]
-                logging.debug(f"✅ SQL-знайдено медіа '{file_slug}' → ID: {media_id}")
-                return media_id
-            else:
-                logging.warning(f"⚠️ SQL: медіа '{file_slug}' не знайдено.")
-                return None
+    def _existing_ids_api(ids):
+        existing = set()
+        for i in range(0, len(ids), 100):
+            chunk = ids[i:i + 100]
+            response = wcapi.wp("GET", "media", params={"include": ",".join(map(str, chunk)), "per_page": 100, "_fields": "id"})
+            if response.status_code != 200:
+                return set(ids)  # не вдалося перевірити — нічого не видаляємо
+            existing.update(item.get("id") for item in response.json())
+        return existing
+
+    try:
+        if db_conf:
+            store.sweep(_existing_ids_sql, max_age_hours)
+        elif wcapi is not None:
+            store.sweep(_existing_ids_api, max_age_hours)
     except Exception as e:
-        logging.error(f"❌ SQL-помилка при пошуку медіа '{filename}': {e}", exc_info=True)
-        return None
+        logging.warning(f"⚠️ Не вдалося перевірити кеш media ID: {e}")
+    return store
+
+# --- ІНДЕКС ТЕКИ UPLOADS ТА ПАКЕТНИЙ ПОШУК MEDIA ID ---
+_SIZE_SUFFIX_RE = re.compile(r'-\d+x\d+(?=\.)')
+
+class UploadsIndex:
+    """
+    Індекс теки uploads, що будується один раз за запуск: відсортований список
+    імен файлів → шляхи. Пошук за префіксом (SKU) — бінарний (bisect), без обходу диска.
+    Повторює поведінку glob('<uploads>/**/<prefix>*.*', recursive=True): приховані теки
+    та файли пропускаються, після префікса в імені має бути крапка.
+    """
+    def __init__(self, uploads_path: str):
+        start_time = time.time()
+        paths_by_name: Dict[str, List[str]] = {}
+        for root, dirs, files in os.walk(uploads_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if not name.startswith('.'):
+                    paths_by_name.setdefault(name, []).append(os.path.join(root, name))
+        self.paths_by_name = paths_by_name
+        self.names = sorted(paths_by_name)
+        logging.info(f"🗂️ Індекс {uploads_path}: {len(self.names)} імен файлів за {time.time() - start_time:.1f} сек.")
+
+    def find(self, prefix: str) -> List[str]:
+        """Імена файлів, що починаються з prefix і мають крапку після нього."""
+        matches = []
+        start = bisect.bisect_left(self.names, prefix)
+        for name in self.names[start:]:
+            if not name.startswith(prefix):
+                break
+            if '.' in name[len(prefix):]:
+                matches.append(name)
+        return matches
+
+_uploads_indexes: Dict[str, UploadsIndex] = {}
+
+def get_uploads_index(uploads_path: str) -> UploadsIndex:
+    """Повертає індекс теки uploads (будується при першому зверненні за запуск)."""
+    if uploads_path not in _uploads_indexes:
+        _uploads_indexes[uploads_path] = UploadsIndex(uploads_path)
+    return _uploads_indexes[uploads_path]
+
+class MediaIdResolver:
+    """
+    Пошук ID вкладень (attachment) за slug через одне з'єднання з базою:
+    невідомі slug запитуються пачками WHERE post_name IN (...), результати кешуються.
+    """
+    CHUNK = 500
+
+    def __init__(self, db_conf: Dict[str, Any], store: Optional[MediaIdStore] = None):
+        self.db_conf = db_conf
+        self.store = store
+        self._conn = None
+        self._cache: Dict[str, Optional[int]] = {}  # slug (нижній регістр) -> id або None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect_wp_db(self.db_conf)
+        else:
+            self._conn.ping(reconnect=True)
+        return self._conn
+
+    def resolve(self, slugs: List[str]) -> Dict[str, Optional[int]]:
+        """Повертає {slug: id або None}. Порівняння без урахування регістру, як у колації MySQL."""
+        missing = sorted({slug.lower() for slug in slugs} - self._cache.keys())
+        if missing and self.store:
+            # Спершу постійний кеш на диску
+            cached = self.store.get_many(missing)
+            self._cache.update(cached)
+            missing = [slug for slug in missing if slug not in cached]
+        if missing:
+            with self._connection().cursor() as cursor:
+                for i in range(0, len(missing), self.CHUNK):
+                    chunk = missing[i:i + self.CHUNK]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(f"""
+                        SELECT post_name, MIN(ID) AS ID
+                        FROM wp_posts
+                        WHERE post_type = 'attachment' AND post_name IN ({placeholders})
+                        GROUP BY post_name
+                    """, chunk)
+                    for slug in chunk:
+                        self._cache[slug] = None
+                    found = {record["post_name"].lower(): record["ID"] for record in cursor.fetchall()}
+                    self._cache.update(found)
+                    if self.store and found:
+                        self.store.put_many(found)
+        return {slug: self._cache[slug.lower()] for slug in slugs}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+_media_resolvers: Dict[str, MediaIdResolver] = {}
+
+def get_media_resolver(settings: Dict[str, Any]) -> MediaIdResolver:
+    """Спільний MediaIdResolver для бази з settings['db'] (одне з'єднання, кеш у пам'яті та на диску)."""
+    db_conf = settings["db"]
+    key = f"{db_conf.get('host')}/{db_conf.get('database')}"
+    if key not in _media_resolvers:
+        _media_resolvers[key] = MediaIdResolver(db_conf, store=get_media_store(settings))
+    return _media_resolvers[key]
+
+def _sku_image_files(sku: str, uploads_path: str) -> List[str]:
+    """Унікальні імена зображень SKU без суфіксів розміру; GIF — останнім."""
+    unique_files = {_SIZE_SUFFIX_RE.sub('', name) for name in get_uploads_index(uploads_path).find(sku)}
+    return sorted(unique_files, key=lambda f: (f.lower().endswith('.gif'), f))
+
+def prefetch_media_ids(skus: List[str], uploads_path: str, settings: Dict[str, Any]):
+    """Одним проходом знаходить файли всіх SKU та завантажує їхні media ID у кеш резолвера."""
+    db_conf = settings.get("db", {})
+    if not db_conf:
+        return
+    slugs = [os.path.splitext(filename)[0] for sku in skus for filename in _sku_image_files(sku, uploads_path)]
+    try:
+        resolved = get_media_resolver(settings).resolve(slugs)
+        logging.info(f"🖼️ Попередньо знайдено media ID: {sum(1 for v in resolved.values() if v)} з {len(resolved)} файлів.")
+    except Exception as e:
+        logging.error(f"❌ SQL-помилка при попередньому пошуку медіа: {e}", exc_info=True)
 
 # --- ДОПОМІЖНА ФУНКЦІЯ ДЛЯ Пошуку Media IDs ---
-def find_media_ids_for_sku(wcapi, sku: str, uploads_path: str) -> List[Dict[str, Any]]:
+def find_media_ids_for_sku(wcapi, sku: str, uploads_path: str, settings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
     Знаходить усі зображення для SKU у uploads_path та повертає список ID для WooCommerce.
-    - Використовує persistent HTTPS-сесію (_session)
-    - Має кеш для вже знайдених slug
+    - Файли шукаються в індексі теки uploads (будується один раз за запуск)
+    - ID визначаються через спільне з'єднання з базою з кешем slug (MediaIdResolver)
     - Ігнорує технічні копії (-150x150, -300x300, ...)
     - GIF ставить останнім
     """
     # --- Завантажуємо конфіг ---
-    settings = load_settings()
+    settings = settings or load_settings()
     if not settings:
         logging.error("❌ Не вдалося завантажити settings.json — пошук зображень пропущено.")
         return []
@@ -781,25 +2162,20 @@ def find_media_ids_for_sku(wcapi, sku: str, uploads_path: str) -> List[Dict[str,
             file_slug = os.path.splitext(clean_name)[0]
 
             # 2️⃣ Якщо вже в кеші — не запитуємо
-            if file_slug in _media_cache:
-                logging.debug(f"♻️ Кешовано медіа '{file_slug}' → ID: {_media_cache[file_slug]}")
-                return _media_cache[file_slug]
+            cached_id = get_media_store(settings, wcapi).get(file_slug)
+            if cached_id:
+                logging.debug(f"♻️ Кешовано медіа '{file_slug}' → ID: {cached_id}")
+                return cached_id
 
-            wp_media_url = f"{wcapi.url.rstrip('/')}/wp-json/wp/v2/media"
             params = {"search": file_slug, "per_page": 5}
 
             # 3️⃣ Пробуємо без авторизації
-            response = _session.get(wp_media_url, params=params, timeout=15)
+            response = wcapi.wp("GET", "media", params=params, auth=False, timeout=15)
 
-            # 4️⃣ Якщо закрито — повтор з WooCommerce ключами
+            # 4️⃣ Якщо закрито — повтор з обліковими даними клієнта
             if response.status_code in (401, 403):
-                logging.debug(f"🔒 REST API потребує auth для '{file_slug}', пробую з ключами WooCommerce...")
-                response = _session.get(
-                    wp_media_url,
-                    params=params,
-                    auth=(wcapi.consumer_key, wcapi.consumer_secret),
-                    timeout=15
-                )
+                logging.debug(f"🔒 REST API потребує auth для '{file_slug}', пробую з обліковими даними...")
+                response = wcapi.wp("GET", "media", params=params, timeout=15)
 
             # 5️⃣ Обробляємо відповідь
             if response.status_code == 200:
@@ -819,7 +2195,7 @@ def find_media_ids_for_sku(wcapi, sku: str, uploads_path: str) -> List[Dict[str,
                     else:
                         logging.debug(f"✅ Точний збіг '{file_slug}' → ID: {media_id} | Назва: {media_title} | URL: {media_url}")
 
-                    _media_cache[file_slug] = media_id
+                    get_media_store(settings, wcapi).put(file_slug, media_id)
                     time.sleep(0.1)  # невелика пауза, щоб не перевантажувати WP
                     return media_id
                 else:
@@ -831,20 +2207,24 @@ def find_media_ids_for_sku(wcapi, sku: str, uploads_path: str) -> List[Dict[str,
         return None
 
     # --- Основна логіка ---
-    pattern = os.path.join(uploads_path, '**', f'{sku}*.*')
-    files = glob.glob(pattern, recursive=True)
+    # Унікальні base-імена без суфіксів, GIF — останнім
+    sorted_files = _sku_image_files(sku, uploads_path)
+    slugs = [os.path.splitext(filename)[0] for filename in sorted_files]
 
-    # Унікальні base-імена без суфіксів
-    unique_files = {re.sub(r'-\d+x\d+(?=\.)', '', os.path.basename(p)) for p in files}
-
-    # GIF — останнім
-    sorted_files = sorted(unique_files, key=lambda f: (f.lower().endswith('.gif'), f))
+    try:
+        resolved = get_media_resolver(settings).resolve(slugs)
+    except Exception as e:
+        logging.error(f"❌ SQL-помилка при пошуку медіа для SKU {sku}: {e}", exc_info=True)
+        resolved = {}
 
     media_ids = []
-    for filename in sorted_files:
-        media_id = _get_media_id_by_filename_sql(settings["db"], filename)
+    for slug in slugs:
+        media_id = resolved.get(slug)
         if media_id:
+            logging.debug(f"✅ SQL-знайдено медіа '{slug}' → ID: {media_id}")
             media_ids.append({"id": media_id})
+        else:
+            logging.warning(f"⚠️ SQL: медіа '{slug}' не знайдено.")
 
     if not media_ids:
         logging.warning(f"⚠️ SKU {sku}: Не знайдено зображень у '{uploads_path}'")
@@ -854,39 +2234,81 @@ def find_media_ids_for_sku(wcapi, sku: str, uploads_path: str) -> List[Dict[str,
     return media_ids
 
 # --- ДОПОМІЖНА ФУНКЦІЯ ДЛЯ ПАКЕТНОГО ЗАПИСУ (Створення) ---
-def _process_batch_create(wcapi: Any, batch_data: List[Dict[str, Any]], errors_list: List[str]) -> int:
-    """Виконує пакетний запит 'create' до WooCommerce API."""
-    
-    payload = {"create": batch_data}
+def _process_batch_create(wcapi: Any, batch_data: List[Dict[str, Any]], errors_list: List[str],
+                          journal: Optional[BatchJournal] = None, retry_conf: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Виконує пакетний запит 'create' до WooCommerce API.
+    Збої 5xx/таймаути повторюються з бекофом, пакет, що не проходить, ділиться навпіл;
+    результат кожного товару (за SKU) записується в journal, якщо його передано.
+    Створення не ідемпотентне: перед кожним повтором SKU пакета перевіряються на сайті,
+    і вже створені сервером товари вважаються готовими, а не надсилаються вдруге.
+    """
     
+    logging.info(f"Надсилаю пакет на створення ({len(batch_data)} товарів)...")
+    created_count = 0
+
+    def _drop_existing(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        nonlocal created_count
+        skus = [item.get('sku') for item in items if item.get('sku')]
+        if not skus:
+            return items
+        try:
+            response = wcapi.get("products", params={"sku": ",".join(skus), "per_page": 100, "status": "any"})
+            response.raise_for_status()
+            existing = {product.get('sku') for product in response.json()}
+        except Exception as e:
+            logging.warning(f"⚠️ Не вдалося перевірити SKU перед повтором створення: {e}")
+            return items
+        remaining = [item for item in items if item.get('sku') not in existing]
+        if len(remaining) < len(items):
+            already = [item.get('sku') for item in items if item.get('sku') in existing]
+            created_count += len(already)
+            logging.info(f"ℹ️ {len(already)} товарів уже створено сервером до збою — повторно не надсилаю.")
+            if journal:
+                journal.record(already, "done")
+        return remaining
+
     try:
-        logging.info(f"Надсилаю пакет на створення ({len(batch_data)} товарів)...")
-        response = wcapi.post("products/batch", data=payload) 
-        
-        if response.status_code == 200:
-            result = response.json()
-            created_count = len(result.get('create', []))
-            
-            api_errors = result.get('errors', [])
-            if api_errors:
-                for err in api_errors:
-                    err_msg = f"API-Помилка при створенні: SKU '{err.get('data', {}).get('resource_id', 'N/A')}', Code: {err.get('code', 'N/A')}: {err.get('message', 'Невідома помилка')}"
-                    errors_list.append(err_msg)
-                    logging.error(err_msg)
-                
-            logging.info(f"✅ Пакет створено. Успішно оброблено API: {created_count} товарів. Помилок у пакеті: {len(api_errors)}")
-            return created_count
-        else:
-            err_msg = f"❌ Критична помилка API ({response.status_code}) при пакетному створенні. Помилка: {response.text[:200]}..."
-            errors_list.append(err_msg)
-            logging.critical(err_msg)
-            return 0
-            
+        outcomes = post_batch_with_retry(lambda items: wcapi.post("products/batch", data={"create": items}),
+                                         batch_data, retry_conf, label=f"SKU {batch_data[0].get('sku')}…",
+                                         before_retry=_drop_existing)
     except Exception as e:
         err_msg = f"❌ Непередбачена помилка під час відправки пакету: {e}"
         errors_list.append(err_msg)
         logging.critical(err_msg, exc_info=True)
-        return 0
+        return created_count
+
+    for items, result, error in outcomes:
+        if result is None:
+            err_msg = f"❌ Критична помилка API при пакетному створенні ({len(items)} товарів). Помилка: {error}"
+            errors_list.append(err_msg)
+            logging.critical(err_msg)
+            if journal:
+                journal.record([item.get('sku') for item in items], "failed", error)
+            continue
+
+        created = result.get('create', [])
+        created_count += len(created)
+
+        api_errors = result.get('errors', [])
+        for err in api_errors:
+            err_msg = f"API-Помилка при створенні: SKU '{err.get('data', {}).get('resource_id', 'N/A')}', Code: {err.get('code', 'N/A')}: {err.get('message', 'Невідома помилка')}"
+            errors_list.append(err_msg)
+            logging.error(err_msg)
+
+        # WooCommerce повертає результати в порядку запиту; товар з помилкою має ключ 'error'
+        if journal:
+            done_skus = []
+            for item, created_item in zip(items, created):
+                if created_item.get('error'):
+                    journal.record([item.get('sku')], "failed", created_item['error'].get('message', ''))
+                else:
+                    done_skus.append(item.get('sku'))
+            journal.record(done_skus, "done")
+            
+        logging.info(f"✅ Пакет створено. Успішно оброблено API: {len(created)} товарів. Помилок у пакеті: {len(api_errors)}")
+
+    return created_count
 
 def _clean_text(value: str) -> str:
     """Очищує HTML-теги, кодування і зайві пробіли."""
@@ -1076,24 +2498,30 @@ def update_image_seo_by_sku():
         "description": f"{product_name} купити в інтернет-магазині Eros.in.ua. Великий вибір секс-іграшок, низька ціна, швидка безкоштовна доставка."
     }
 
-    # --- Допоміжна функція: знайти media id по filename через WP REST API (search) ---
+    media_store = get_media_store(settings, wcapi)
+
+    # --- Допоміжна функція: знайти media id по filename (кеш на диску, далі WP REST API search) ---
     def find_media_id_by_filename(filename: str) -> int:
         """
         Повертає media id або None. Працює через /wp-json/wp/v2/media?search=<filename>
         Потрібна аутентифікація, якщо WP закритий. Ми спробуємо без auth першим, потім з auth.
         """
-        search_url = f"{base_url}/wp-json/wp/v2/media"
+        file_slug = os.path.splitext(filename)[0]
+        cached_id = media_store.get(file_slug)
+        if cached_id:
+            return cached_id
+
         params = {"search": filename, "per_page": 10}
-        headers = {"Accept": "application/json"}
 
         # Спроба без auth
         try:
-            r = requests.get(search_url, params=params, headers=headers, timeout=15, verify=True)
+            r = wcapi.wp("GET", "media", params=params, auth=False, timeout=15)
             if r.status_code == 200:
                 items = r.json()
                 for it in items:
                     src = it.get("source_url", "") or it.get("guid", {}).get("rendered", "")
                     if filename.lower() in (os.path.basename(src).lower()):
+                        media_store.put(file_slug, it.get("id"))
                         return it.get("id")
             # якщо не вдалось або порожньо — спробуємо з auth якщо є
         except Exception as e:
@@ -1101,12 +2529,13 @@ def update_image_seo_by_sku():
 
         if wp_login and wp_pass:
             try:
-                r = requests.get(search_url, params=params, headers=headers, auth=(wp_login, wp_pass), timeout=15, verify=True)
+                r = wcapi.wp("GET", "media", params=params, auth=(wp_login, wp_pass), timeout=15)
                 if r.status_code == 200:
                     items = r.json()
                     for it in items:
                         src = it.get("source_url", "") or it.get("guid", {}).get("rendered", "")
                         if filename.lower() in (os.path.basename(src).lower()):
+                            media_store.put(file_slug, it.get("id"))
                             return it.get("id")
                 else:
                     logging.debug(f"find_media_id_by_filename (auth) status {r.status_code}: {r.text[:200]}")
@@ -1174,7 +2603,6 @@ def update_image_seo_by_sku():
                 failed += 1
                 continue
 
-        media_endpoint = f"{base_url}/wp-json/wp/v2/media/{media_id}"
         update_data = {
             "title": seo_data["title"],
             "alt_text": seo_data["alt"],
@@ -1189,7 +2617,7 @@ def update_image_seo_by_sku():
             continue
 
         try:
-            r = requests.put(media_endpoint, auth=(wp_login, wp_pass), json=update_data, timeout=20, verify=True)
+            r = wcapi.wp("PUT", f"media/{media_id}", data=update_data, auth=(wp_login, wp_pass), timeout=20)
             if r.status_code == 200:
                 print(f"✅ Оновлено медіа ID {media_id} ({filename if filename else ''})")
                 updated += 1
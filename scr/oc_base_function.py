@@ -1,7 +1,10 @@
-import os, yaml, logging, pymysql, csv, shutil, requests, mimetypes, hashlib, re, html, time
+import os, yaml, logging, pymysql, csv, shutil, requests, mimetypes, hashlib, re, html, time, json, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse
 from datetime import datetime
-from bs4 import BeautifulSoup
-from typing import Dict, List
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Dict, List, Any, Optional, Tuple
 
 
 # --- 1. ЗАВАНТАЖЕННЯ НАЛАШТУВАНЬ OPENCART ---
@@ -727,6 +730,777 @@ def check_csv_data(profile_id):
     oc_log_message("✅ Перевірка CSV успішна")
     return True
 
+# --- СЛУЖБОВІ JSON-ФАЙЛИ СТАНУ ТА УМОВНЕ ЗАВАНТАЖЕННЯ ФАЙЛІВ ---
+def load_json_state(path: str) -> Dict[str, Any]:
+    """Завантажує JSON-файл стану. Якщо файлу немає або він пошкоджений — порожній словник."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"⚠️ Файл стану {path} не прочитано ({e}). Починаю з порожнього стану.")
+        return {}
+
+def save_json_state(path: str, data: Dict[str, Any]):
+    """Атомарно записує JSON-файл стану (через тимчасовий файл)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + ".temp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+def _sidecar_path(path: str) -> str:
+    """Шлях до службового файлу з метаданими завантаження (поруч з основним файлом)."""
+    return path + ".meta.json"
+
+def download_file_conditional(url: str, dest_path: str, session: Optional[requests.Session] = None,
+                              timeout: int = 300) -> Dict[str, Any]:
+    """
+    Завантажує файл з умовним GET (If-None-Match / If-Modified-Since) та перевіркою SHA-256.
+    Відповідь пишеться потоково у тимчасовий файл і замінює dest_path атомарно,
+    тож невдале завантаження ніколи не залишає конвеєр без файлу.
+
+    Метадані (etag, last_modified, sha256, processed_sha256) зберігаються у <dest_path>.meta.json.
+    Повертає словник зі статусом:
+        "changed"      — отримано новий вміст, файл замінено;
+        "not_modified" — сервер відповів 304, файл не змінювався;
+        "unchanged"    — вміст збігся з попереднім за хешем, файл не чіпаємо.
+    """
+    meta_path = _sidecar_path(dest_path)
+    previous = load_json_state(meta_path) if os.path.exists(dest_path) else {}
+
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+
+    temp_path = dest_path + ".part"
+    http = session or requests
+    start = time.time()
+    size = 0
+
+    try:
+        with http.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304:
+                status = "not_modified"
+                meta = previous
+            else:
+                r.raise_for_status()
+                os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+                digest = hashlib.sha256()
+                with open(temp_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=256 * 1024):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                sha256 = digest.hexdigest()
+
+                if sha256 == previous.get("sha256"):
+                    # Вміст той самий — залишаємо файл (він міг бути вже оброблений на місці)
+                    os.remove(temp_path)
+                    status = "unchanged"
+                else:
+                    os.replace(temp_path, dest_path)
+                    status = "changed"
+
+                meta = {
+                    **previous,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "sha256": sha256,
+                }
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    meta["status"] = status
+    meta["checked_at"] = datetime.now().isoformat(timespec="seconds")
+    if status == "changed":
+        meta["downloaded_at"] = meta["checked_at"]
+    save_json_state(meta_path, meta)
+
+    return {"status": status, "changed": status == "changed", "bytes": size,
+            "elapsed": time.time() - start, "sha256": meta.get("sha256")}
+
+def source_already_processed(path: str) -> bool:
+    """
+    True, якщо поточний вміст файлу (за хешем з <path>.meta.json) уже був оброблений.
+    Для файлів без метаданих (завантажених вручну) завжди False.
+    """
+    meta = load_json_state(_sidecar_path(path))
+    return bool(meta.get("sha256")) and meta.get("processed_sha256") == meta.get("sha256")
+
+def mark_source_processed(path: str):
+    """Позначає поточний вміст файлу (його SHA-256) як оброблений."""
+    meta_path = _sidecar_path(path)
+    meta = load_json_state(meta_path)
+    if meta.get("sha256"):
+        meta["processed_sha256"] = meta["sha256"]
+        save_json_state(meta_path, meta)
+
+# --- ЖУРНАЛ ЗАВДАНЬ (ПРОДОВЖЕННЯ ПІСЛЯ ЗБОЮ) ---
+class BatchJournal:
+    """
+    Журнал пакетного завдання у форматі JSON Lines: кожен рядок — результат
+    відправки групи товарів ({"status": "done"/"failed", "keys": [...], "error": ..., "data": ...}).
+    Дозволяє після збою продовжити завдання (resume=True), пропустивши вже
+    успішно відправлені товари. Без resume попередній журнал відкидається.
+    data — необов'язковий результат обробки ключа (наприклад, знайдений URL) або, для failed,
+    дані для повтору; доступний у self.data.
+    """
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done: set = set()
+        self.failed: Dict[str, str] = {}
+        self.data: Dict[str, Any] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # недописаний останній рядок після аварійного завершення
+                    for key in record.get("keys", []):
+                        if record.get("status") == "done":
+                            self.done.add(key)
+                            self.failed.pop(key, None)
+                        else:
+                            self.failed[key] = record.get("error", "")
+                        if "data" in record:
+                            self.data[key] = record["data"]
+            logging.info(f"♻️ Продовжую завдання з журналу {os.path.basename(path)}: "
+                         f"вже оброблено {len(self.done)}, з помилками {len(self.failed)}.")
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def is_done(self, key: Any) -> bool:
+        return str(key) in self.done
+
+    def record(self, keys: List[Any], status: str, error: Optional[str] = None, data: Any = None):
+        """Дописує результат у журнал одразу на диск, щоб пережити аварійне завершення."""
+        keys = [str(k) for k in keys]
+        if not keys:
+            return
+        entry = {"status": status, "keys": keys, "at": datetime.now().isoformat(timespec="seconds")}
+        if error:
+            entry["error"] = error
+        if data is not None:
+            entry["data"] = data
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for key in keys:
+            if status == "done":
+                self.done.add(key)
+                self.failed.pop(key, None)
+            else:
+                self.failed[key] = error or ""
+            if data is not None:
+                self.data[key] = data
+
+    def finish(self):
+        """Видаляє журнал, якщо всі товари відправлено без помилок."""
+        if not self.failed and os.path.exists(self.path):
+            os.remove(self.path)
+            logging.info(f"🧹 Завдання завершено без помилок, журнал {os.path.basename(self.path)} видалено.")
+        elif self.failed:
+            logging.warning(f"⚠️ У журналі {os.path.basename(self.path)} залишилось {len(self.failed)} товарів з помилками. "
+                            f"Повторіть запуск з --resume, щоб обробити лише їх.")
+
+def open_batch_journal(settings: Dict[str, Any], job_name: str, resume: bool = False) -> BatchJournal:
+    """Відкриває журнал завдання job_name у теці paths.jobs_dir (за замовчуванням csv/process/jobs)."""
+    jobs_dir = settings.get("paths", {}).get("jobs_dir", "csv/process/jobs")
+    return BatchJournal(os.path.join(jobs_dir, f"{job_name}.jsonl"), resume=resume)
+
+# --- КОНКУРЕНТНИЙ ЗБІР СТОРІНОК ПОСТАЧАЛЬНИКІВ ---
+class RateLimiter:
+    """
+    Потокобезпечний обмежувач швидкості (token bucket).
+    rate  — кількість запитів на секунду (0 або менше — без обмеження);
+    burst — скільки запитів можна виконати одразу без очікування.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate or 0)
+        self.capacity = max(1, int(burst or 1))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class HostRateLimiter:
+    """Окремий token bucket (RateLimiter) на кожен хост: rate запитів/сек, burst — одразу без очікування."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate, self.burst)
+        limiter.acquire()
+
+class PageNotCachedError(requests.RequestException):
+    """Режим --cache-only: сторінки немає в локальному кеші, а мережу використовувати не можна."""
+
+class PageCache:
+    """
+    Кеш відповідей постачальника на диску, спільний для всіх етапів збору.
+    Ключ — SHA-256 від URL: тіло в <path>/<ab>/<key>.body, метадані (url, час, ETag,
+    Last-Modified, Content-Type, кодування) — у <key>.json поруч.
+    Запис свіжий ttl_hours годин; застарілий можна перевалідувати умовним GET.
+    """
+    def __init__(self, path: str, ttl_hours: float = 24):
+        self.path = path
+        self.ttl = float(ttl_hours) * 3600
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        folder = os.path.join(self.path, key[:2])
+        return os.path.join(folder, key + ".body"), os.path.join(folder, key + ".json")
+
+    def load(self, url: str) -> Optional[Dict[str, Any]]:
+        """Метадані запису з тілом у 'content' та ознакою 'fresh', або None, якщо запису немає."""
+        body_path, meta_path = self._paths(url)
+        meta = load_json_state(meta_path)
+        if not meta or not os.path.exists(body_path):
+            return None
+        with open(body_path, "rb") as f:
+            meta["content"] = f.read()
+        meta["fresh"] = time.time() - meta.get("fetched_at", 0) < self.ttl
+        return meta
+
+    def store(self, url: str, response: requests.Response):
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        temp_path = f"{body_path}.{threading.get_ident()}.temp"
+        with open(temp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(temp_path, body_path)
+        save_json_state(meta_path, {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "encoding": response.encoding,
+        })
+
+    def touch(self, url: str, entry: Dict[str, Any]):
+        """Сервер відповів 304 — запис знову свіжий."""
+        _, meta_path = self._paths(url)
+        meta = {key: value for key, value in entry.items() if key not in ("content", "fresh")}
+        meta["fetched_at"] = time.time()
+        save_json_state(meta_path, meta)
+
+    @staticmethod
+    def to_response(url: str, entry: Dict[str, Any]) -> requests.Response:
+        """Відновлює requests.Response з запису кешу (для коду, що працює з .text / .content)."""
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response._content = entry["content"]
+        response.encoding = entry.get("encoding")
+        if entry.get("content_type"):
+            response.headers["Content-Type"] = entry["content_type"]
+        return response
+
+class SupplierScraper:
+    """
+    Паралельне завантаження сторінок постачальника: невеликий пул потоків,
+    спільна keep-alive сесія та обмеження швидкості на хост замість фіксованих пауз.
+    Налаштування — oc_settings.yaml, блок scraping: workers (4), rate (1.0 запит/сек на хост),
+    burst (2), image_rate / image_burst (4 / 4 — окремий ліміт для файлів зображень),
+    timeout (30 сек.), user_agent; cache — кеш сторінок на диску:
+    enabled (true), ttl_hours (24), revalidate (true — умовний GET для застарілих записів).
+    cache_only=True — лише кеш, без мережі (для офлайн-повторної обробки).
+    parser — рушій розбору HTML: lxml (за замовчуванням, якщо встановлено) або bs4.
+    """
+    def __init__(self, conf: Optional[Dict[str, Any]] = None, cache_path: Optional[str] = None, cache_only: bool = False):
+        conf = conf or {}
+        cache_conf = conf.get("cache", {})
+        self.workers = max(1, int(conf.get("workers", 4)))
+        self.timeout = conf.get("timeout", 30)
+        self.limiter = HostRateLimiter(float(conf.get("rate", 1.0)), int(conf.get("burst", 2)))
+        self.image_limiter = HostRateLimiter(float(conf.get("image_rate", 4.0)), int(conf.get("image_burst", 4)))
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if conf.get("user_agent"):
+            self.session.headers["User-Agent"] = conf["user_agent"]
+        self.cache = PageCache(cache_path, cache_conf.get("ttl_hours", 24)) \
+            if cache_path and cache_conf.get("enabled", True) else None
+        self.revalidate = cache_conf.get("revalidate", True)
+        self.parser = resolve_parser(conf.get("parser", "lxml"))
+        self.cache_only = cache_only
+        if cache_only and not self.cache:
+            raise ValueError("Режим --cache-only потребує увімкненого кешу сторінок (scraping.cache.enabled).")
+        self.stats = {"cache": 0, "revalidated": 0, "network": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get(self, url: str) -> requests.Response:
+        """
+        GET через кеш сторінок: свіжий запис віддається без запиту, застарілий — перевалідовується
+        (If-None-Match / If-Modified-Since), інакше звичайний запит з урахуванням ліміту хоста.
+        При HTTP-помилці — requests.HTTPError; у режиму cache_only без запису — PageNotCachedError.
+        """
+        entry = self.cache.load(url) if self.cache else None
+        if entry and (entry["fresh"] or self.cache_only):
+            self._count("cache")
+            return PageCache.to_response(url, entry)
+        if self.cache_only:
+            raise PageNotCachedError(f"Сторінки немає в кеші (--cache-only): {url}")
+
+        headers = {}
+        if entry and self.revalidate:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        self.limiter.acquire(url)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry:
+            self.cache.touch(url, entry)
+            self._count("revalidated")
+            return PageCache.to_response(url, entry)
+        response.raise_for_status()
+        self._count("network")
+        if self.cache:
+            self.cache.store(url, response)
+        return response
+
+    def open_image(self, url: str) -> requests.Response:
+        """
+        Потоковий GET файлу зображення (stream=True) з окремим лімітом хоста; використовувати через with.
+        У режимі cache_only мережа недоступна — PageNotCachedError (файли беруться лише зі сховища зображень).
+        """
+        if self.cache_only:
+            raise PageNotCachedError(f"Зображення не в сховищі: {url}")
+        self.image_limiter.acquire(url)
+        response = self.session.get(url, timeout=self.timeout, stream=True)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def map_ordered(self, func, items):
+        """
+        Виконує func(item) у пулі потоків і віддає результати в порядку items.
+        Одночасно в роботі не більше workers * 2 елементів, тож великі файли не читаються в пам'ять повністю.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self):
+        self.session.close()
+        if self.cache:
+            logging.info(f"🗄️ Кеш сторінок: з кешу {self.stats['cache']}, перевалідовано (304) {self.stats['revalidated']}, "
+                         f"завантажено {self.stats['network']}.")
+
+def get_supplier_scraper(settings: Dict[str, Any], cache_only: bool = False) -> SupplierScraper:
+    """Скрапер з налаштувань 'scraping'; кеш сторінок — paths.http_cache (за замовчуванням csv/process/http_cache)."""
+    cache_path = settings.get("paths", {}).get("http_cache", "csv/process/http_cache")
+    return SupplierScraper(settings.get("scraping", {}), cache_path, cache_only=cache_only)
+
+# --- РОЗБІР HTML ПОСТАЧАЛЬНИКА: РУШІЇ bs4 / lxml ---
+# Обидва рушії повертають однакові структури; lxml швидший, bs4 (html.parser) — еталон і запасний варіант.
+_CLASS_XPATH = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+# SoupStrainer з class_='card-block' не бачить блоків з кількома класами ("card-block product-card")
+_CARD_BLOCK_CLASS = re.compile(r"(^|\s)card-block(\s|$)")
+_lxml_state: Dict[str, Any] = {}
+
+def _lxml_tools() -> Optional[Dict[str, Any]]:
+    """Парсер і XPath-вирази lxml, скомпільовані один раз за запуск; None — якщо lxml не встановлено."""
+    if "tools" not in _lxml_state:
+        try:
+            from lxml import etree
+        except ImportError:
+            _lxml_state["tools"] = None
+        else:
+            has_class = _CLASS_XPATH.format
+            _lxml_state["tools"] = {
+                "parser": etree.HTMLParser(encoding="utf-8"),
+                "fromstring": etree.fromstring,
+                "variant_inputs": etree.XPath(f"//input[{has_class('variant_control')} and @data-code]"),
+                "radio_divs": etree.XPath(f"//div[{has_class('radio')}]"),
+                "card_block": etree.XPath(f"ancestor::div[{has_class('card-block')}][1]"),
+                "card_link": etree.XPath(f"((.//h4[{has_class('card-title')}])[1]//a)[1]"),
+                "char_table": etree.XPath("(//div[@id='w0-tab0'])[1]"),
+                "first_table": etree.XPath("(.//table)[1]"),
+                "rows": etree.XPath(".//tr"),
+                "cells": etree.XPath(".//td"),
+                # get_text() у bs4 не включає вміст <script>, <style> і <template>
+                "texts": etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]"),
+                "main_image": etree.XPath(f"(//a[{has_class('main_image_container')}])[1]"),
+                "thumbs": etree.XPath(f"//a[{has_class('thumb_image_container')}]"),
+            }
+    return _lxml_state["tools"]
+
+def resolve_parser(name: str) -> str:
+    """Повертає доступний рушій: 'lxml' або 'bs4' (якщо lxml не встановлено — з попередженням)."""
+    if name == "lxml" and _lxml_tools() is None:
+        if not _lxml_state.get("warned"):
+            logging.warning("⚠️ lxml не встановлено (pip install lxml) — розбір HTML через BeautifulSoup.")
+            _lxml_state["warned"] = True
+        return "bs4"
+    return "lxml" if name == "lxml" else "bs4"
+
+def _lxml_root(html: str):
+    tools = _lxml_tools()
+    if not html or not html.strip():
+        return None
+    return tools["fromstring"](html.encode("utf-8"), tools["parser"])
+
+def _lxml_text(tools: Dict[str, Any], element) -> str:
+    """Аналог get_text(strip=True) з BeautifulSoup (без тексту скриптів і стилів)."""
+    return "".join(part.strip() for part in tools["texts"](element) if part.strip())
+
+def _search_results_bs4(html: str) -> Dict[str, List[Tuple[str, str]]]:
+    # Будуємо дерево лише з блоків card-block — решта сторінки пошуку не потрібна
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('div', class_=_CARD_BLOCK_CLASS))
+
+    def _card_link(tag) -> Optional[str]:
+        parent_div = tag.find_parent('div', class_='card-block')
+        title = parent_div.find('h4', class_='card-title') if parent_div else None
+        link_tag = title.find('a') if title else None
+        return link_tag['href'] if link_tag and link_tag.has_attr('href') else None
+
+    results = {"variant": [], "simple": []}
+    for input_tag in soup.find_all('input', class_='variant_control', attrs={'data-code': True}):
+        href = _card_link(input_tag)
+        if href is not None:
+            results["variant"].append((input_tag.get('data-code', '').strip(), href))
+    for div_tag in soup.find_all('div', class_='radio'):
+        href = _card_link(div_tag)
+        if href is not None:
+            results["simple"].append((div_tag.get_text(strip=True).strip(), href))
+    return results
+
+def _search_results_lxml(html: str) -> Dict[str, List[Tuple[str, str]]]:
+    tools = _lxml_tools()
+    root = _lxml_root(html)
+    results = {"variant": [], "simple": []}
+    if root is None:
+        return results
+
+    def _card_link(element) -> Optional[str]:
+        for parent_div in tools["card_block"](element):
+            for link in tools["card_link"](parent_div):
+                return link.get("href")
+        return None
+
+    for element in tools["variant_inputs"](root):
+        href = _card_link(element)
+        if href is not None:
+            results["variant"].append(((element.get("data-code") or "").strip(), href))
+    for element in tools["radio_divs"](root):
+        href = _card_link(element)
+        if href is not None:
+            results["simple"].append((_lxml_text(tools, element), href))
+    return results
+
+def _product_page_bs4(html: str) -> Dict[str, Any]:
+    soup = BeautifulSoup(html, 'html.parser')
+
+    attributes = {}
+    characteristics_div = soup.find('div', id='w0-tab0')
+    if characteristics_div and characteristics_div.find('table'):
+        for tr in characteristics_div.find('table').find_all('tr'):
+            cells = tr.find_all('td')
+            if len(cells) == 2:
+                key = cells[0].get_text(strip=True).replace(':', '')
+                attributes[key] = cells[1].get_text(strip=True)
+
+    main_tag = soup.find('a', class_='main_image_container')
+    thumbs = []
+    for a in soup.find_all('a', class_='thumb_image_container'):
+        link = a.get('href')
+        if link and link not in thumbs:
+            thumbs.append(link)
+
+    return {
+        "attributes": attributes,
+        "main_image": main_tag.get('href') if main_tag and main_tag.get('href') else None,
+        "thumbs": thumbs,
+    }
+
+def _product_page_lxml(html: str) -> Dict[str, Any]:
+    tools = _lxml_tools()
+    root = _lxml_root(html)
+    page = {"attributes": {}, "main_image": None, "thumbs": []}
+    if root is None:
+        return page
+
+    for characteristics_div in tools["char_table"](root):
+        for table in tools["first_table"](characteristics_div):
+            for tr in tools["rows"](table):
+                cells = tools["cells"](tr)
+                if len(cells) == 2:
+                    key = _lxml_text(tools, cells[0]).replace(':', '')
+                    page["attributes"][key] = _lxml_text(tools, cells[1])
+
+    for main_tag in tools["main_image"](root):
+        page["main_image"] = main_tag.get("href") or None
+    for a in tools["thumbs"](root):
+        link = a.get("href")
+        if link and link not in page["thumbs"]:
+            page["thumbs"].append(link)
+    return page
+
+_HTML_PARSERS = {
+    "bs4": {"search": _search_results_bs4, "product": _product_page_bs4},
+    "lxml": {"search": _search_results_lxml, "product": _product_page_lxml},
+}
+
+def extract_search_results(html: str, parser: str = "bs4") -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Сторінка пошуку постачальника → {'variant': [(data-code, href)], 'simple': [(текст div.radio, href)]}
+    у порядку документа. href — посилання з h4.card-title найближчого батьківського div.card-block;
+    елементи без такого посилання пропускаються.
+    """
+    return _HTML_PARSERS[resolve_parser(parser)]["search"](html)
+
+def find_product_link(html: str, file_sku: str, site_url: str, parser: str = "bs4") -> Tuple[Optional[str], Optional[str]]:
+    """
+    Шукає на сторінці пошуку посилання на товар з артикулом file_sku: спершу серед варіативних
+    (input.variant_control[data-code]), потім серед простих (div.radio).
+    Повертає (found_url, found_type), де found_type — 'variant', 'simple' або None.
+    """
+    results = extract_search_results(html, parser)
+    for found_type in ("variant", "simple"):
+        for site_sku, href in results[found_type]:
+            if site_sku == file_sku:
+                # Формуємо повний URL (додаємо site_url до відносного шляху)
+                return site_url + href, found_type
+    return None, None
+
+# --- ЗБІР СТОРІНОК ТОВАРІВ (ОДИН РАЗ ДЛЯ АТРИБУТІВ І ЗОБРАЖЕНЬ) ---
+def parse_product_page(html: str, parser: str = "bs4") -> Dict[str, Any]:
+    """
+    Розбирає сторінку товару постачальника:
+    attributes — таблиця характеристик з div#w0-tab0 ({назва: значення}),
+    main_image — посилання a.main_image_container, thumbs — посилання a.thumb_image_container (без повторів).
+    """
+    return _HTML_PARSERS[resolve_parser(parser)]["product"](html)
+
+class ProductPageStore:
+    """
+    Сховище розібраних сторінок товарів у JSONL: один запис на рядок, ключ — URL
+    (при повторах перемагає останній). Записи дописуються одразу, тож перерваний збір нічого не втрачає.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # обірваний останній рядок після аварійної зупинки
+                    self.records[record["url"]] = record
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        return self.records.get(url)
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[record["url"]] = record
+
+def get_product_page_store(settings: Dict[str, Any]) -> ProductPageStore:
+    """Сховище сторінок товарів: paths.product_pages (за замовчуванням csv/process/product_pages.jsonl)."""
+    return ProductPageStore(settings.get("paths", {}).get("product_pages", "csv/process/product_pages.jsonl"))
+
+def _product_page_record(url: str, sku: str, html: str, parser: str) -> Dict[str, Any]:
+    return {"url": url, "sku": sku, **parse_product_page(html, parser), "harvested_at": datetime.now().isoformat(timespec="seconds")}
+
+def get_product_page(url: str, pages: ProductPageStore, scraper: SupplierScraper, sku: str = "") -> Dict[str, Any]:
+    """Запис зі сховища; якщо сторінку ще не зібрано — завантажує, розбирає та зберігає її."""
+    record = pages.get(url)
+    if record is None:
+        record = _product_page_record(url, sku, scraper.get(url).text, scraper.parser)
+        pages.add(record)
+    return record
+
+def harvest_product_pages(items: List[Tuple[str, str]], settings: Dict[str, Any],
+                          force: bool = False, cache_only: bool = False) -> Dict[str, int]:
+    """
+    Паралельно завантажує та розбирає сторінки товарів (items — пари (url, sku)) і пише їх у сховище.
+    Уже зібрані URL пропускаються, якщо не force. Повертає статистику {harvested, skipped, failed}.
+    """
+    pages = get_product_page_store(settings)
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    stats = {"harvested": 0, "skipped": 0, "failed": 0}
+
+    todo, seen = [], set()
+    for url, sku in items:
+        if url in seen:
+            continue
+        seen.add(url)
+        if not force and pages.get(url) is not None:
+            stats["skipped"] += 1
+        else:
+            todo.append((url, sku))
+
+    def _harvest(item):
+        url, sku = item
+        try:
+            return _product_page_record(url, sku, scraper.get(url).text, scraper.parser), None
+        except Exception as e:
+            return {"url": url, "sku": sku}, e
+
+    try:
+        for record, error in scraper.map_ordered(_harvest, todo):
+            if error is not None:
+                stats["failed"] += 1
+                logging.warning(f"⚠️ Сторінку товару {record['sku']} не зібрано ({record['url']}): {error}")
+                continue
+            pages.add(record)
+            stats["harvested"] += 1
+    finally:
+        scraper.close()
+
+    logging.info(f"📄 Збір сторінок товарів: зібрано {stats['harvested']}, вже були {stats['skipped']}, помилок {stats['failed']}.")
+    return stats
+
+# --- СХОВИЩЕ ЗОБРАЖЕНЬ ЗА ХЕШЕМ ВМІСТУ ---
+class ImageBlobStore:
+    """
+    Зображення постачальника на диску за SHA-256 вмісту: <path>/<ab>/<sha256><ext>.
+    url_index.json пам'ятає URL → {sha256, ext, size}: повторні запуски та спільні для варіантів
+    зображення не завантажуються вдруге, а однаковий вміст з різних URL зберігається один раз.
+    """
+    SAVE_EVERY = 50  # як часто (нових URL) скидати індекс на диск
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index_path = os.path.join(path, "url_index.json")
+        self.index: Dict[str, Dict[str, Any]] = load_json_state(self.index_path)
+        self.stats = {"downloaded": 0, "reused": 0}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+    def blob_path(self, entry: Dict[str, Any]) -> str:
+        return os.path.join(self.path, entry["sha256"][:2], entry["sha256"] + entry["ext"])
+
+    def _lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self.index.get(url)
+        if entry:
+            blob = self.blob_path(entry)
+            if os.path.exists(blob) and os.path.getsize(blob) == entry["size"]:
+                return entry
+        return None
+
+    def fetch(self, url: str, scraper: "SupplierScraper") -> Dict[str, Any]:
+        """
+        Запис {sha256, ext, size} для URL: з індексу без запиту або потоковим завантаженням
+        (частинами по 64 КБ з хешуванням на льоту, без утримання файлу в пам'яті).
+        Один URL завантажується один раз, навіть якщо його одночасно просять кілька потоків.
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            entry = self._lookup(url)
+            if entry:
+                with self._lock:
+                    self.stats["reused"] += 1
+                return entry
+
+            digest = hashlib.sha256()
+            size = 0
+            temp_path = os.path.join(self.path, f".{threading.get_ident()}.part")
+            try:
+                with scraper.open_image(url) as response:
+                    content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip()
+                    ext = mimetypes.guess_extension(content_type) or '.jpg'
+                    with open(temp_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            if chunk:
+                                f.write(chunk)
+                                digest.update(chunk)
+                                size += len(chunk)
+                entry = {"sha256": digest.hexdigest(), "ext": ext, "size": size}
+                blob = self.blob_path(entry)
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(temp_path, blob)  # той самий вміст — той самий файл, дублікат просто перезаписується
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            with self._lock:
+                self.index[url] = entry
+                self.stats["downloaded"] += 1
+                self._unsaved += 1
+                if self._unsaved >= self.SAVE_EVERY:
+                    self._save_locked()
+            return entry
+
+    def materialize(self, entry: Dict[str, Any], dest_path: str) -> bool:
+        """Копіює зображення у dest_path. False — файл з таким самим розміром уже на місці."""
+        if os.path.exists(dest_path) and os.path.getsize(dest_path) == entry["size"]:
+            return False
+        shutil.copyfile(self.blob_path(entry), dest_path)
+        return True
+
+    def _save_locked(self):
+        save_json_state(self.index_path, self.index)
+        self._unsaved = 0
+
+    def save(self):
+        with self._lock:
+            if self._unsaved:
+                self._save_locked()
+        logging.info(f"🖼️ Сховище зображень: завантажено {self.stats['downloaded']}, "
+                     f"повторно використано {self.stats['reused']}.")
+
+def get_image_blob_store(settings: Dict[str, Any]) -> ImageBlobStore:
+    """Сховище зображень: paths.image_blobs (за замовчуванням csv/process/image_blobs)."""
+    return ImageBlobStore(settings.get("paths", {}).get("image_blobs", "csv/process/image_blobs"))
+
 # --- ОБРОБКА ЗОБРАЖЕНЬ ---   
 def clear_directory(folder_path: str):
     """Очищає або створює директорію."""
@@ -759,15 +1533,81 @@ def move_gifs(src: str, dest: str) -> int:
     logging.info(f"🟣 Переміщено {moved} GIF-файлів.")
     return moved
 
-def convert_to_webp_square(src: str, dest: str) -> int:
+def _webp_encode(img_path: str, out_path: str, quality: int, max_side: int, cache_dir: Optional[str]) -> Tuple[str, str, float, str]:
     """
-    Конвертує JPG/PNG → WEBP, вирівнює зображення до квадрату
-    та коректно обробляє прозорість (RGBA / палітрові P-зображення).
+    Конвертує одне зображення (виконується у процесі пулу).
+    Повертає (out_path, статус 'converted' | 'cached' | 'error', секунди, текст помилки).
     """
     from PIL import Image
 
-    converted = 0
+    start = time.perf_counter()
+    cache_blob = None
+    try:
+        # 🔹 Той самий вміст уже кодувався з тими самими параметрами — беремо готовий WEBP
+        if cache_dir:
+            digest = hashlib.sha256()
+            with open(img_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    digest.update(chunk)
+            sha = digest.hexdigest()
+            cache_blob = os.path.join(cache_dir, sha[:2], f"{sha}-q{quality}-m{max_side}.webp")
+            if os.path.exists(cache_blob):
+                shutil.copyfile(cache_blob, out_path)
+                return out_path, "cached", time.perf_counter() - start, ""
+
+        img = Image.open(img_path)
+
+        # 🔹 Конвертація кольорового режиму (для уникнення warning)
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+
+        # 🔹 Зменшення до max_side (до вирівнювання — менше пікселів для кодування)
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        w, h = img.size
+        side = max(w, h)
+
+        # 🔹 Якщо зображення має альфа-канал — створюємо прозоре полотно
+        if img.mode == "RGBA":
+            canvas = Image.new("RGBA", (side, side), (255, 255, 255, 0))
+        else:
+            canvas = Image.new("RGB", (side, side), (255, 255, 255))
+
+        # Центрування
+        canvas.paste(img, ((side - w) // 2, (side - h) // 2))
+
+        # 🔹 Збереження у форматі WEBP
+        canvas.save(out_path, 'webp', quality=quality)
 
+        if cache_blob:
+            os.makedirs(os.path.dirname(cache_blob), exist_ok=True)
+            temp_path = f"{cache_blob}.{os.getpid()}.part"
+            shutil.copyfile(out_path, temp_path)
+            os.replace(temp_path, cache_blob)
+        return out_path, "converted", time.perf_counter() - start, ""
+    except Exception as e:
+        return out_path, "error", time.perf_counter() - start, str(e)
+
+def convert_to_webp_square(src: str, dest: str, conf: Optional[Dict[str, Any]] = None,
+                           cache_path: Optional[str] = None) -> int:
+    """
+    Конвертує JPG/PNG → WEBP, вирівнює зображення до квадрату
+    та коректно обробляє прозорість (RGBA / палітрові P-зображення).
+    Налаштування — settings["webp"]: workers (кількість ядер; 1 — без пулу процесів),
+    quality (90), max_side (0 — без зменшення; інакше довша сторона обмежується до max_side).
+    Пропускаються файли, чий WEBP у dest новіший за джерело; cache_path — кеш готових WEBP
+    за SHA-256 джерела та параметрами, тож повторно завантажене те саме фото не кодується знову.
+    """
+    conf = conf or {}
+    workers = max(1, int(conf.get("workers") or os.cpu_count() or 1))
+    quality = int(conf.get("quality", 90))
+    max_side = int(conf.get("max_side", 0) or 0)
+
+    tasks = []
+    skipped = 0
     for root, _, files in os.walk(src):
         rel = os.path.relpath(root, src)
         out_dir = os.path.join(dest, rel)
@@ -776,76 +1616,78 @@ def convert_to_webp_square(src: str, dest: str) -> int:
         for f in files:
             if not f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
                 continue
+            img_path = os.path.join(root, f)
+            out_path = os.path.join(out_dir, os.path.splitext(f)[0] + '.webp')
+            # 🔹 Інкрементально: WEBP уже новіший за джерело
+            if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(img_path):
+                skipped += 1
+                continue
+            tasks.append((img_path, out_path, quality, max_side, cache_path))
 
-            try:
-                img_path = os.path.join(root, f)
-                img = Image.open(img_path)
-
-                # 🔹 Конвертація кольорового режиму (для уникнення warning)
-                if img.mode == "P":
-                    img = img.convert("RGBA")
-                elif img.mode not in ("RGB", "RGBA"):
-                    img = img.convert("RGB")
-
-                w, h = img.size
-                max_side = max(w, h)
-
-                # 🔹 Якщо зображення має альфа-канал — створюємо прозоре полотно
-                if img.mode == "RGBA":
-                    canvas = Image.new("RGBA", (max_side, max_side), (255, 255, 255, 0))
-                else:
-                    canvas = Image.new("RGB", (max_side, max_side), (255, 255, 255))
-
-                # Центрування
-                canvas.paste(img, ((max_side - w) // 2, (max_side - h) // 2))
-
-                # 🔹 Збереження у форматі WEBP
-                new_name = os.path.splitext(f)[0] + '.webp'
-                out_path = os.path.join(out_dir, new_name)
-                canvas.save(out_path, 'webp', quality=90)
-
-                converted += 1
-
-            except Exception as e:
-                logging.error(f"❌ WEBP-конвертація '{f}' не вдалася: {e}")
+    workers = min(workers, max(1, len(tasks)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_webp_encode, *zip(*tasks), chunksize=4))
+    else:
+        results = [_webp_encode(*task) for task in tasks]
 
-    logging.info(f"🟢 WEBP-конвертовано {converted} зображень.")
-    return converted
+    converted = cached = 0
+    timings = []
+    for out_path, status, seconds, error in results:
+        if status == "error":
+            logging.error(f"❌ WEBP-конвертація '{os.path.basename(out_path)}' не вдалася: {error}")
+            continue
+        if status == "cached":
+            cached += 1
+        else:
+            converted += 1
+            timings.append((seconds, out_path))
+
+    logging.info(f"🟢 WEBP-конвертовано {converted} зображень, з кешу {cached}, актуальних пропущено {skipped} "
+                 f"(процесів: {workers}).")
+    if timings:
+        timings.sort()
+        total = sum(t for t, _ in timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))][0]
+        slowest, slowest_path = timings[-1]
+        logging.info(f"⏱️ WEBP: сумарно {total:.1f} сек., в середньому {total / len(timings) * 1000:.0f} мс, "
+                     f"p95 {p95 * 1000:.0f} мс, найдовше {slowest * 1000:.0f} мс ({os.path.basename(slowest_path)}).")
+    return converted + cached
 
 # --- ЗАВАНТАЖЕННЯ ЗОБРАЖЕНЬ ТОВАРУ (З ВИДАЛЕННЯМ ДУБЛІКАТІВ) ---
-def download_product_images(url: str, sku: str, category: str, base_path: str, cat_map: Dict[str, str]) -> List[str]:
+def download_product_images(url: str, sku: str, category: str, base_path: str, cat_map: Dict[str, str],
+                            scraper: SupplierScraper, blobs: ImageBlobStore,
+                            pages: Optional[ProductPageStore] = None) -> List[str]:
     """
     Завантажує зображення, гарантуючи:
     1. Main фото перше.
-    2. Відсутність візуальних дублікатів (за MD5 хешем).
+    2. Відсутність візуальних дублікатів (за SHA-256 вмісту).
+    Посилання беруться із зібраної сторінки товару (pages), інакше сторінка завантажується
+    через scraper (кеш сторінок, ліміт хоста). Файли беруться зі сховища blobs
+    (завантаження лише нових URL, потоково, без утримання в пам'яті).
     """
     cat_slug = cat_map.get(category.strip()) or category.strip().lower().replace(' ', '_').replace(',', '')
     dest = os.path.join(base_path, cat_slug)
     os.makedirs(dest, exist_ok=True)
 
     try:
-        page = requests.get(url, timeout=10)
-        page.raise_for_status()
+        if pages is not None:
+            record = get_product_page(url, pages, scraper, sku)
+        else:
+            record = parse_product_page(scraper.get(url).text, scraper.parser)
     except Exception as e:
         logging.warning(f"⚠️ Не вдалося завантажити сторінку {url}: {e}")
         return []
 
-    soup = BeautifulSoup(page.content, 'html.parser')
-    
     collected_urls = []
 
-    # 1. 🥇 Шукаємо ГОЛОВНЕ зображення
-    main_img_tag = soup.find('a', class_='main_image_container')
-    if main_img_tag and main_img_tag.get('href'):
-        link = main_img_tag.get('href')
-        if link not in collected_urls:
-            collected_urls.append(link)
+    # 1. 🥇 ГОЛОВНЕ зображення
+    if record.get("main_image"):
+        collected_urls.append(record["main_image"])
 
-    # 2. 🥈 Шукаємо МІНІАТЮРИ
-    thumbs = soup.find_all('a', class_='thumb_image_container')
-    for a in thumbs:
-        link = a.get('href')
-        if link and link not in collected_urls:
+    # 2. 🥈 МІНІАТЮРИ
+    for link in record.get("thumbs", []):
+        if link not in collected_urls:
             collected_urls.append(link)
 
     if not collected_urls:
@@ -859,34 +1701,22 @@ def download_product_images(url: str, sku: str, category: str, base_path: str, c
 
     for img_url in collected_urls:
         try:
-            r = requests.get(img_url, timeout=10)
-            r.raise_for_status()
-            content = r.content
+            # Зі сховища або потоковим завантаженням; хеш вмісту рахується під час запису
+            entry = blobs.fetch(img_url, scraper)
 
             # --- ПЕРЕВІРКА НА ДУБЛІКАТИ ---
-            # Рахуємо MD5 хеш картинки
-            img_hash = hashlib.md5(content).hexdigest()
-
             # Якщо такий хеш вже був у цього товару — пропускаємо
-            if img_hash in seen_hashes:
-                # logging.info(f"♻️ Пропущено дублікат: {img_url}")
+            if entry["sha256"] in seen_hashes:
                 continue
             
             # Якщо це нове унікальне фото — додаємо хеш у базу
-            seen_hashes.add(img_hash)
+            seen_hashes.add(entry["sha256"])
             # -------------------------------
 
-            # Визначаємо розширення
-            mime = r.headers.get('Content-Type')
-            ext = mimetypes.guess_extension(mime) or '.jpg'
-            
-            fname = f"{sku}-{counter}{ext}"
+            fname = f"{sku}-{counter}{entry['ext']}"
             counter += 1 # Збільшуємо лічильник тільки якщо реально зберегли файл
             
-            file_path = os.path.join(dest, fname)
-            with open(file_path, 'wb') as f:
-                f.write(content)
-            
+            blobs.materialize(entry, os.path.join(dest, fname))
             saved_files.append(fname)
 
         except Exception as e:
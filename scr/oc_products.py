@@ -1,6 +1,7 @@
-import csv, pymysql, html, os, re, logging, requests, shutil, io
+import csv, pymysql, html, os, re, logging, requests, io
 import pandas as pd
-from scr.oc_base_function import oc_setup_new_log_file, oc_log_message, oc_connect_db, load_oc_settings
+from scr.oc_base_function import oc_setup_new_log_file, oc_log_message, oc_connect_db, load_oc_settings, \
+                                 download_file_conditional, source_already_processed, mark_source_processed
 
 # ГОЛОВНА ФУНКЦІЯ 1: Експорт товарів з бд
 def oc_export_products():
@@ -131,6 +132,8 @@ def oc_export_products():
 def download_supplier_price_list(supplier_id):
     """
     Скачує прайс-лист від постачальника за його ID.
+    Умовний GET (ETag / Last-Modified) + SHA-256: незмінений прайс не перезаписується,
+    а новий замінює старий лише після повного завантаження.
     """
     # 0. Налаштування логування для дописування
     oc_log_message()
@@ -158,31 +161,24 @@ def download_supplier_price_list(supplier_id):
     
     logging.info(f"⏳ Запускаю завантаження прайс-листа від постачальника (ID: {supplier_id}).")
 
-    # 4. Видалення старого файлу
-    if os.path.exists(csv_path):
-        try:
-            os.remove(csv_path)
-            # Оновлена логіка: використовуємо ID постачальника замість назви файлу
-            logging.info(f"✅ Старий прайс-лист від постачальника (ID: {supplier_id}) успішно видалено.")
-        except OSError as e:
-            logging.error(f"❌ Помилка при видаленні старого файлу: {e}")
-            return
-    
-    # 5. Завантаження нового файлу
+    # 4. Умовне завантаження у тимчасовий файл з атомарною заміною
     try:
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(csv_path, 'wb') as f:
-                shutil.copyfileobj(r.raw, f)
-        
-        logging.info(f"🎉 Прайс-лист від постачальника (ID: {supplier_id}) успішно завантажено.")
+        result = download_file_conditional(url, csv_path)
+
+        if result["status"] == "not_modified":
+            logging.info(f"⏭️ Прайс-лист від постачальника (ID: {supplier_id}) не змінився (304 Not Modified).")
+        elif result["status"] == "unchanged":
+            logging.info(f"⏭️ Прайс-лист від постачальника (ID: {supplier_id}) завантажено, але вміст не змінився (SHA-256 збігається).")
+        else:
+            logging.info(f"🎉 Прайс-лист від постачальника (ID: {supplier_id}) успішно завантажено ({result['bytes']} байт).")
+        return result
     except requests.exceptions.RequestException as e:
         logging.error(f"❌ Помилка завантаження файлу від постачальника (ID: {supplier_id}): {e}", exc_info=True)
     except Exception as e:
         logging.error(f"❌ Виникла невідома помилка під час завантаження: {e}", exc_info=True)
 
 # ГОЛОВНА ФУНКЦІЯ 3: Обробка прайсу постачальників
-def process_supplier_1_price_list():
+def process_supplier_1_price_list(force=False):
     """
     Обробляє та очищає прайс-лист від постачальника 1.
     """
@@ -217,6 +213,11 @@ def process_supplier_1_price_list():
         logging.error(f"❌ Файл прайс-листа для постачальника {supplier_id} не знайдено")
         return
 
+    if not force and os.path.exists(csv_mod_path) and source_already_processed(csv_path):
+        logging.info(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився з останньої обробки. Обробку пропущено.")
+        print(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився. Обробку пропущено.")
+        return
+
     logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id}. \n Чорний список брендів: {blacklisted_brands}")
 
     processed_rows = []
@@ -335,6 +336,7 @@ def process_supplier_1_price_list():
             writer.writerows(processed_rows)
             
         logging.info(f"💾 Файл успішно збережено: {csv_mod_path}")
+        mark_source_processed(csv_path)
         
     except Exception as e:
         logging.error(f"❌ Помилка запису файлу {csv_mod_path}: {e}", exc_info=True)
@@ -389,7 +391,7 @@ def process_supplier_1_price_list():
     logging.info(f"🏷️ Видалено через відсутній штрихкод: {skipped_by_empty_barcode}")
 
 # ДОРОБИТИ
-def process_supplier_2_price_list():
+def process_supplier_2_price_list(force=False):
     """
     Обробляє та очищає прайс-лист від постачальника 2.
     """
@@ -417,6 +419,12 @@ def process_supplier_2_price_list():
         logging.error(f"❌ Файл прайс-листа для постачальника {supplier_id} не знайдено за шляхом: {csv_path}")
         return
 
+    # Файл обробляється на місці: позначка з .meta.json стосується завантаженого вмісту
+    if not force and source_already_processed(csv_path):
+        logging.info(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився з останньої обробки. Обробку пропущено.")
+        print(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився. Обробку пропущено.")
+        return
+
     logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id}.")
 
     # 3. Обробка даних
@@ -477,6 +485,7 @@ def process_supplier_2_price_list():
         writer.writerows(processed_rows)
 
     os.replace(temp_file_path, csv_path)
+    mark_source_processed(csv_path)
 
     # 5. Логування підсумків
     logging.info(f"🎉 Обробку прайс-листа для постачальника {supplier_id} завершено.")
@@ -487,7 +496,7 @@ def process_supplier_2_price_list():
     logging.info(f"✅ Оброблені рядки: {len(processed_rows) - 1}")
     print("✅ Обробка прайс-листа завершена. Деталі в лог-файлі.")
 # ДОРОБИТИ
-def process_supplier_3_price_list():
+def process_supplier_3_price_list(force=False):
     """
     Обробляє та конвертує прайс-лист від постачальника 3 (формат .xls),
     а потім фільтрує дані.
@@ -512,6 +521,11 @@ def process_supplier_3_price_list():
     xls_path = os.path.join(base_dir, supplier_info.get("csv_path"))
     csv_name = os.path.join(base_dir, supplier_info.get("csv_name"))
 
+    if not force and os.path.exists(csv_name) and source_already_processed(xls_path):
+        logging.info(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився з останньої обробки. Обробку пропущено.")
+        print(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився. Обробку пропущено.")
+        return
+
     logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id}.")
 
     # 3. Видалення старого CSV-файлу
@@ -600,6 +614,7 @@ def process_supplier_3_price_list():
         writer.writerows(processed_rows)
 
     os.replace(temp_file_path, csv_name)
+    mark_source_processed(xls_path)
 
     # 7. Логування підсумків
     logging.info(f"🎉 Обробку та фільтрацію прайс-листа для постачальника {supplier_id} завершено.")
@@ -1,11 +1,12 @@
-import csv, logging, os, random, time, requests
+import csv, logging, os, requests
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 from scr.oc_base_function import oc_log_message, load_oc_settings, load_attributes_csv, save_attributes_csv, \
                                 load_category_csv, append_new_categories, load_poznachky_csv, clear_directory, \
                                 download_product_images, move_gifs, convert_to_webp_square, sync_webp_column_named, \
                                 copy_to_site, fill_opencart_paths_single_file, get_deepl_usage, translate_text_deepl, \
-                                get_first_sentence, generate_slug, oc_connect_db, get_or_create_manufacturer
+                                get_first_sentence, generate_slug, oc_connect_db, get_or_create_manufacturer, get_supplier_scraper, \
+                                PageNotCachedError, get_product_page_store, get_product_page, harvest_product_pages, find_product_link, \
+                                open_batch_journal, get_image_blob_store
 
 # ОСНОВНА ФУНКЦІЯ 1: Перевірка зміни артикулу і штрихкоду
 def find_change_art_shtrihcod():
@@ -240,11 +241,16 @@ def find_new_products():
         logging.info(f"❌ Виникла непередбачена помилка: {e}")
 
 # ОСНОВНА ФУНКЦІЯ 3: Знаходження урл товару
-def find_product_url():
+def find_product_url(cache_only=False, resume=False, force=False):
     """
     Зчитує файл з новими товарами, переходить за URL-адресою,
     знаходить URL-адресу простого або варіативного товару,
     і записує знайдену URL-адресу в колонку B(1) в тимчасовий файл.
+    Сторінки завантажуються паралельно (блок scraping в oc_settings.yaml) з обмеженням
+    швидкості на хост; рядки записуються у вихідному порядку.
+    Результат кожного рядка одразу пишеться в журнал завдання: після збою resume=True
+    продовжує з місця зупинки без повторних запитів. Рядки, що вже мають 'url_lutsk',
+    пропускаються (force=True — шукати заново).
     """
 
     # --- 1. Ініціалізація логування (підключаємо існуючий лог-файл) ---
@@ -267,6 +273,45 @@ def find_product_url():
     not_found_count = 0
     found_variant_rows = []
     not_found_rows = []
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    journal = open_batch_journal(settings, "find_product_url", resume=resume)
+    already_resolved = 0
+    from_journal = 0
+
+    def _scrape_row(item):
+        """
+        Завантажує сторінку пошуку для рядка; повертає (idx, row, found_url, found_type, error, restored),
+        де restored=True — результат узято з журналу перерваного запуску.
+        """
+        idx, row = item
+        search_url = row.get('search', '').strip()
+        file_sku = row.get('Код_товара', '').strip()
+
+        key = f"{idx}:{file_sku}"
+        # Запит рядка впав у перерваному запуску — повертаємо пошукове посилання з журналу і пробуємо знову
+        if search_url.startswith('Помилка запиту') and key in journal.failed:
+            search_url = journal.data.get(key, {}).get("search_url", "")
+            if search_url:
+                row['search'] = search_url
+        # Якщо URL пустий або вже позначений як помилка запиту, рядок не обробляємо
+        if not search_url or search_url.startswith('Помилка запиту'):
+            return idx, row, None, 'skip', None, False
+        # Рядок уже оброблено в перерваному запуску — беремо результат з журналу
+        if journal.is_done(key):
+            saved = journal.data.get(key, {})
+            return idx, row, saved.get("url"), saved.get("type"), None, True
+        # URL уже знайдено попереднім запуском
+        if not force and (row.get('url_lutsk') or '').strip():
+            return idx, row, None, 'resolved', None, False
+        try:
+            response = scraper.get(search_url)
+        except PageNotCachedError as e:
+            logging.warning(f"Рядок {idx + 2}: {e}")
+            return idx, row, None, 'skip', None, False
+        except requests.RequestException as e:
+            return idx, row, None, None, e, False
+        found_url, found_type = find_product_link(response.text, file_sku, site_url, scraper.parser)
+        return idx, row, found_url, found_type, None, False
 
     try:
         # --- 3. Відкриваємо вхідний файл для читання ---
@@ -291,91 +336,57 @@ def find_product_url():
                 writer = csv.DictWriter(output_file, fieldnames=fieldnames)
                 writer.writeheader() # Автоматично записує рядок заголовків
                 
-                # --- 5. Ітерація по рядках ---
-                for idx, row in enumerate(reader):
+                # --- 5. Паралельна обробка рядків, результати — у порядку вхідного файлу ---
+                for idx, row, found_url, found_type, error, restored in scraper.map_ordered(_scrape_row, enumerate(reader)):
                     total_rows += 1
-                    
-                    # 5.1. Витягуємо дані по назвах колонок
-                    search_url = row.get('search', '').strip()
-                    
-                    file_sku = row.get('Код_товара', '').strip()
 
-                    # --- 6. Перевірка валідності URL ---
-                    if not search_url or search_url.startswith('Помилка запиту'):
+                    if found_type in ('skip', 'resolved'):
+                        if found_type == 'resolved':
+                            already_resolved += 1
                         writer.writerow(row)
                         continue
 
-                    try:
-                        # --- 7. Виконання HTTP-запиту до search_url і парсинг HTML ---
-                        response = requests.get(search_url)
-                        response.raise_for_status()
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        found_type = None  # 'variant' або 'simple'
-                        found_url = None  # сюди запишемо знайдену реальну URL-адресу товару
-                        
-                        # --- 8. Пошук варіативних товарів (input.variant_control[data-code]) ---
-                        # Шукаємо input теги з класом variant_control та атрибутом data-code,
-                        # порівнюємо data-code з file_sku — якщо співпадіння, беремо посилання у батьківському блоці.
-                        variant_inputs = soup.find_all('input', class_='variant_control', attrs={'data-code': True})
-                        for input_tag in variant_inputs:
-                            site_sku = input_tag.get('data-code', '').strip()
-                            if file_sku == site_sku:
-                                parent_div = input_tag.find_parent('div', class_='card-block')
-                                if parent_div:
-                                    link_tag = parent_div.find('h4', class_='card-title').find('a')
-                                    if link_tag and link_tag.has_attr('href'):
-                                        # Формуємо повний URL (додаємо site_url до відносного шляху)
-                                        found_url = site_url + link_tag['href']
-                                        found_type = 'variant'
-                                        break
-
-                        # --- 9. Якщо не знайшли серед варіантів — шукаємо прості товари ---
-                        if not found_url:
-                            # Для простих товарів шукаємо div з класом 'radio', беремо текст як SKU,
-                            # і за таким же підходом знаходимо посилання у блоці card-block.
-                            simple_divs = soup.find_all('div', class_='radio')
-                            for div_tag in simple_divs:
-                                site_sku = div_tag.get_text(strip=True).strip()
-                                if file_sku == site_sku:
-                                    parent_div = div_tag.find_parent('div', class_='card-block')
-                                    if parent_div:
-                                        link_tag = parent_div.find('h4', class_='card-title').find('a')
-                                        if link_tag and link_tag.has_attr('href'):
-                                            found_url = site_url + link_tag['href']
-                                            found_type = 'simple'
-                                            break
-
-                        # --- 10. Запис результату в колонку 'url_lutsk' або логування якщо не знайдено ---
-                        if found_url:
-                            row['url_lutsk'] = found_url
-                            if found_type == 'variant':
-                                found_variant_count += 1
-                                found_variant_rows.append(idx + 2)  # +2, бо рядки CSV рахуються з 1 + заголовок
-                            elif found_type == 'simple':
-                                found_simple_count += 1
-                        else:
-                            not_found_count += 1
-                            not_found_rows.append(idx + 2)
-                        logging.info(f"Рядок {idx + 2}: Знайдено урл: {found_url}")
-                        # Записуємо (знайдений або незмінений) рядок у тимчасовий файл
-                        writer.writerow(row)
+                    if restored:
+                        from_journal += 1
+                    elif error is not None:
+                        # Збій запиту (таймаут, 5xx) — failed: --resume повторить рядок
+                        journal.record([f"{idx}:{row.get('Код_товара', '').strip()}"], "failed", str(error), data={"search_url": row['search']})
+                    else:
+                        # Результат рядка — одразу в журнал (переживає аварійне завершення)
+                        journal.record([f"{idx}:{row.get('Код_товара', '').strip()}"], "done", data={"url": found_url, "type": found_type})
 
-                    except requests.RequestException as e:
-                        # --- 11. Обробка помилок запиту ---
-                        logging.error(f"Рядок {idx + 2}: Помилка при запиті: {e}")
+                    if error is not None:
+                        # --- 6. Обробка помилок запиту ---
+                        logging.error(f"Рядок {idx + 2}: Помилка при запиті: {error}")
                         # Записуємо помилку в колонку 'search', як було раніше
-                        row['search'] = f'Помилка запиту: {e}'
+                        row['search'] = f'Помилка запиту: {error}'
                         writer.writerow(row)
-                    
-                    # --- 12. Додаткова пауза між запитами (рандомізована) для уникнення бана/DDOS ---
-                    time.sleep(random.uniform(1, 3))
+                        continue
+
+                    # --- 7. Запис результату в колонку 'url_lutsk' або логування якщо не знайдено ---
+                    if found_url:
+                        row['url_lutsk'] = found_url
+                        if found_type == 'variant':
+                            found_variant_count += 1
+                            found_variant_rows.append(idx + 2)  # +2, бо рядки CSV рахуються з 1 + заголовок
+                        elif found_type == 'simple':
+                            found_simple_count += 1
+                    else:
+                        not_found_count += 1
+                        not_found_rows.append(idx + 2)
+                    logging.info(f"Рядок {idx + 2}: Знайдено урл: {found_url}")
+                    # Записуємо (знайдений або незмінений) рядок у тимчасовий файл
+                    writer.writerow(row)
   
-        # --- 13. Після успішної обробки: заміна оригінального файлу тимчасовим ---
+        # --- 8. Після успішної обробки: заміна оригінального файлу тимчасовим ---
         os.replace(temp_file_path, supliers_new_path)
+        journal.finish()
 
-        # --- 14. Зведена статистика ---
+        # --- 9. Зведена статистика ---
         logging.info("=== ПІДСУМКОВА ІНФОРМАЦІЯ ===")
         logging.info(f"Всього рядків з товарами: {total_rows}")
+        if already_resolved or from_journal:
+            logging.info(f"Вже мали URL (пропущено): {already_resolved}, відновлено з журналу: {from_journal}")
         logging.info(
             f"Знайдено URL варіативних товарів: {found_variant_count}"
             + (f" (Рядки {', '.join(map(str, found_variant_rows))})" if found_variant_rows else "")
@@ -387,16 +398,49 @@ def find_product_url():
         )
 
     except FileNotFoundError as e:
-        # --- 15. Обробка помилки: вхідний файл не знайдено ---
+        # --- 10. Обробка помилки: вхідний файл не знайдено ---
         logging.error(f"Помилка: Файл не знайдено - {e}")
     except Exception as e:
-        # --- 16. Гарантійне прибирання: видаляємо тимчасовий файл при помилці, щоб не залишити сміття ---
+        # --- 11. Гарантійне прибирання: видаляємо тимчасовий файл при помилці, щоб не залишити сміття ---
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
         logging.error(f"Виникла непередбачена помилка: {e}")
+        logging.info("♻️ Оброблені рядки збережено в журналі — перезапустіть з --resume, щоб продовжити.")
+    finally:
+        scraper.close()
+
+# ОСНОВНА ФУНКЦІЯ 3.1: Збір сторінок товарів (один раз для атрибутів і зображень)
+def harvest_new_product_pages(force=False, cache_only=False):
+    """
+    Один раз завантажує та розбирає сторінки нових товарів (колонка 'url_lutsk')
+    і зберігає характеристики й посилання на зображення у сховищі сторінок.
+    parse_product_attributes та process_phase_1_download далі читають ці записи замість мережі.
+    force=True — зібрати сторінки повторно, навіть якщо вони вже є у сховищі.
+    """
+    oc_log_message()
+    logging.info("▶ ФУНКЦІЯ 3.1. Починаю збір сторінок нових товарів...")
+
+    settings = load_oc_settings()
+    if not settings:
+        logging.error("❌ Не вдалося завантажити налаштування.")
+        return
+    csv_path = settings['paths']['csv_path_new_product']
+
+    items = []
+    try:
+        with open(csv_path, mode='r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                product_url = (row.get('url_lutsk') or '').strip()
+                if product_url and not product_url.startswith('Помилка'):
+                    items.append((product_url, (row.get('sku') or row.get('Код_товара') or '').strip()))
+    except FileNotFoundError as e:
+        logging.error(f"❌ Файл не знайдено - {e}")
+        return
+
+    harvest_product_pages(items, settings, force=force, cache_only=cache_only)
 
 # ОСНОВНА ФУНКЦІЯ 4: Парсинг атрибутів (Перевірити назви товарів!!!)
-def parse_product_attributes():
+def parse_product_attributes(cache_only=False):
     oc_log_message()
     logging.info("▶ ФУНКЦІЯ: Парсинг (Mapping + Auto-suffix |ua + Next Col RU)")
 
@@ -438,6 +482,8 @@ def parse_product_attributes():
 
     new_attributes_counter = {} 
     temp_file_path = supliers_new_path + ".temp"
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)  # спільний кеш сторінок
+    pages = get_product_page_store(settings)  # зібрані сторінки товарів (--harvest-pages)
 
     try:
         with open(supliers_new_path, mode="r", encoding="utf-8") as input_file, \
@@ -467,19 +513,8 @@ def parse_product_attributes():
                     continue
 
                 try:
-                    response = requests.get(product_url, timeout=10)
-                    response.raise_for_status()
-                    soup = BeautifulSoup(response.text, "html.parser")
-
-                    parsed_attributes = {}
-                    characteristics_div = soup.find("div", id="w0-tab0")
-                    if characteristics_div and characteristics_div.find("table"):
-                        for tr in characteristics_div.find("table").find_all("tr"):
-                            cells = tr.find_all("td")
-                            if len(cells) == 2:
-                                key = cells[0].get_text(strip=True).replace(":", "")
-                                value = cells[1].get_text(strip=True)
-                                parsed_attributes[key] = value
+                    # Зібрана сторінка (--harvest-pages) або завантаження з додаванням у сховище
+                    parsed_attributes = get_product_page(product_url, pages, scraper, row.get("sku", ""))["attributes"]
 
                     other_attributes_list = []
 
@@ -567,8 +602,6 @@ def parse_product_attributes():
                     logging.error(f"Помилка URL {product_url}: {e}")
                     writer.writerow(row)
 
-                time.sleep(random.uniform(1, 3))
-
         os.replace(temp_file_path, supliers_new_path)
         logging.info(f"Парсинг завершено. Товарів: {processed_count}")
 
@@ -586,7 +619,10 @@ def parse_product_attributes():
         
     except Exception as e:
         logging.error(f"Критична помилка: {e}")
+        logging.info("♻️ Завантажені сторінки вже у сховищі — повторний запуск не запитуватиме їх знову.")
         if os.path.exists(temp_file_path): os.remove(temp_file_path)
+    finally:
+        scraper.close()
 
 # ОСНОВНА ФУНКЦІЯ 5: Стандартизація атрибутів
 def apply_final_standardization():
@@ -1158,7 +1194,7 @@ def assign_new_sku_to_products():
             os.remove(temp_path)
 
 # ОСНОВНА ФУНКЦІЯ 10: Завантаження зображень
-def process_phase_1_download():
+def process_phase_1_download(cache_only=False):
     """
     ЕТАП 1: 
     1. Очистка папок.
@@ -1183,10 +1219,28 @@ def process_phase_1_download():
     clear_directory(webp_path)
     logging.info("1. ✅ Очистка папок JPG та WEBP завершена.")
 
-    # 2️⃣ Завантаження
+    # 2️⃣ Завантаження (сторінки товарів — через кеш сторінок)
+    #    Товари обробляються паралельно (ліміт запитів — у скрапері), файли — через сховище за хешем вмісту
     rows = []
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    pages = get_product_page_store(settings)
+    blobs = get_image_blob_store(settings)
     fieldnames = []
 
+    def _download_row(row):
+        # 👉 ПРЯМЕ ВИКОРИСТАННЯ НАЗВ КОЛОНОК ТУТ:
+        url = row.get('url_lutsk', '').strip()
+        sku = row.get('sku', '').strip()
+        cat = row.get('category', '').strip()
+
+        if url and sku and cat:
+            # Завантажуємо зображення
+            imgs = download_product_images(url, sku, cat, jpg_path, cat_map, scraper=scraper, blobs=blobs, pages=pages)
+
+            # Записуємо імена файлів у колонку 'img_name_jpg'
+            row['img_name_jpg'] = ', '.join(imgs) if imgs else ''
+        return row
+
     with open(csv_path, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         fieldnames = reader.fieldnames # Отримуємо список заголовків
@@ -1195,21 +1249,9 @@ def process_phase_1_download():
         if 'img_name_jpg' not in fieldnames:
             fieldnames.append('img_name_jpg')
 
-        for row in reader:
-            # 👉 ПРЯМЕ ВИКОРИСТАННЯ НАЗВ КОЛОНОК ТУТ:
-            url = row.get('url_lutsk', '').strip()
-            sku = row.get('sku', '').strip()
-            cat = row.get('category', '').strip()
-
-            if url and sku and cat:
-                # Завантажуємо зображення
-                imgs = download_product_images(url, sku, cat, jpg_path, cat_map)
-                
-                # Записуємо імена файлів у колонку 'img_name_jpg'
-                row['img_name_jpg'] = ', '.join(imgs) if imgs else ''
-            
-            rows.append(row)
-            time.sleep(random.uniform(0.1, 0.5))
+        rows.extend(scraper.map_ordered(_download_row, reader))
+    blobs.save()
+    scraper.close()
 
     # Збереження оновленого CSV
     with open(csv_path, 'w', encoding='utf-8', newline='') as f:
@@ -1245,7 +1287,8 @@ def process_phase_2_finish():
     logging.info("3. ✅ Переміщення GIF завершено.")
 
     # 4️⃣ WEBP
-    convert_to_webp_square(jpg_path, webp_path)
+    convert_to_webp_square(jpg_path, webp_path, settings.get("webp", {}),
+                           settings.get("paths", {}).get("webp_cache", "csv/process/webp_cache"))
     logging.info("4. ✅ Конвертація JPG у WEBP завершена.")
 
     # 5️⃣ Оновлення CSV (викликаємо нову функцію синхронізації)
@@ -1,36 +1,35 @@
 import csv
+import io
 import os
 import time
 import requests
 import shutil
+import glob
 import re
 import pandas as pd
 import random 
 import logging
-from scr.base_function import get_wc_api, load_settings, setup_new_log_file, log_message_to_existing_file, notify_user
-from datetime import datetime, timedelta
-
-
-def export_products():
+import subprocess
+from scr.base_function import get_wc_api, load_settings, setup_new_log_file, log_message_to_existing_file, notify_user, create_http_session, RateLimiter, \
+                             get_state_path, load_json_state, save_json_state, connect_wp_db, \
+                             download_file_conditional, source_already_processed, mark_source_processed, \
+                             inputs_unchanged, save_inputs_fingerprint, file_sha256, \
+                             open_batch_journal, post_batch_with_retry
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+
+
+def _build_export_columns(export_fields):
     """
-    Експорт усіх товарів у CSV пачками по 100, використовуючи поля з налаштувань.
+    Формує список полів для запиту до API, заголовки CSV та перелік мета-полів.
     """
-    setup_new_log_file()
-
-    settings = load_settings()
-    if not settings or "paths" not in settings or "csv_path_zalishki" not in settings["paths"] or "export_fields" not in settings:
-        logging.error("❌ Не знайдено необхідні налаштування (шлях до CSV або поля експорту) в settings.json. Експорт перервано.")
-        return
-
-    csv_path = os.path.join(os.path.dirname(__file__), "..", settings["paths"]["csv_path_zalishki"])
-
-    # Створення списку полів для запиту до API та заголовків для CSV
     api_fields = []
     csv_headers = []
     meta_fields_for_api = []
-    
+
     # Розділяємо поля на стандартні і метадані
-    for field in settings["export_fields"]:
+    for field in export_fields:
         if isinstance(field, str):
             api_fields.append(field)
             csv_headers.append(field)
@@ -41,90 +40,359 @@ def export_products():
             for meta_field in meta_fields_for_api:
                 csv_headers.append(f"Мета: {meta_field}")
 
-    wcapi = get_wc_api(settings)
-    if not wcapi:
-        logging.error("❌ Не вдалося створити об'єкт WooCommerce API. Експорт перервано.")
+    return api_fields, csv_headers, meta_fields_for_api
+
+def _product_to_export_row(product, export_fields, meta_fields_for_api):
+    """
+    Перетворює товар із відповіді API на рядок CSV у порядку export_fields.
+    """
+    row = []
+    # Заповнення рядка стандартними полями
+    for field in export_fields:
+        if isinstance(field, str):
+            if field == "status":
+                row.append("yes" if product.get(field) == "publish" else "no")
+            elif field == "categories":
+                row.append(", ".join([cat["name"] for cat in product.get("categories", [])]))
+            else:
+                row.append(product.get(field, ""))
+        # Заповнення метаданими
+        elif isinstance(field, dict) and "meta_data" in field:
+            meta_data_dict = {m["key"]: m["value"] for m in product.get("meta_data", [])}
+            for meta_field in meta_fields_for_api:
+                row.append(meta_data_dict.get(meta_field, ""))
+    return row
+
+def _fetch_export_page(client, params, page, limiter, timeout):
+    """
+    Завантажує одну сторінку товарів через спільний WooClient. Повертає (товари, заголовки відповіді).
+    """
+    limiter.acquire()
+    response = client.get("products", params={**params, "page": page}, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"Помилка {response.status_code} на сторінці {page}: {response.text[:200]}")
+    return response.json(), response.headers
+
+# --- SQL-БЕКЕНД ЕКСПОРТУ ---
+# Підзапит до wp_postmeta: останнє значення ключа (як у словнику meta_data REST-експорту)
+_SQL_META_VALUE = "(SELECT pm.meta_value FROM wp_postmeta pm WHERE pm.post_id = p.ID AND pm.meta_key = %s ORDER BY pm.meta_id DESC LIMIT 1)"
+
+_SQL_TERMS = """(SELECT GROUP_CONCAT(t.name ORDER BY t.name SEPARATOR 0x1F)
+    FROM wp_term_relationships tr
+    JOIN wp_term_taxonomy tt ON tt.term_taxonomy_id = tr.term_taxonomy_id
+    JOIN wp_terms t ON t.term_id = tt.term_id
+    WHERE tr.object_id = p.ID AND tt.taxonomy = %s)"""
+
+# Поле REST → (SQL-вираз, параметри). Значення приводяться до формату REST у _sql_record_to_product
+_SQL_EXPORT_FIELDS = {
+    "id": ("p.ID", ()),
+    "name": ("p.post_title", ()),
+    "slug": ("p.post_name", ()),
+    "status": ("p.post_status", ()),
+    "menu_order": ("p.menu_order", ()),
+    "date_created": ("DATE_FORMAT(p.post_date, '%%Y-%%m-%%dT%%H:%%i:%%s')", ()),
+    "date_modified": ("DATE_FORMAT(p.post_modified, '%%Y-%%m-%%dT%%H:%%i:%%s')", ()),
+    "sku": (_SQL_META_VALUE, ("_sku",)),
+    "regular_price": (_SQL_META_VALUE, ("_regular_price",)),
+    "sale_price": (_SQL_META_VALUE, ("_sale_price",)),
+    "price": (_SQL_META_VALUE, ("_price",)),
+    "stock_quantity": (_SQL_META_VALUE, ("_stock",)),
+    "stock_status": (_SQL_META_VALUE, ("_stock_status",)),
+    "manage_stock": (_SQL_META_VALUE, ("_manage_stock",)),
+    "tax_status": (_SQL_META_VALUE, ("_tax_status",)),
+    "categories": (_SQL_TERMS, ("product_cat",)),
+    "type": (_SQL_TERMS, ("product_type",)),
+}
+
+def _sql_record_to_product(record, export_fields, meta_fields_for_api):
+    """
+    Приводить рядок SQL-запиту до вигляду товару з REST API,
+    щоб далі використати той самий _product_to_export_row.
+    """
+    product = {}
+    for field in export_fields:
+        if not isinstance(field, str):
+            continue
+        value = record.get(field)
+        if field == "id":
+            value = int(value)
+        elif field == "stock_quantity":
+            # REST повертає ціле число (wc_stock_amount) або null
+            value = int(float(value)) if value not in (None, "") else None
+        elif field == "manage_stock":
+            value = value == "yes"
+        elif field == "stock_status":
+            value = value or "instock"
+        elif field == "tax_status":
+            value = value or "taxable"
+        elif field == "type":
+            value = value or "simple"
+        elif field == "categories":
+            value = [{"name": name} for name in value.split("\x1f")] if value else []
+        elif value is None:
+            value = ""
+        product[field] = value
+
+    product["meta_data"] = [
+        {"key": meta_field, "value": record[f"meta_{i}"]}
+        for i, meta_field in enumerate(meta_fields_for_api)
+        if record.get(f"meta_{i}") is not None
+    ]
+    return product
+
+def _iter_products_sql(settings, export_fields, meta_fields_for_api):
+    """
+    Генератор товарів з бази даних одним потоковим запитом (курсор на боці сервера).
+    Порядок — як у REST за замовчуванням: від найновіших до найстаріших.
+    """
+    unsupported = [f for f in export_fields if isinstance(f, str) and f not in _SQL_EXPORT_FIELDS]
+    if unsupported:
+        raise ValueError(f"Поля не підтримуються SQL-бекендом: {', '.join(unsupported)}")
+
+    db_conf = settings.get("db")
+    if not db_conf:
+        raise ValueError("У settings.json відсутній розділ 'db' з параметрами бази даних")
+
+    columns = []
+    params = []
+    for field in export_fields:
+        if isinstance(field, str):
+            expression, expression_params = _SQL_EXPORT_FIELDS[field]
+            columns.append(f"{expression} AS `{field}`")
+            params.extend(expression_params)
+    for i, meta_field in enumerate(meta_fields_for_api):
+        columns.append(f"{_SQL_META_VALUE} AS `meta_{i}`")
+        params.append(meta_field)
+
+    # WPML: REST повертає товари лише мови за замовчуванням
+    language = settings.get("export", {}).get("sql_language", "uk")
+    wpml_join = ""
+    wpml_where = ""
+    if language:
+        wpml_join = "JOIN wp_icl_translations icl ON icl.element_id = p.ID AND icl.element_type = 'post_product'"
+        wpml_where = "AND icl.language_code = %s"
+        params.append(language)
+
+    sql = f"""
+        SELECT {", ".join(columns)}
+        FROM wp_posts p
+        {wpml_join}
+        WHERE p.post_type = 'product'
+          AND p.post_status NOT IN ('trash', 'auto-draft')
+          {wpml_where}
+        ORDER BY p.post_date DESC, p.ID DESC
+    """
+
+    conn = connect_wp_db(db_conf, streaming=True)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET SESSION group_concat_max_len = 65535")
+            cursor.execute(sql, tuple(params))
+            for record in cursor:
+                yield _sql_record_to_product(record, export_fields, meta_fields_for_api)
+    finally:
+        conn.close()
+
+def _iter_export_pages(client, params, limiter, timeout, workers):
+    """
+    Генератор сторінок товарів у порядку їх номерів:
+    (номер сторінки, товари, X-WP-Total, X-WP-TotalPages).
+    Перша сторінка завантажується окремо, решта — паралельно пулом потоків.
+    """
+    # Перша сторінка одночасно дає і дані, і кількість сторінок
+    products, headers = _fetch_export_page(client, params, 1, limiter, timeout)
+    total_products = int(headers.get("X-WP-Total", 0))
+    total_pages = int(headers.get("X-WP-TotalPages", 1))
+    yield 1, products, total_products, total_pages
+
+    # executor.map повертає результати у порядку сторінок, навіть якщо вони завершились інакше
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages = range(2, total_pages + 1)
+        results = executor.map(
+            lambda p: _fetch_export_page(client, params, p, limiter, timeout), pages
+        )
+        try:
+            for page, (page_products, _) in zip(pages, results):
+                yield page, page_products, total_products, total_pages
+        except BaseException:
+            # Не чекаємо решту сторінок, якщо одна з них завершилась помилкою
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+def export_products(incremental=False, backend="rest"):
+    """
+    Експорт усіх товарів у CSV сторінками по 100, використовуючи поля з налаштувань.
+    Сторінки завантажуються паралельно пулом потоків зі спільною keep-alive сесією,
+    а рядки записуються у порядку сторінок.
+
+    incremental=True — завантажуються лише товари, змінені після попереднього запуску
+    (параметр modified_after), і зливаються за id в існуючий zalishki.csv.
+    Раз на export.full_reconcile_days днів виконується повний експорт, щоб прибрати
+    видалені з сайту товари.
+
+    backend="sql" — повний експорт напряму з бази даних (wp_posts/wp_postmeta) одним
+    потоковим запитом; колонки CSV ті самі, що й у REST-експорті.
+
+    Налаштування (settings.json, блок "export", усі ключі необов'язкові):
+        "workers"              — кількість паралельних запитів (за замовчуванням 4);
+        "max_requests_per_sec" — обмеження швидкості запитів (за замовчуванням 4, 0 — без обмеження);
+        "timeout"              — тайм-аут одного запиту в секундах (за замовчуванням 120);
+        "full_reconcile_days"  — як часто робити повну звірку в інкрементальному режимі (за замовчуванням 7);
+        "watermark_overlap_sec"— запас часу для modified_after (за замовчуванням 300);
+        "sql_language"         — мова WPML для SQL-бекенду (за замовчуванням "uk", "" — без фільтра).
+    Водяний знак зберігається у paths.export_state (за замовчуванням csv/process/export_state.json).
+    """
+    setup_new_log_file()
+
+    settings = load_settings()
+    if not settings or "paths" not in settings or "csv_path_zalishki" not in settings["paths"] or "export_fields" not in settings:
+        logging.error("❌ Не знайдено необхідні налаштування (шлях до CSV або поля експорту) в settings.json. Експорт перервано.")
         return
 
+    csv_path = os.path.join(os.path.dirname(__file__), "..", settings["paths"]["csv_path_zalishki"])
+    temp_path = csv_path + ".temp"
+    state_path = get_state_path(settings, "export_state", "csv/process/export_state.json")
+
+    # Створення списку полів для запиту до API та заголовків для CSV
+    export_fields = settings["export_fields"]
+    api_fields, csv_headers, meta_fields_for_api = _build_export_columns(export_fields)
+
+    export_settings = settings.get("export", {})
+    workers = max(1, int(export_settings.get("workers", 4)))
+    rate_limit = float(export_settings.get("max_requests_per_sec", 4))
+    timeout = int(export_settings.get("timeout", 120))
+    full_reconcile_days = float(export_settings.get("full_reconcile_days", 7))
+    overlap_sec = int(export_settings.get("watermark_overlap_sec", 300))
+
+    params = {"per_page": 100, "_fields": ",".join(api_fields)}
+
+    # --- Вибір режиму: інкрементальний лише якщо є попередній стан і свіжа повна звірка ---
+    state = load_json_state(state_path)
+    mode = "full"
+    if backend == "sql":
+        mode = "sql"
+        if incremental:
+            logging.info("ℹ️ SQL-бекенд завжди виконує повний експорт, параметр --incremental проігноровано.")
+    elif incremental:
+        last_full = state.get("last_full_export")
+        watermark = state.get("modified_after")
+        if not watermark or not last_full:
+            logging.info("ℹ️ Немає збереженого водяного знаку. Виконую повний експорт.")
+        elif not os.path.exists(csv_path):
+            logging.info("ℹ️ Файл залишків відсутній. Виконую повний експорт.")
+        elif "id" not in csv_headers:
+            logging.warning("⚠️ Поле 'id' відсутнє в export_fields — злиття неможливе. Виконую повний експорт.")
+        elif datetime.now(timezone.utc) - datetime.fromisoformat(last_full) >= timedelta(days=full_reconcile_days):
+            logging.info(f"ℹ️ Остання повна звірка була {last_full}. Виконую повний експорт для виявлення видалених товарів.")
+        else:
+            mode = "incremental"
+            since = datetime.fromisoformat(watermark) - timedelta(seconds=overlap_sec)
+            params["modified_after"] = since.strftime("%Y-%m-%dT%H:%M:%S")
+            params["dates_are_gmt"] = "true"
+
+    client = get_wc_api(settings)
+    limiter = RateLimiter(rate_limit)
+
+    run_started = datetime.now(timezone.utc)
     start_time = time.time()
     total_products = 0
     exported_count = 0
     errors = []
 
-    logging.info("🚀 Початок експорту товарів.")
+    logging.info(f"🚀 Початок експорту товарів (режим: {mode}, потоків: {workers}, ліміт: {rate_limit} запит/сек).")
 
-    try:
-        response = wcapi.get("products", params={"per_page": 1})
-        if response.status_code != 200:
-            error_msg = f"Помилка {response.status_code} при підрахунку товарів: {response.text}"
-            print(f"❌ {error_msg}")
-            logging.error(f"❌ {error_msg}")
-            errors.append(error_msg)
-            return
+    def report_progress(page, total_pages):
+        elapsed = int(time.time() - start_time)
+        status_message = f"✅ Вивантажено {exported_count} з {total_products} (сторінка {page}/{total_pages}, {elapsed} сек)"
+        print(status_message)
+        logging.info(status_message)
 
-        total_products = int(response.headers.get("X-WP-Total", 0))
-        logging.info(f"🔎 Загальна кількість товарів: {total_products}")
-
-        with open(csv_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(csv_headers)
-
-            page = 1
-            while exported_count < total_products:
-                response = wcapi.get(
-                    "products",
-                    params={
-                        "per_page": 100,
-                        "page": page,
-                        "_fields": ",".join(api_fields)
-                    }
-                )
+    try:
+        if mode == "sql":
+            with open(temp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(csv_headers)
 
-                if response.status_code != 200:
-                    error_msg = f"Помилка {response.status_code} на сторінці {page}: {response.text}"
-                    print(f"❌ {error_msg}")
-                    logging.error(f"❌ {error_msg}")
-                    errors.append(error_msg)
-                    break
-
-                products = response.json()
-                if not products:
-                    break
-                
+                for product in _iter_products_sql(settings, export_fields, meta_fields_for_api):
+                    writer.writerow(_product_to_export_row(product, export_fields, meta_fields_for_api))
+                    exported_count += 1
+                    if exported_count % 1000 == 0:
+                        status_message = f"✅ Вивантажено з бази {exported_count} товарів ({int(time.time() - start_time)} сек)"
+                        print(status_message)
+                        logging.info(status_message)
+
+            total_products = exported_count
+            os.replace(temp_path, csv_path)
+            state["last_full_export"] = run_started.isoformat()
+        elif mode == "full":
+            with open(temp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(csv_headers)
+
+                for page, products, total_products, total_pages in _iter_export_pages(client, params, limiter, timeout, workers):
+                    if page == 1:
+                        logging.info(f"🔎 Загальна кількість товарів: {total_products}, сторінок: {total_pages}")
+                    for product in products:
+                        writer.writerow(_product_to_export_row(product, export_fields, meta_fields_for_api))
+                        exported_count += 1
+                    report_progress(page, total_pages)
+
+            os.replace(temp_path, csv_path)
+            state["last_full_export"] = run_started.isoformat()
+        else:
+            logging.info(f"🔎 Завантажую товари, змінені після {params['modified_after']} (GMT).")
+            id_index = csv_headers.index("id")
+            changed_rows = {}
+
+            for page, products, total_products, total_pages in _iter_export_pages(client, params, limiter, timeout, workers):
                 for product in products:
-                    row = []
-                    # Заповнення рядка стандартними полями
-                    for field in settings["export_fields"]:
-                        if isinstance(field, str):
-                            if field == "status":
-                                row.append("yes" if product.get(field) == "publish" else "no")
-                            elif field == "categories":
-                                row.append(", ".join([cat["name"] for cat in product.get("categories", [])]))
-                            else:
-                                row.append(product.get(field, ""))
-                        # Заповнення метаданими
-                        elif isinstance(field, dict) and "meta_data" in field:
-                            meta_data_dict = {m["key"]: m["value"] for m in product.get("meta_data", [])}
-                            for meta_field in meta_fields_for_api:
-                                row.append(meta_data_dict.get(meta_field, ""))
-                    
-                    writer.writerow(row)
+                    row = _product_to_export_row(product, export_fields, meta_fields_for_api)
+                    changed_rows[str(row[id_index])] = row
                     exported_count += 1
-                
-                if exported_count % 100 == 0 or exported_count == total_products:
-                    elapsed = int(time.time() - start_time)
-                    status_message = f"✅ Вивантажено {exported_count} з {total_products} ({elapsed} сек)"
-                    print(status_message)
-                    logging.info(status_message)
+                report_progress(page, total_pages)
+
+            # --- Злиття за id з існуючим файлом ---
+            with open(csv_path, "r", newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                existing_headers = next(reader, [])
+                existing_rows = list(reader)
+
+            if existing_headers != csv_headers:
+                raise RuntimeError("Заголовки zalishki.csv не збігаються з export_fields. Потрібен повний експорт.")
+
+            updated_count = 0
+            merged_rows = []
+            for row in existing_rows:
+                product_id = row[id_index] if len(row) > id_index else ""
+                if product_id in changed_rows:
+                    merged_rows.append(changed_rows.pop(product_id))
+                    updated_count += 1
+                else:
+                    merged_rows.append(row)
+
+            # Нові товари — на початок, як у повному експорті (найновіші першими)
+            new_rows = list(changed_rows.values())
+
+            with open(temp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(csv_headers)
+                writer.writerows(new_rows)
+                writer.writerows(merged_rows)
+            os.replace(temp_path, csv_path)
+
+            logging.info(f"🔄 Оновлено рядків: {updated_count}, додано нових товарів: {len(new_rows)}.")
 
-                page += 1
-                time.sleep(1)
+        state["modified_after"] = run_started.isoformat()
+        save_json_state(state_path, state)
 
     except Exception as e:
-        error_msg = f"Виникла невідома помилка під час експорту: {e}"
+        error_msg = f"Виникла помилка під час експорту: {e}"
         print(f"❌ {error_msg}")
         logging.error(f"❌ {error_msg}", exc_info=True)
         errors.append(error_msg)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+            logging.info("🗑️ Неповний тимчасовий файл видалено, попередній файл залишків не змінено.")
     finally:
         end_time = time.time()
         elapsed_time = int(end_time - start_time)
@@ -135,6 +403,7 @@ def export_products():
         
         logging.info("--- Підсумок експорту ---")
         logging.info(f"Статус: {'Успішно' if not errors else 'Завершено з помилками'}")
+        logging.info(f"Режим: {({'incremental': 'інкрементальний', 'sql': 'повний (SQL)'}).get(mode, 'повний')}")
         logging.info(f"Кількість товарів: {exported_count} з {total_products}")
         logging.info(f"Тривалість: {elapsed_time} сек.")
         if errors:
@@ -143,9 +412,34 @@ def export_products():
             for err in errors:
                 logging.info(f"- {err}")
 
+def _download_supplier(supplier_id, supplier_info, session=None):
+    """
+    Завантажує прайс-лист одного постачальника (умовний GET + SHA-256, атомарна заміна).
+    Повертає результат download_file_conditional або піднімає виняток.
+    """
+    base_dir = os.path.join(os.path.dirname(__file__), "..")
+    url = supplier_info.get("download_url")
+    csv_path = supplier_info.get("csv_path")
+
+    if not url or not csv_path:
+        raise ValueError(f"Неповні дані про постачальника '{supplier_id}'. Відсутній URL або шлях.")
+
+    result = download_file_conditional(url, os.path.join(base_dir, csv_path), session=session)
+
+    if result["status"] == "not_modified":
+        logging.info(f"⏭️ Прайс-лист від постачальника (ID: {supplier_id}) не змінився (304 Not Modified).")
+    elif result["status"] == "unchanged":
+        logging.info(f"⏭️ Прайс-лист від постачальника (ID: {supplier_id}) завантажено, але вміст не змінився (SHA-256 збігається).")
+    else:
+        logging.info(f"🎉 Прайс-лист від постачальника (ID: {supplier_id}) успішно завантажено ({result['bytes']} байт).")
+    return result
+
 def download_supplier_price_list(supplier_id):
     """
     Скачує прайс-лист від постачальника за його ID.
+    Використовує умовний GET (ETag / Last-Modified) і порівняння SHA-256:
+    якщо прайс не змінився, файл не перезаписується, а наступні кроки обробки
+    можуть пропустити роботу. Новий файл замінює старий лише після повного завантаження.
     """
     # 0. Налаштування логування для дописування
     log_message_to_existing_file()
@@ -162,388 +456,504 @@ def download_supplier_price_list(supplier_id):
         logging.error(f"❌ Помилка: Інформацію про постачальника з ID '{supplier_id}' не знайдено.")
         return
 
-    # 3. Визначення шляхів
-    base_dir = os.path.join(os.path.dirname(__file__), "..")
-    url = supplier_info.get("download_url")
-    csv_path = os.path.join(base_dir, supplier_info.get("csv_path"))
-
-    if not url or not csv_path:
-        logging.error(f"❌ Неповні дані про постачальника '{supplier_id}'. Відсутній URL або шлях.")
-        return
-    
     logging.info(f"⏳ Запускаю завантаження прайс-листа від постачальника (ID: {supplier_id}).")
 
-    # 4. Видалення старого файлу
-    if os.path.exists(csv_path):
-        try:
-            os.remove(csv_path)
-            # Оновлена логіка: використовуємо ID постачальника замість назви файлу
-            logging.info(f"✅ Старий прайс-лист від постачальника (ID: {supplier_id}) успішно видалено.")
-        except OSError as e:
-            logging.error(f"❌ Помилка при видаленні старого файлу: {e}")
-            return
-    
-    # 5. Завантаження нового файлу
+    # 3. Умовне завантаження у тимчасовий файл з атомарною заміною
     try:
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(csv_path, 'wb') as f:
-                shutil.copyfileobj(r.raw, f)
-        
-        logging.info(f"🎉 Прайс-лист від постачальника (ID: {supplier_id}) успішно завантажено.")
+        return _download_supplier(supplier_id, supplier_info)
     except requests.exceptions.RequestException as e:
         logging.error(f"❌ Помилка завантаження файлу від постачальника (ID: {supplier_id}): {e}", exc_info=True)
     except Exception as e:
-        logging.error(f"❌ Виникла невідома помилка під час завантаження: {e}", exc_info=True)
+        logging.error(f"❌ Виникла помилка під час завантаження прайс-листа (ID: {supplier_id}): {e}", exc_info=True)
 
-def process_supplier_1_price_list():
+def download_all_supplier_price_lists(supplier_ids="all"):
     """
-    Обробляє та очищає прайс-лист від постачальника 1.
+    Паралельно завантажує прайс-листи всіх постачальників з settings["suppliers"]
+    (або лише перелічених через кому ID) в одному процесі зі спільною keep-alive сесією.
+    Кожна відповідь пишеться на диск потоково. В кінці — підсумок по кожному постачальнику:
+    розмір, час і чи змінився файл.
     """
-    # 0. Налаштування логування для дописування
     log_message_to_existing_file()
 
-    # 1. Завантаження налаштувань
     settings = load_settings()
     if not settings:
-        logging.error("❌ Не вдалося завантажити налаштування. Обробка прайс-листа перервана.")
-        return
-
-    supplier_id = "1"
-    supplier_info = settings.get("suppliers", {}).get(supplier_id)
-    if not supplier_info:
-        logging.error(f"❌ Помилка: Інформацію про постачальника з ID '{supplier_id}' не знайдено.")
+        logging.error("❌ Не вдалося завантажити налаштування. Скачування прайс-листів перервано.")
         return
 
-    # 2. Визначення шляхів та параметрів
-    base_dir = os.path.join(os.path.dirname(__file__), "..")
-    csv_path = os.path.join(base_dir, supplier_info.get("csv_path"))
-    delimiter = supplier_info.get("delimiter", ",")
+    suppliers = settings.get("suppliers", {})
+    if supplier_ids == "all":
+        selected = {sid: info for sid, info in suppliers.items() if info.get("download_url")}
+    else:
+        wanted = [sid.strip() for sid in str(supplier_ids).split(",") if sid.strip()]
+        missing = [sid for sid in wanted if sid not in suppliers]
+        if missing:
+            logging.error(f"❌ Постачальників з ID {', '.join(missing)} не знайдено в налаштуваннях.")
+            print(f"❌ Постачальників з ID {', '.join(missing)} не знайдено.")
+            return
+        selected = {sid: suppliers[sid] for sid in wanted}
 
-    if not os.path.exists(csv_path):
-        logging.error(f"❌ Файл прайс-листа для постачальника {supplier_id} не знайдено")
+    if not selected:
+        logging.warning("⚠️ Немає постачальників з download_url для завантаження.")
         return
 
-    logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id}.")
-
-    # 3. Фільтрація та обробка даних
-    words_to_filter_from_name = ["jos", "a-toys"]
-    words_to_filter_from_brand = ["toyfa"]
-
-    temp_file_path = f"{csv_path}.temp"
-    processed_rows = []
-    skipped_rows = 0
-    total_rows = 0
+    logging.info(f"⏳ Паралельне завантаження прайс-листів постачальників: {', '.join(selected)}.")
+    start_time = time.time()
+    results = {}
 
+    session = create_http_session(pool_size=len(selected))
     try:
-        with open(csv_path, "r", newline="", encoding="utf-8") as infile:
-            reader = csv.reader(infile, delimiter=delimiter)
-            headers = next(reader)
-            processed_rows.append(headers)
-            
-            row_number = 1
-            for row in reader:
-                row_number += 1
-                total_rows += 1
-
-                # Перевірка колонки 4 (ціна) на наявність літер
-                if len(row) > 3:
-                    price_value = row[3]
-                    if re.search(r'[a-zA-Z]', price_value):
-                        logging.warning(f"🚫 Видалено рядок {row_number} через наявність літер у колонці 4 (ціна): '{price_value}'.")
-                        skipped_rows += 1
-                        continue
+        with ThreadPoolExecutor(max_workers=len(selected)) as executor:
+            futures = {
+                executor.submit(_download_supplier, sid, info, session): sid
+                for sid, info in selected.items()
+            }
+            for future, sid in futures.items():
+                try:
+                    results[sid] = future.result()
+                except Exception as e:
+                    logging.error(f"❌ Помилка завантаження прайс-листа постачальника (ID: {sid}): {e}", exc_info=True)
+                    results[sid] = {"status": "error", "changed": False, "bytes": 0, "elapsed": 0.0, "error": str(e)}
+    finally:
+        session.close()
+
+    # --- Підсумок ---
+    status_names = {
+        "changed": "змінено",
+        "not_modified": "не змінено (304)",
+        "unchanged": "не змінено (хеш)",
+        "error": "ПОМИЛКА",
+    }
+    logging.info("--- Підсумок завантаження прайс-листів ---")
+    print("--- Підсумок завантаження прайс-листів ---")
+    for sid, result in results.items():
+        line = (f"Постачальник {sid}: {status_names.get(result['status'], result['status'])}, "
+                f"{result['bytes'] / 1024:.1f} КБ, {result['elapsed']:.1f} сек")
+        if result.get("error"):
+            line += f" — {result['error']}"
+        logging.info(line)
+        print(("✅ " if result["status"] != "error" else "❌ ") + line)
+
+    total_elapsed = time.time() - start_time
+    logging.info(f"⏱️ Загальний час: {total_elapsed:.1f} сек.")
+    print(f"⏱️ Загальний час: {total_elapsed:.1f} сек.")
+    return results
+
+def _format_excel_value(value):
+    """
+    Перетворює значення клітинки на рядок так само, як pandas.to_csv:
+    цілі числа без ".0", порожні клітинки — порожній рядок.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+def _unique_excel_headers(headers):
+    """Назви колонок як у pandas.read_excel: 'Unnamed: N' для порожніх, '.1', '.2' для дублікатів."""
+    result = []
+    seen = {}
+    for i, name in enumerate(headers):
+        name = name if name != "" else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        result.append(name)
+    return result
+
+def _iter_spreadsheet_rows(path):
+    """
+    Потоково читає перший аркуш .xls (xlrd) або .xlsx (openpyxl, read_only)
+    і повертає рядки як списки рядків. Перший рядок — заголовки.
+    """
+    if path.lower().endswith(".xlsx"):
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            width = sheet.max_column or 0
+            for i, values in enumerate(sheet.iter_rows(values_only=True)):
+                row = [_format_excel_value(v) for v in values]
+                row += [""] * (width - len(row))
+                yield _unique_excel_headers(row) if i == 0 else row
+        finally:
+            workbook.close()
+        return
 
-                # Фільтрація за колонкою 3 (назва)
-                if len(row) > 2:
-                    product_name = row[2].lower()
-                    if any(word in product_name for word in words_to_filter_from_name):
-                        logging.warning(f"🚫 Видалено рядок {row_number} через заборонене слово в назві ('{row[2]}').")
-                        skipped_rows += 1
+    import xlrd
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for i in range(sheet.nrows):
+            row = []
+            for cell in sheet.row(i):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    row.append(str(xlrd.xldate_as_datetime(cell.value, book.datemode)))
+                elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                    row.append(str(bool(cell.value)))
+                elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                    row.append("")
+                else:
+                    row.append(_format_excel_value(cell.value))
+            yield _unique_excel_headers(row) if i == 0 else row
+    finally:
+        book.release_resources()
+
+# --- ДЕКЛАРАТИВНА НОРМАЛІЗАЦІЯ ПРАЙС-ЛИСТІВ ---
+# Правила за замовчуванням, якщо в settings["suppliers"][ID] немає блоку "rules".
+# Колонки — індекси з нуля. Правила виконуються по черзі для кожного рядка.
+DEFAULT_SUPPLIER_RULES = {
+    "1": [
+        {"type": "drop_if_matches", "column": 3, "pattern": "[a-zA-Z]", "name": "літери в ціні"},
+        {"type": "drop_if_contains", "column": 2, "words": ["jos", "a-toys"], "name": "заборонене слово в назві"},
+        {"type": "drop_if_contains", "column": 7, "words": ["toyfa"], "name": "заборонене слово в бренді"},
+        {"type": "cast_int", "columns": [3], "on_error": "keep", "name": "ціна в ціле число"},
+        {"type": "value_map", "column": 6, "map": {">3": "4"}, "name": "наявність '>3' -> '4'"},
+    ],
+    "2": [
+        {"type": "require_value", "column": 4, "values": ["UAH"], "name": "валюта UAH"},
+        {"type": "cast_int", "columns": [3], "on_error": "keep", "name": "ціна в ціле число"},
+        {"type": "value_map", "column": 6, "map": {">3": "4"}, "name": "наявність '>3' -> '4'"},
+    ],
+    "3": [
+        {"type": "min_columns", "count": 4, "name": "мінімум 4 колонки"},
+        {"type": "cast_int", "columns": [2, 3], "on_error": "drop", "min": 0, "name": "ціле невід'ємне число"},
+    ],
+}
+
+def _rule_name(rule):
+    """Назва правила для логів і лічильників."""
+    if rule.get("name"):
+        return rule["name"]
+    target = rule.get("column", rule.get("columns", rule.get("count", "")))
+    return f"{rule.get('type')}[{target}]"
+
+def _compile_rules(rules):
+    """
+    Перетворює правила з налаштувань на функції rule(row) -> (drop, changed).
+    Невідомий тип правила — ValueError ще до початку обробки.
+    """
+    compiled = []
+    for rule in rules:
+        rule_type = rule.get("type")
+        name = _rule_name(rule)
+
+        if rule_type == "min_columns":
+            def apply(row, count=int(rule["count"])):
+                return len(row) < count, False
+
+        elif rule_type == "drop_if_matches":
+            def apply(row, col=int(rule["column"]), pattern=re.compile(rule["pattern"])):
+                return len(row) > col and bool(pattern.search(row[col])), False
+
+        elif rule_type == "drop_if_contains":
+            def apply(row, col=int(rule["column"]), words=[w.lower() for w in rule["words"]]):
+                if len(row) <= col:
+                    return False, False
+                value = row[col].lower()
+                return any(word in value for word in words), False
+
+        elif rule_type == "require_value":
+            # Рядок без цієї колонки відкидається
+            def apply(row, col=int(rule["column"]), values={v.strip().upper() for v in rule["values"]}):
+                return len(row) <= col or row[col].strip().upper() not in values, False
+
+        elif rule_type == "cast_int":
+            def apply(row, cols=[int(c) for c in rule["columns"]], drop_on_error=rule.get("on_error", "keep") == "drop",
+                      minimum=rule.get("min")):
+                changed = False
+                for col in cols:
+                    if len(row) <= col:
                         continue
-                
-                # Фільтрація за колонкою 8 (бренд)
-                if len(row) > 7:
-                    brand_name = row[7].lower()
-                    if any(word in brand_name for word in words_to_filter_from_brand):
-                        logging.warning(f"🚫 Видалено рядок {row_number} через заборонене слово в бренді ('{row[7]}').")
-                        skipped_rows += 1
+                    value = row[col]
+                    if not value and not drop_on_error:
                         continue
-
-                # Перетворення колонки 4 (ціна) з float на int
-                if len(row) > 3 and row[3]:
                     try:
-                        row[3] = str(int(float(row[3])))
-                    except (ValueError, IndexError):
-                        logging.warning(f"⚠️ Помилка перетворення ціни в рядку {row_number}. Значення: '{row[3]}'")
-                
-                # Заміна значення в колонці 7 (категорія)
-                if len(row) > 6 and row[6] == ">3":
-                    row[6] = "4"
-                
-                processed_rows.append(row)
-    
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час обробки файлу: {e}", exc_info=True)
+                        # float -> int, щоб позбутися ".0"
+                        int_value = int(float(value))
+                    except ValueError:
+                        if drop_on_error:
+                            return True, False
+                        logging.warning(f"⚠️ Помилка перетворення на ціле число. Значення: '{value}'")
+                        continue
+                    if minimum is not None and int_value < minimum:
+                        return True, False
+                    if row[col] != str(int_value):
+                        row[col] = str(int_value)
+                        changed = True
+                return False, changed
+
+        elif rule_type == "value_map":
+            def apply(row, col=int(rule["column"]), mapping=dict(rule["map"])):
+                if len(row) > col and row[col] in mapping:
+                    row[col] = mapping[row[col]]
+                    return False, True
+                return False, False
+
+        else:
+            raise ValueError(f"Невідомий тип правила '{rule_type}' ({name})")
+
+        compiled.append((name, apply))
+    return compiled
+
+def _open_price_list_rows(path, delimiter):
+    """Генератор рядків прайс-листа: таблиця (.xls/.xlsx) або CSV з вказаним роздільником."""
+    if path.lower().endswith((".xls", ".xlsx")):
+        yield from _iter_spreadsheet_rows(path)
         return
+    with open(path, "r", newline="", encoding="utf-8") as infile:
+        yield from csv.reader(infile, delimiter=delimiter)
 
-    # 4. Запис обробленого файлу
-    with open(temp_file_path, "w", newline="", encoding="utf-8") as outfile:
-        writer = csv.writer(outfile, delimiter=delimiter)
-        writer.writerows(processed_rows)
-
-    os.replace(temp_file_path, csv_path)
-
-    # 5. Логування підсумків
-    logging.info(f"🎉 Обробку прайс-листа для постачальника {supplier_id} завершено.")
-    logging.info(f"--- Підсумок обробки: ---")
-    logging.info(f"📦 Всього рядків у файлі: {total_rows}")
-    logging.info(f"🗑️ Видалено рядків: {skipped_rows}")
-    logging.info(f"✅ Оброблені рядки: {len(processed_rows) - 1}")
-
-def process_supplier_2_price_list():
+def normalize_supplier_price_list(supplier_id, force=False):
     """
-    Обробляє та очищає прайс-лист від постачальника 2.
+    Обробляє прайс-лист постачальника за правилами з settings["suppliers"][ID]["rules"]
+    (або DEFAULT_SUPPLIER_RULES) за один потоковий прохід з обмеженою пам'яттю.
+
+    Джерело — csv_path (CSV з роздільником delimiter або .xls/.xlsx).
+    Результат — csv_name, якщо вказано, інакше csv_path перезаписується на місці.
+    Типи правил:
+        min_columns      {"count": 4}                        — відкинути короткі рядки;
+        drop_if_matches  {"column": 3, "pattern": "[a-z]"}   — відкинути, якщо регулярний вираз знайдено;
+        drop_if_contains {"column": 2, "words": ["jos"]}     — відкинути, якщо є слово (без урахування регістру);
+        require_value    {"column": 4, "values": ["UAH"]}    — залишити лише рядки з цими значеннями;
+        cast_int         {"columns": [3], "on_error": "keep"|"drop", "min": 0} — привести до цілого числа;
+        value_map        {"column": 6, "map": {">3": "4"}}   — замінити значення.
+
+    Повертає словник зі статистикою (у тому числі кількість спрацювань кожного правила).
     """
-    # 0. Налаштування логування для дописування
+    # 0. Налаштування логування для дописування (у т.ч. в окремому процесі)
     log_message_to_existing_file()
+    supplier_id = str(supplier_id)
+    stats = {"supplier_id": supplier_id, "status": "error", "total": 0, "written": 0, "dropped": 0,
+             "rules": {}, "elapsed": 0.0}
+    start_time = time.time()
 
     # 1. Завантаження налаштувань
     settings = load_settings()
     if not settings:
         logging.error("❌ Не вдалося завантажити налаштування. Обробка прайс-листа перервана.")
-        return
+        return stats
 
-    supplier_id = "2"
     supplier_info = settings.get("suppliers", {}).get(supplier_id)
     if not supplier_info:
         logging.error(f"❌ Помилка: Інформацію про постачальника з ID '{supplier_id}' не знайдено.")
-        return
+        return stats
+
+    rules = supplier_info.get("rules", DEFAULT_SUPPLIER_RULES.get(supplier_id))
+    if rules is None:
+        logging.error(f"❌ Для постачальника {supplier_id} не задано правил обробки (suppliers.{supplier_id}.rules).")
+        return stats
 
     # 2. Визначення шляхів та параметрів
     base_dir = os.path.join(os.path.dirname(__file__), "..")
-    csv_path = os.path.join(base_dir, supplier_info.get("csv_path"))
+    source_path = os.path.join(base_dir, supplier_info.get("csv_path"))
+    output_path = os.path.join(base_dir, supplier_info.get("csv_name") or supplier_info.get("csv_path"))
     delimiter = supplier_info.get("delimiter", ",")
+    in_place = os.path.abspath(source_path) == os.path.abspath(output_path)
+    cache_dir = os.path.join(base_dir, settings.get("paths", {}).get("supplier_cache_dir", "csv/process/cache"))
 
-    if not os.path.exists(csv_path):
-        logging.error(f"❌ Файл прайс-листа для постачальника {supplier_id} не знайдено за шляхом: {csv_path}")
-        return
-
-    logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id}.")
+    if not os.path.exists(source_path):
+        logging.error(f"❌ Файл прайс-листа для постачальника {supplier_id} не знайдено за шляхом: {source_path}")
+        return stats
 
-    # 3. Обробка даних
-    temp_file_path = f"{csv_path}.temp"
-    processed_rows = []
-    skipped_rows = 0
-    total_rows = 0
-    modifications_count = 0
+    if not force and os.path.exists(output_path) and source_already_processed(source_path):
+        logging.info(f"⏭️ Прайс-лист постачальника {supplier_id} не змінився з останньої обробки. Обробку пропущено.")
+        stats["status"] = "skipped"
+        return stats
 
     try:
-        with open(csv_path, "r", newline="", encoding="utf-8") as infile:
-            reader = csv.reader(infile, delimiter=delimiter)
-            try:
-                headers = next(reader)
-                processed_rows.append(headers)
-            except StopIteration:
+        compiled_rules = _compile_rules(rules)
+    except (KeyError, ValueError, re.error) as e:
+        logging.error(f"❌ Некоректні правила обробки постачальника {supplier_id}: {e}")
+        return stats
+
+    logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id} ({len(compiled_rules)} правил).")
+    temp_file_path = f"{output_path}.temp"
+
+    # 3. Кеш результату за хешем джерела (лише коли джерело не перезаписується на місці)
+    cache_path = None
+    if not in_place:
+        source_hash = file_sha256(source_path)
+        cache_path = os.path.join(cache_dir, f"supplier_{supplier_id}_{source_hash[:16]}.csv")
+        if not force and os.path.exists(cache_path):
+            shutil.copyfile(cache_path, temp_file_path)
+            os.replace(temp_file_path, output_path)
+            mark_source_processed(source_path)
+            logging.info(f"♻️ Прайс-лист постачальника {supplier_id} взято з кешу ({os.path.basename(cache_path)}).")
+            stats.update(status="cached", elapsed=time.time() - start_time)
+            return stats
+
+    # 4. Один потоковий прохід: читання -> правила -> запис
+    rule_hits = {name: 0 for name, _ in compiled_rules}
+    try:
+        with open(temp_file_path, "w", newline="", encoding="utf-8") as outfile:
+            writer = csv.writer(outfile, delimiter=delimiter)
+            rows = _open_price_list_rows(source_path, delimiter)
+
+            headers = next(rows, None)
+            if headers is None:
                 logging.warning("⚠️ Файл порожній. Відсутні рядки.")
-                return
+                return stats
+            writer.writerow(headers)
 
             row_number = 1
-            for row in reader:
+            for row in rows:
                 row_number += 1
-                total_rows += 1
-
-                # Перевірка колонки 5 (валюта)
-                if len(row) > 4:
-                    currency_value = row[4].strip().upper()
-                    if currency_value != "UAH":
-                        logging.warning(f"🚫 Видалено рядок {row_number} через некоректну валюту у колонці 5: '{row[4]}'.")
-                        skipped_rows += 1
-                        continue
-                else:
-                    logging.warning(f"🚫 Видалено рядок {row_number} через відсутність значення у колонці 5 (валюта).")
-                    skipped_rows += 1
+                stats["total"] += 1
+
+                dropped_by = None
+                for name, apply in compiled_rules:
+                    drop, changed = apply(row)
+                    if drop:
+                        dropped_by = name
+                        rule_hits[name] += 1
+                        break
+                    if changed:
+                        rule_hits[name] += 1
+
+                if dropped_by:
+                    logging.warning(f"🚫 Видалено рядок {row_number} (правило: {dropped_by}).")
+                    stats["dropped"] += 1
                     continue
 
-                # Перетворення колонки 4 (ціна) з float на int
-                if len(row) > 3 and row[3]:
-                    try:
-                        row[3] = str(int(float(row[3])))
-                    except (ValueError, IndexError):
-                        logging.warning(f"⚠️ Помилка перетворення ціни в рядку {row_number}. Значення: '{row[3]}'")
-                
-                # Заміна значення в колонці 7 (категорія)
-                if len(row) > 6 and row[6] == ">3":
-                    row[6] = "4"
-                    modifications_count += 1
-                
-                processed_rows.append(row)
-    
+                writer.writerow(row)
+                stats["written"] += 1
+
+        os.replace(temp_file_path, output_path)
+
+    except ImportError as e:
+        msg = f"❌ Не встановлена бібліотека для читання таблиць: {e}."
+        logging.critical(msg)
+        print(f"{msg}\nВстанови її командою:\n  pip install xlrd openpyxl")
+        return stats
     except Exception as e:
         logging.error(f"❌ Виникла помилка під час обробки файлу: {e}", exc_info=True)
-        return
+        return stats
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+    mark_source_processed(source_path)
 
-    # 4. Запис обробленого файлу
-    with open(temp_file_path, "w", newline="", encoding="utf-8") as outfile:
-        writer = csv.writer(outfile, delimiter=delimiter)
-        writer.writerows(processed_rows)
+    # 5. Збереження в кеш (залишаємо лише кілька останніх версій)
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            shutil.copyfile(output_path, cache_path)
+            cached = sorted(
+                glob.glob(os.path.join(cache_dir, f"supplier_{supplier_id}_*.csv")),
+                key=os.path.getmtime, reverse=True
+            )
+            for old_path in cached[3:]:
+                os.remove(old_path)
+        except OSError as e:
+            logging.warning(f"⚠️ Не вдалося оновити кеш прайс-листа: {e}")
 
-    os.replace(temp_file_path, csv_path)
+    stats.update(status="processed", rules=rule_hits, elapsed=time.time() - start_time)
 
-    # 5. Логування підсумків
+    # 6. Логування підсумків
     logging.info(f"🎉 Обробку прайс-листа для постачальника {supplier_id} завершено.")
     logging.info("--- Підсумок обробки: ---")
-    logging.info(f"📦 Всього рядків у файлі: {total_rows}")
-    logging.info(f"🗑️ Видалено рядків: {skipped_rows}")
-    logging.info(f"📝 Змінено категорій '>3' -> '4': {modifications_count} разів")
-    logging.info(f"✅ Оброблені рядки: {len(processed_rows) - 1}")
-    print("✅ Обробка прайс-листа завершена. Деталі в лог-файлі.")
+    logging.info(f"📦 Всього рядків у файлі: {stats['total']}")
+    logging.info(f"🗑️ Видалено рядків: {stats['dropped']}")
+    logging.info(f"✅ Оброблені рядки: {stats['written']}")
+    for name, hits in rule_hits.items():
+        logging.info(f"   📏 {name}: {hits}")
+    return stats
+
+def _print_normalize_stats(stats):
+    """Короткий підсумок обробки одного постачальника в консоль."""
+    if stats["status"] == "skipped":
+        print(f"⏭️ Постачальник {stats['supplier_id']}: прайс-лист не змінився, обробку пропущено.")
+    elif stats["status"] == "cached":
+        print(f"♻️ Постачальник {stats['supplier_id']}: результат взято з кешу.")
+    elif stats["status"] == "processed":
+        hits = ", ".join(f"{name}: {count}" for name, count in stats["rules"].items())
+        print(f"✅ Постачальник {stats['supplier_id']}: {stats['written']} з {stats['total']} рядків "
+              f"({stats['elapsed']:.1f} сек). Правила — {hits}")
+    else:
+        print(f"❌ Постачальник {stats['supplier_id']}: помилка обробки. Деталі в лог-файлі.")
 
-def process_supplier_3_price_list():
+def normalize_all_suppliers(supplier_ids="all", force=False):
     """
-    Обробляє та конвертує прайс-лист від постачальника 3 (формат .xls),
-    а потім фільтрує дані.
+    Обробляє прайс-листи кількох постачальників паралельно в окремих процесах.
+    "all" — усі постачальники, для яких є правила (у settings або DEFAULT_SUPPLIER_RULES).
     """
-    # 0. Налаштування логування для дописування
     log_message_to_existing_file()
-
-    # 1. Завантаження налаштувань
     settings = load_settings()
     if not settings:
-        logging.error("❌ Не вдалося завантажити налаштування. Обробка прайс-листа перервана.")
-        return
-
-    supplier_id = "3"
-    supplier_info = settings.get("suppliers", {}).get(supplier_id)
-    if not supplier_info:
-        logging.error(f"❌ Помилка: Інформацію про постачальника з ID '{supplier_id}' не знайдено.")
-        return
-
-    # 2. Визначення шляхів
-    base_dir = os.path.join(os.path.dirname(__file__), "..")
-    xls_path = os.path.join(base_dir, supplier_info.get("csv_path"))
-    csv_name = os.path.join(base_dir, supplier_info.get("csv_name"))
-
-    logging.info(f"⚙️ Запускаю обробку прайс-листа для постачальника {supplier_id}.")
-
-    # 3. Видалення старого CSV-файлу
-    if os.path.exists(csv_name):
-        try:
-            os.remove(csv_name)
-            logging.info(f"✅ Старий прайс-лист для постачальника {supplier_id} успішно видалено.")
-        except OSError as e:
-            logging.error(f"❌ Помилка при видаленні старого CSV-файлу: {e}")
-            return
-
-    # 4. Конвертація XLS в CSV
-    if not os.path.exists(xls_path):
-        logging.error(f"❌ Файл .xls для постачальника {supplier_id} не знайдено за шляхом: {xls_path}")
+        logging.error("❌ Не вдалося завантажити налаштування. Обробка прайс-листів перервана.")
         return
 
-    try:
-        df = pd.read_excel(xls_path)
-        df.to_csv(csv_name, index=False, encoding="utf-8")
-        
-        logging.info(f"🎉 Файл .xls для постачальника {supplier_id} успішно конвертовано в CSV.")
+    suppliers = settings.get("suppliers", {})
+    if supplier_ids == "all":
+        selected = [sid for sid, info in suppliers.items() if "rules" in info or sid in DEFAULT_SUPPLIER_RULES]
+    else:
+        selected = [sid.strip() for sid in str(supplier_ids).split(",") if sid.strip()]
 
-    except Exception as e:
-        logging.error(f"❌ Помилка під час конвертації файлу: {e}", exc_info=True)
+    if not selected:
+        logging.warning("⚠️ Немає постачальників з правилами обробки.")
         return
 
-    # 5. Фільтрація та очищення CSV-файлу
-    logging.info(f"🔍 Запускаю фільтрацію даних у CSV-файлі постачальника {supplier_id}.")
-
-    temp_file_path = f"{csv_name}.temp"
-    processed_rows = []
-    skipped_rows = 0
-    total_rows = 0
-
-    try:
-        with open(csv_name, "r", newline="", encoding="utf-8") as infile:
-            reader = csv.reader(infile)
+    logging.info(f"⚙️ Паралельна обробка прайс-листів постачальників: {', '.join(selected)}.")
+    start_time = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=len(selected)) as executor:
+        futures = [executor.submit(normalize_supplier_price_list, sid, force) for sid in selected]
+        for sid, future in zip(selected, futures):
             try:
-                headers = next(reader)
-                processed_rows.append(headers)
-            except StopIteration:
-                logging.warning("⚠️ Файл порожній. Відсутні рядки.")
-                return
-            
-            row_number = 1
-            for row in reader:
-                row_number += 1
-                total_rows += 1
-
-                # Перевірка, що рядок містить достатньо колонок
-                if len(row) < 4:
-                    logging.warning(f"🚫 Видалено рядок {row_number} через недостатню кількість колонок.")
-                    skipped_rows += 1
-                    continue
-
-                # Перетворення колонок 3 та 4 на цілі числа
-                is_valid = True
-                for col_index in [2, 3]:
-                    value = row[col_index]
-                    try:
-                        # Перетворюємо значення на float, а потім на int, щоб позбутися .0
-                        int_value = int(float(value))
-                        if int_value < 0:
-                            logging.warning(f"🚫 Видалено рядок {row_number} через від'ємне значення в колонці {col_index + 1}: '{value}'.")
-                            is_valid = False
-                            break
-                        # Записуємо оброблене ціле значення назад у рядок
-                        row[col_index] = str(int_value) 
-                    except (ValueError, IndexError):
-                        logging.warning(f"🚫 Видалено рядок {row_number} через некоректне числове значення в колонці {col_index + 1}: '{value}'.")
-                        is_valid = False
-                        break
-
-                if is_valid:
-                    processed_rows.append(row)
-                else:
-                    skipped_rows += 1
-    
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час фільтрації файлу: {e}", exc_info=True)
-        return
-
-    # 6. Запис відфільтрованих даних у файл
-    with open(temp_file_path, "w", newline="", encoding="utf-8") as outfile:
-        writer = csv.writer(outfile)
-        writer.writerows(processed_rows)
-
-    os.replace(temp_file_path, csv_name)
-
-    # 7. Логування підсумків
-    logging.info(f"🎉 Обробку та фільтрацію прайс-листа для постачальника {supplier_id} завершено.")
-    logging.info("--- Підсумок обробки: ---")
-    logging.info(f"📦 Всього рядків у файлі: {total_rows}")
-    logging.info(f"🗑️ Видалено рядків: {skipped_rows}")
-    logging.info(f"✅ Оброблені рядки: {len(processed_rows) - 1}")
-    print("✅ Обробка прайс-листа завершена. Деталі в лог-файлі.")
+                results.append(future.result())
+            except Exception as e:
+                logging.error(f"❌ Помилка обробки прайс-листа постачальника {sid}: {e}", exc_info=True)
+                results.append({"supplier_id": sid, "status": "error"})
+
+    for stats in results:
+        _print_normalize_stats(stats)
+    elapsed = time.time() - start_time
+    logging.info(f"⏱️ Обробку {len(selected)} прайс-листів завершено за {elapsed:.1f} сек.")
+    print(f"⏱️ Загальний час: {elapsed:.1f} сек.")
+    return results
+
+def process_supplier_1_price_list(force=False):
+    """
+    Обробляє та очищає прайс-лист від постачальника 1.
+    """
+    stats = normalize_supplier_price_list("1", force=force)
+    _print_normalize_stats(stats)
+    return stats
 
-def process_and_combine_all_data():
+def process_supplier_2_price_list(force=False):
     """
-    Обробляє прайс-листи та об'єднує дані у зведену таблицю csv/process/zvedena.csv.
+    Обробляє та очищає прайс-лист від постачальника 2.
     """
-    
-    # 0. Початкове налаштування та логування
-    log_message_to_existing_file()
-    logging.info("--- ⚙️ Запускаю повний процес обробки та об'єднання даних... ---")
+    stats = normalize_supplier_price_list("2", force=force)
+    _print_normalize_stats(stats)
+    return stats
 
-    # 1. Завантаження налаштувань та визначення шляхів
-    # Цей блок завантажує файл налаштувань settings.json і визначає всі необхідні шляхи до файлів.
-    settings = load_settings()
-    if not settings:
-        logging.error("❌ Не вдалося завантажити налаштування. Процес перервано.")
-        return
+def process_supplier_3_price_list(force=False):
+    """
+    Обробляє та конвертує прайс-лист від постачальника 3 (формат .xls/.xlsx) в CSV.
+    Результат кешується за SHA-256 вихідного файлу в paths.supplier_cache_dir.
+    """
+    stats = normalize_supplier_price_list("3", force=force)
+    _print_normalize_stats(stats)
+    return stats
 
+# --- ОБ'ЄДНАННЯ ДАНИХ У ЗВЕДЕНУ ТАБЛИЦЮ ---
+def _combine_config(settings):
+    """
+    Шляхи та схема колонок для зведеної таблиці (спільні для обох рушіїв об'єднання).
+    """
     base_dir = os.path.join(os.path.dirname(__file__), "..")
     
     # Використовуємо метод .get() з вкладеними ключами для безпечного доступу
     paths = settings.get("paths", {})
     suppliers = settings.get("suppliers", {})
     
-    log_file_path = os.path.join(base_dir, paths.get("main_log_file"))
     zalishki_path = os.path.join(base_dir, paths.get("csv_path_zalishki"))
     zvedena_path = os.path.join(base_dir, paths.get("csv_path_zvedena"))
     
@@ -585,22 +995,333 @@ def process_and_combine_all_data():
     supplier_4_columns = ["5", "4", "6"]
     supplier_4_match_column = "5"
     zvedena_match_column_4 = "1"
+
+    return {
+        "zalishki_path": zalishki_path,
+        "zvedena_path": zvedena_path,
+        "new_header": new_header,
+        "zalishki_columns": zalishki_columns,
+        "required_files": {
+            "файл залишків": zalishki_path,
+            "прайс-лист постачальника 1": supplier_csv_path_1,
+            "прайс-лист постачальника 2": supplier_csv_path_2,
+            "прайс-лист постачальника 3": supplier_csv_path_3,
+            "прайс-лист постачальника 4": supplier_csv_path_4,
+        },
+        "supplier_list": [
+            ("1", supplier_csv_path_1, supplier_delimiter_1, supplier_1_columns, supplier_1_match_column),
+            ("2", supplier_csv_path_2, supplier_delimiter_2, supplier_2_columns, supplier_2_match_column),
+            ("3", supplier_csv_path_3, supplier_delimiter_3, supplier_3_columns, supplier_3_match_column),
+            ("4", supplier_csv_path_4, supplier_delimiter_4, supplier_4_columns, supplier_4_match_column)
+        ],
+        "suppliers_to_process": [
+            ("1", zvedena_match_column_1),
+            ("2", zvedena_match_column_2),
+            ("3", zvedena_match_column_3),
+            ("4", zvedena_match_column_4)
+        ],
+    }
+
+def _load_supplier_data(supplier_list):
+    """
+    Зчитує прайс-листи постачальників у словники {ключ: [значення колонок]}.
+    Для повторюваних ключів залишається останній рядок.
+    """
+    supplier_data_dict = {}
+    for s_id, path, delimiter, columns, match_col in supplier_list:
+        supplier_data_dict[s_id] = {}
+        with open(path, "r", newline="", encoding="utf-8") as infile:
+            reader = csv.reader(infile, delimiter=delimiter)
+            try:
+                next(reader) 
+            except StopIteration:
+                logging.warning(f"⚠️ Прайс-лист постачальника {s_id} порожній. Пропускаю завантаження.")
+                continue
+            for row in reader:
+                if len(row) > max(int(c) for c in columns):
+                    key = row[int(match_col)].strip()
+                    values = [row[int(c)].strip() for c in columns]
+                    supplier_data_dict[s_id][key] = values
+        logging.info(f"✅ Дані постачальника {s_id} успішно завантажено в пам'ять. Знайдено {len(supplier_data_dict[s_id])} унікальних записів.")
+    return supplier_data_dict
+
+def _read_zalishki_rows(zalishki_path, zalishki_columns):
+    """
+    Зчитує файл залишків і повертає (рядки з потрібними колонками, кількість непорожніх рядків).
+    Рядки з недостатньою кількістю колонок пропускаються з попередженням.
+    """
+    selected_rows = []
+    processed_count = 0
+    with open(zalishki_path, "r", newline="", encoding="utf-8") as infile:
+        reader = csv.reader(infile)
+        try:
+            next(reader)
+        except StopIteration:
+            logging.warning("⚠️ Файл залишків порожній. Зведена таблиця буде створена лише із заголовком.")
+
+        for row in reader:
+            if not row or not any(row):
+                continue
+            processed_count += 1
+            if len(row) > 13:
+                selected_rows.append([row[int(col_index)] for col_index in zalishki_columns])
+            else:
+                logging.warning(f"⚠️ Пропущено рядок {processed_count} через недостатню кількість колонок.")
+    return selected_rows, processed_count
+
+def _combine_rows_python(selected_rows, supplier_data_dict, suppliers_to_process):
+    """
+    Рушій об'єднання "python": построчне злиття та обчислення колонок 23–27.
+    Повертає (відсортовані рядки, {ID постачальника: кількість оновлених рядків}).
+    """
+    updated_counts = {s_id: 0 for s_id, _ in suppliers_to_process}
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+    
+    formula_cols = {
+        'N': 13, 'Q': 16, 'S': 18, 'V': 21,
+        'M': 12, 'P': 15, 'T': 19, 'W': 22,
+        'H': 7,
+        'I': 8,
+        'X': 23,
+        'G': 6,
+        'Y': 24
+    }
+
+    data_rows = []
+    for row_number, new_row in enumerate(selected_rows, start=1):
+        new_row = list(new_row)
+
+        for s_id, match_col in suppliers_to_process:
+            supplier_data = supplier_data_dict.get(s_id, {}).get(new_row[int(match_col)].strip(), ["", "", ""])
+            new_row.extend(supplier_data)
+            if supplier_data and supplier_data[0] != "":
+                updated_counts[s_id] += 1
+
+        # Обчислення для колонки 23
+        quantities_to_compare = []
+        for col_name in ['N', 'Q', 'S', 'V']:
+            try:
+                index = formula_cols[col_name]
+                val = new_row[index].strip()
+                quantities_to_compare.append(int(val) if val else 0)
+            except (KeyError, IndexError):
+                quantities_to_compare.append(0)
+        
+        max_quantity = max(quantities_to_compare) if quantities_to_compare else 0
+        new_row.append(str(max_quantity))
+
+        # Обчислення для колонки 24
+        quantities_for_sum = []
+        valid_quantities_for_min = []
+        
+        for col_name in ['M', 'P', 'T', 'W']:
+            try:
+                index = formula_cols[col_name]
+                val = new_row[index].strip()
+                num_val = int(val) if val else 0
+                quantities_for_sum.append(num_val)
+                if num_val > 0:
+                    valid_quantities_for_min.append(num_val)
+            except (KeyError, IndexError):
+                quantities_for_sum.append(0)
+        
+        if sum(quantities_for_sum) == 0:
+            try:
+                result_24 = new_row[formula_cols['H']]
+            except IndexError:
+                result_24 = "0"
+        else:
+            result_24 = min(valid_quantities_for_min) if valid_quantities_for_min else 0
+        
+        new_row.append(str(result_24))
+
+        # Обчислення для колонки 25
+        try:
+            i_val = new_row[formula_cols['I']].strip().lower()
+        except IndexError:
+            i_val = ""
+        
+        result_25 = 1 if i_val == "yes" else 0
+        new_row.append(str(result_25))
+        
+        # Обчислення для колонки 26
+        x_val = 0
+        g_val = 0
+        try:
+            x_val = int(new_row[formula_cols['X']])
+        except (ValueError, IndexError):
+            x_val = 0
+        
+        try:
+            g_val = int(new_row[formula_cols['G']])
+        except (ValueError, IndexError):
+            g_val = 0
+        
+        if (x_val - g_val) == 0:
+            result_26 = 0
+        else:
+            result_26 = 1
+        
+        new_row.append(str(result_26))
+        if debug_enabled:
+            logging.debug(f"рядок {row_number}: X = \"{x_val}\", G = \"{g_val}\". (X - G) = \"{x_val - g_val}\". Результат для колонки 26 = \"{result_26}\"")
+
+        # Обчислення для колонки 27
+        y_val = 0
+        h_val = 0
+        try:
+            y_val = int(new_row[formula_cols['Y']])
+        except (ValueError, IndexError):
+            y_val = 0
+        
+        try:
+            h_val = int(new_row[formula_cols['H']])
+        except (ValueError, IndexError):
+            h_val = 0
+        
+        if (y_val - h_val) == 0:
+            result_27 = 0
+        else:
+            result_27 = 1
+        
+        new_row.append(str(result_27))
+        if debug_enabled:
+            logging.debug(f"рядок {row_number}: Y = \"{y_val}\", H = \"{h_val}\". (Y - H) = \"{y_val - h_val}\". Результат для колонки 27 = \"{result_27}\"")
+
+        data_rows.append(new_row)
+
+    # Сортування за колонкою B (індекс 1)
+    data_rows.sort(key=lambda row: int(row[1]))
+    return data_rows, updated_counts
+
+def _python_int(value, strict):
+    """int(value) як у python-рушії: strict — помилка далі, інакше 0."""
+    try:
+        return int(value)
+    except ValueError:
+        if strict:
+            raise
+        return 0
+
+def _int_series(values, strict):
+    """
+    Векторне перетворення колонки рядків на int64 за правилами Python int().
+    strict=True  — некоректне значення піднімає ValueError (як int(val) без try);
+    strict=False — некоректні та порожні значення стають 0 (як try/except ValueError).
+    Звичайні цілі числа обробляються векторно, решта (рідкісні) — через int().
+    """
+    stripped = values.str.strip()
+    fast = stripped.str.fullmatch(r"[+-]?[0-9]+")
+    result = pd.Series(0, index=values.index, dtype="int64")
+    if fast.any():
+        result[fast] = pd.to_numeric(stripped[fast]).astype("int64")
+    slow = ~fast if strict else ~fast & (stripped != "")
+    if slow.any():
+        result[slow] = values[slow].map(lambda v: _python_int(v, strict)).astype("int64")
+    return result
+
+def _combine_rows_vectorized(selected_rows, supplier_data_dict, suppliers_to_process):
+    """
+    Рушій об'єднання "vectorized": колонкові таблиці pandas, злиття постачальників
+    хеш-пошуком (Series.map) та векторні вирази для колонок 23–27.
+    Результат ідентичний _combine_rows_python.
+    """
+    updated_counts = {s_id: 0 for s_id, _ in suppliers_to_process}
+    if not selected_rows:
+        return [], updated_counts
+
+    df = pd.DataFrame(selected_rows, columns=range(11), dtype=object)
+
+    # Колонки 11–22: по три значення від кожного постачальника
+    next_col = 11
+    for s_id, match_col in suppliers_to_process:
+        lookup = supplier_data_dict.get(s_id, {})
+        keys = df[int(match_col)].str.strip()
+        for j in range(3):
+            df[next_col + j] = keys.map({key: values[j] for key, values in lookup.items()}).fillna("")
+        updated_counts[s_id] = int((df[next_col] != "").sum())
+        next_col += 3
+
+    def as_int(col):
+        # int(val) if val else 0 — значення постачальників уже без пробілів
+        return _int_series(df[col].where(df[col] != "", "0"), strict=True)
+
+    # Колонка 23: максимальна кількість (N, Q, S, V)
+    quantities = pd.concat([as_int(13), as_int(16), as_int(18), as_int(21)], axis=1)
+    max_quantity = quantities.max(axis=1)
+    df[23] = max_quantity.astype(str)
+
+    # Колонка 24: мінімальна додатна ціна (M, P, T, W) або H, якщо всі ціни нульові
+    prices = pd.concat([as_int(12), as_int(15), as_int(19), as_int(22)], axis=1)
+    positive_min = prices.where(prices > 0).min(axis=1).fillna(0).astype("int64").astype(str)
+    df[24] = positive_min.where(prices.sum(axis=1) != 0, df[7])
+
+    # Колонка 25: статус публікації
+    df[25] = (df[8].str.strip().str.lower() == "yes").astype(int).astype(str)
+
+    # Колонки 26 і 27: ознаки зміни кількості та ціни
+    g_val = _int_series(df[6], strict=False)
+    df[26] = (max_quantity != g_val).astype(int).astype(str)
+    y_val = _int_series(df[24], strict=False)
+    h_val = _int_series(df[7], strict=False)
+    df[27] = (y_val != h_val).astype(int).astype(str)
+
+    # Стабільне сортування за колонкою B (індекс 1), як list.sort
+    sort_key = _int_series(df[1], strict=True)
+    df = df.iloc[sort_key.argsort(kind="stable")]
+
+    return df[list(range(28))].values.tolist(), updated_counts
+
+_COMBINE_ENGINES = {
+    "python": _combine_rows_python,
+    "vectorized": _combine_rows_vectorized,
+}
+
+def process_and_combine_all_data(force=False, engine=None):
+    """
+    Обробляє прайс-листи та об'єднує дані у зведену таблицю csv/process/zvedena.csv.
+
+    engine — рушій об'єднання: "python" (построчно) або "vectorized" (pandas).
+    За замовчуванням береться з settings["combine"]["engine"], інакше "python".
+    """
+    
+    # 0. Початкове налаштування та логування
+    log_message_to_existing_file()
+    logging.info("--- ⚙️ Запускаю повний процес обробки та об'єднання даних... ---")
+
+    # 1. Завантаження налаштувань та визначення шляхів
+    # Цей блок завантажує файл налаштувань settings.json і визначає всі необхідні шляхи до файлів.
+    settings = load_settings()
+    if not settings:
+        logging.error("❌ Не вдалося завантажити налаштування. Процес перервано.")
+        return
+
+    engine = engine or settings.get("combine", {}).get("engine", "python")
+    if engine not in _COMBINE_ENGINES:
+        logging.error(f"❌ Невідомий рушій об'єднання '{engine}'. Доступні: {', '.join(_COMBINE_ENGINES)}.")
+        print(f"❌ Невідомий рушій об'єднання '{engine}'.")
+        return
+
+    config = _combine_config(settings)
+    zalishki_path = config["zalishki_path"]
+    zvedena_path = config["zvedena_path"]
     
     # 2. Перевірка наявності всіх необхідних файлів
     # Цей блок перевіряє, чи існують усі файли, перш ніж почати обробку.
-    required_files = {
-        "файл залишків": zalishki_path,
-        "прайс-лист постачальника 1": supplier_csv_path_1,
-        "прайс-лист постачальника 2": supplier_csv_path_2,
-        "прайс-лист постачальника 3": supplier_csv_path_3,
-        "прайс-лист постачальника 4": supplier_csv_path_4,
-    }
+    required_files = config["required_files"]
 
     for file_name, path in required_files.items():
         if not path or not os.path.exists(path):
             logging.error(f"❌ Не знайдено {file_name} за шляхом: {path}. Процес зупинено.")
             print(f"❌ Не знайдено {file_name}.")
             return
+
+    # Якщо жоден вхідний файл не змінився з минулого об'єднання — зведена таблиця актуальна
+    input_paths = list(required_files.values())
+    if not force and inputs_unchanged(zvedena_path, input_paths):
+        logging.info("⏭️ Вхідні файли не змінилися з минулого об'єднання. Зведену таблицю не перебудовано.")
+        print("⏭️ Вхідні файли не змінилися. Зведена таблиця актуальна.")
+        return
     
     # 3. Видалення старого зведеного файлу (якщо існує)
     if os.path.exists(zvedena_path):
@@ -614,225 +1335,168 @@ def process_and_combine_all_data():
     
     # 4. Завантаження даних постачальників у словники для швидкого доступу
     # Кожен файл постачальника зчитується в пам'ять, щоб прискорити процес обробки.
-    supplier_data_dict = {}
-    supplier_list = [
-        ("1", supplier_csv_path_1, supplier_delimiter_1, supplier_1_columns, supplier_1_match_column),
-        ("2", supplier_csv_path_2, supplier_delimiter_2, supplier_2_columns, supplier_2_match_column),
-        ("3", supplier_csv_path_3, supplier_delimiter_3, supplier_3_columns, supplier_3_match_column),
-        ("4", supplier_csv_path_4, supplier_delimiter_4, supplier_4_columns, supplier_4_match_column)
-    ]
-    
-    for s_id, path, delimiter, columns, match_col in supplier_list:
-        try:
-            supplier_data_dict[s_id] = {}
-            with open(path, "r", newline="", encoding="utf-8") as infile:
-                reader = csv.reader(infile, delimiter=delimiter)
-                try:
-                    next(reader) 
-                except StopIteration:
-                    logging.warning(f"⚠️ Прайс-лист постачальника {s_id} порожній. Пропускаю завантаження.")
-                    continue
-                for row in reader:
-                    if len(row) > max(int(c) for c in columns):
-                        key = row[int(match_col)].strip()
-                        values = [row[int(c)].strip() for c in columns]
-                        supplier_data_dict[s_id][key] = values
-            logging.info(f"✅ Дані постачальника {s_id} успішно завантажено в пам'ять. Знайдено {len(supplier_data_dict[s_id])} унікальних записів.")
-        except Exception as e:
-            logging.error(f"❌ Помилка при читанні прайс-листа постачальника {s_id}: {e}", exc_info=True)
-            print(f"❌ Помилка при читанні прайс-листа постачальника {s_id}: {e}")
-            return
+    try:
+        supplier_data_dict = _load_supplier_data(config["supplier_list"])
+    except Exception as e:
+        logging.error(f"❌ Помилка при читанні прайс-листів постачальників: {e}", exc_info=True)
+        print(f"❌ Помилка при читанні прайс-листів постачальників: {e}")
+        return
 
     # 5. Обробка основного файлу залишків та об'єднання даних
-    # Цей блок читає основний файл, додає до кожного рядка дані від постачальників
-    # та обчислює нові колонки, ігноруючи порожні або пошкоджені рядки.
-    processed_rows = []
-    processed_count = 0
-    updated_by_s1_count = 0
-    updated_by_s2_count = 0
-    updated_by_s3_count = 0
-    updated_by_s4_count = 0
-    
-    formula_cols = {
-        'N': 13, 'Q': 16, 'S': 18, 'V': 21,
-        'M': 12, 'P': 15, 'T': 19, 'W': 22,
-        'H': 7,
-        'I': 8,
-        'X': 23,
-        'G': 6,
-        'Y': 24
-    }
-    
-    suppliers_to_process = [
-        ("1", zvedena_match_column_1, updated_by_s1_count),
-        ("2", zvedena_match_column_2, updated_by_s2_count),
-        ("3", zvedena_match_column_3, updated_by_s3_count),
-        ("4", zvedena_match_column_4, updated_by_s4_count)
-    ]
-
+    # Цей блок читає основний файл, додає до кожного рядка дані від постачальників,
+    # обчислює нові колонки та сортує результат обраним рушієм.
+    start_time = time.time()
     try:
-        with open(zalishki_path, "r", newline="", encoding="utf-8") as infile:
-            reader = csv.reader(infile)
-            try:
-                next(reader)
-            except StopIteration:
-                logging.warning("⚠️ Файл залишків порожній. Зведена таблиця буде створена лише із заголовком.")
-                
-            processed_rows.append(new_header)
-            
-            for row in reader:
-                if not row or not any(row):
-                    continue
-                
-                processed_count += 1
-                if len(row) > 13:
-                    new_row = [row[int(col_index)] for col_index in zalishki_columns]
-                    
-                    for s_id, match_col, counter in suppliers_to_process:
-                        supplier_data = supplier_data_dict.get(s_id, {}).get(new_row[int(match_col)].strip(), ["", "", ""])
-                        new_row.extend(supplier_data)
-                        if supplier_data and supplier_data[0] != "":
-                            if s_id == "1": updated_by_s1_count += 1
-                            elif s_id == "2": updated_by_s2_count += 1
-                            elif s_id == "3": updated_by_s3_count += 1
-                            elif s_id == "4": updated_by_s4_count += 1
-
-                    # Обчислення для колонки 23
-                    quantities_to_compare = []
-                    for col_name in ['N', 'Q', 'S', 'V']:
-                        try:
-                            index = formula_cols[col_name]
-                            val = new_row[index].strip()
-                            quantities_to_compare.append(int(val) if val else 0)
-                        except (KeyError, IndexError):
-                            quantities_to_compare.append(0)
-                    
-                    max_quantity = max(quantities_to_compare) if quantities_to_compare else 0
-                    new_row.append(str(max_quantity))
-
-                    # Обчислення для колонки 24
-                    quantities_for_sum = []
-                    valid_quantities_for_min = []
-                    
-                    for col_name in ['M', 'P', 'T', 'W']:
-                        try:
-                            index = formula_cols[col_name]
-                            val = new_row[index].strip()
-                            num_val = int(val) if val else 0
-                            quantities_for_sum.append(num_val)
-                            if num_val > 0:
-                                valid_quantities_for_min.append(num_val)
-                        except (KeyError, IndexError):
-                            quantities_for_sum.append(0)
-                    
-                    if sum(quantities_for_sum) == 0:
-                        try:
-                            result_24 = new_row[formula_cols['H']]
-                        except IndexError:
-                            result_24 = "0"
-                    else:
-                        result_24 = min(valid_quantities_for_min) if valid_quantities_for_min else 0
-                    
-                    new_row.append(str(result_24))
-
-                    # Обчислення для колонки 25
-                    try:
-                        i_val = new_row[formula_cols['I']].strip().lower()
-                    except IndexError:
-                        i_val = ""
-                    
-                    result_25 = 1 if i_val == "yes" else 0
-                    new_row.append(str(result_25))
-                    
-                    # Обчислення для колонки 26
-                    x_val = 0
-                    g_val = 0
-                    try:
-                        x_val = int(new_row[formula_cols['X']])
-                    except (ValueError, IndexError):
-                        x_val = 0
-                    
-                    try:
-                        g_val = int(new_row[formula_cols['G']])
-                    except (ValueError, IndexError):
-                        g_val = 0
-                    
-                    if (x_val - g_val) == 0:
-                        result_26 = 0
-                    else:
-                        result_26 = 1
-                    
-                    new_row.append(str(result_26))
-                    logging.debug(f"рядок {processed_count}: X = \"{x_val}\", G = \"{g_val}\". (X - G) = \"{x_val - g_val}\". Результат для колонки 26 = \"{result_26}\"")
-
-                    # Обчислення для колонки 27
-                    y_val = 0
-                    h_val = 0
-                    try:
-                        y_val = int(new_row[formula_cols['Y']])
-                    except (ValueError, IndexError):
-                        y_val = 0
-                    
-                    try:
-                        h_val = int(new_row[formula_cols['H']])
-                    except (ValueError, IndexError):
-                        h_val = 0
-                    
-                    if (y_val - h_val) == 0:
-                        result_27 = 0
-                    else:
-                        result_27 = 1
-                    
-                    new_row.append(str(result_27))
-                    logging.debug(f"рядок {processed_count}: Y = \"{y_val}\", H = \"{h_val}\". (Y - H) = \"{y_val - h_val}\". Результат для колонки 27 = \"{result_27}\"")
-                    
-                    processed_rows.append(new_row)
-                else:
-                    logging.warning(f"⚠️ Пропущено рядок {processed_count} через недостатню кількість колонок.")
-    
+        selected_rows, processed_count = _read_zalishki_rows(zalishki_path, config["zalishki_columns"])
+        data_rows, updated_counts = _COMBINE_ENGINES[engine](selected_rows, supplier_data_dict, config["suppliers_to_process"])
     except Exception as e:
         logging.error(f"❌ Виникла помилка під час обробки даних: {e}", exc_info=True)
         print(f"❌ Виникла помилка під час обробки даних: {e}")
         return
+    logging.info(f"⏱️ Рушій '{engine}' об'єднав {len(data_rows)} рядків за {time.time() - start_time:.3f} сек.")
 
-    # 6. Сортування та збереження даних у зведений файл CSV
-    # Цей блок сортує оброблені дані та записує їх у новий файл,
-    # перевіряючи, чи є дані для запису.
+    # 6. Збереження даних у зведений файл CSV
+    # Цей блок записує відсортовані дані у новий файл, перевіряючи, чи є дані для запису.
     try:
-        if len(processed_rows) <= 1:
+        if not data_rows:
             logging.warning("⚠️ Немає даних для запису, крім заголовка.")
             print("⚠️ Немає даних для запису, крім заголовка. Файл не буде створено.")
             return
 
-        # Сортування за колонкою B (індекс 1)
-        # Спочатку видаляємо заголовок, сортуємо, а потім додаємо його назад.
-        header = processed_rows[0]
-        data_rows = processed_rows[1:]
-        data_rows.sort(key=lambda row: int(row[1]))
-        sorted_rows = [header] + data_rows
-
         with open(zvedena_path, "w", newline="", encoding="utf-8") as outfile:
             writer = csv.writer(outfile, delimiter=',')
-            writer.writerows(sorted_rows)
+            writer.writerow(config["new_header"])
+            writer.writerows(data_rows)
+        save_inputs_fingerprint(zvedena_path, input_paths)
 
         logging.info("--- 🎉 Повний процес обробки та об'єднання завершено! ---")
         logging.info("--- Підсумок: ---")
         logging.info(f"📦 Всього рядків у файлі залишків: {processed_count}")
-        logging.info(f"✅ Оновлено даними постачальника 1: {updated_by_s1_count} рядків.")
-        logging.info(f"✅ Оновлено даними постачальника 2: {updated_by_s2_count} рядків.")
-        logging.info(f"✅ Оновлено даними постачальника 3: {updated_by_s3_count} рядків.")
-        logging.info(f"✅ Оновлено даними постачальника 4: {updated_by_s4_count} рядків.")
-        logging.info(f"📄 Створено зведених рядків: {len(processed_rows) - 1}")
+        for s_id, count in updated_counts.items():
+            logging.info(f"✅ Оновлено даними постачальника {s_id}: {count} рядків.")
+        logging.info(f"📄 Створено зведених рядків: {len(data_rows)}")
         print("✅ Повний процес обробки завершено. Деталі в лог-файлі.")
 
     except Exception as e:
         logging.error(f"❌ Помилка при збереженні зведеної таблиці: {e}", exc_info=True)
         print(f"❌ Помилка: {e}")
 
-def prepare_for_website_upload():
+def verify_combine_engines():
+    """
+    Запускає обидва рушії об'єднання на поточних вхідних файлах і порівнює
+    побайтово CSV, який вони б записали. Файл zvedena.csv не змінюється.
+    Повертає True, якщо результати ідентичні.
+    """
+    log_message_to_existing_file()
+    settings = load_settings()
+    if not settings:
+        logging.error("❌ Не вдалося завантажити налаштування. Перевірку перервано.")
+        return False
+
+    config = _combine_config(settings)
+    for file_name, path in config["required_files"].items():
+        if not path or not os.path.exists(path):
+            logging.error(f"❌ Не знайдено {file_name} за шляхом: {path}. Перевірку зупинено.")
+            print(f"❌ Не знайдено {file_name}.")
+            return False
+
+    supplier_data_dict = _load_supplier_data(config["supplier_list"])
+    selected_rows, _ = _read_zalishki_rows(config["zalishki_path"], config["zalishki_columns"])
+
+    outputs = {}
+    for engine, combine in _COMBINE_ENGINES.items():
+        start_time = time.time()
+        data_rows, updated_counts = combine(selected_rows, supplier_data_dict, config["suppliers_to_process"])
+        elapsed = time.time() - start_time
+
+        buffer = io.StringIO(newline="")
+        writer = csv.writer(buffer, delimiter=',')
+        writer.writerow(config["new_header"])
+        writer.writerows(data_rows)
+        outputs[engine] = (buffer.getvalue().encode("utf-8"), updated_counts)
+
+        message = f"⏱️ Рушій '{engine}': {len(data_rows)} рядків за {elapsed:.3f} сек."
+        logging.info(message)
+        print(message)
+
+    (python_bytes, python_counts), (vector_bytes, vector_counts) = outputs["python"], outputs["vectorized"]
+    if python_bytes == vector_bytes and python_counts == vector_counts:
+        message = f"✅ Рушії дають ідентичний результат ({len(python_bytes)} байт)."
+        logging.info(message)
+        print(message)
+        return True
+
+    python_lines = python_bytes.decode("utf-8").splitlines()
+    vector_lines = vector_bytes.decode("utf-8").splitlines()
+    for line_number, (left, right) in enumerate(zip(python_lines, vector_lines), start=1):
+        if left != right:
+            logging.error(f"❌ Перша розбіжність у рядку {line_number}:\n  python:     {left}\n  vectorized: {right}")
+            break
+    else:
+        logging.error(f"❌ Різна кількість рядків: python {len(python_lines)}, vectorized {len(vector_lines)}.")
+    if python_counts != vector_counts:
+        logging.error(f"❌ Різні лічильники оновлень: python {python_counts}, vectorized {vector_counts}.")
+    print("❌ Рушії дають різний результат. Деталі в лог-файлі.")
+    return False
+
+# Можливі знижки (%) та їхні ваги для рандомного вибору
+_DISCOUNT_CHOICES = [0, 2, 3, 5]
+_DISCOUNT_WEIGHTS = [94, 3, 2, 1]
+
+def _prepare_upload_row(row, rng, today_formatted, end_formatted):
     """
-    Готує дані зі зведеної таблиці для завантаження на сайт,
-    виконуючи кожен крок окремо з записом у файл.
+    Перетворює один рядок зведеної таблиці на рядок для сайту за один прохід.
+    Рядок: id, колонки 23–30, sale_price, дата початку, дата кінця, Знижка%.
+    Повертає (рядок або None, причина відсіву: "stock" / "unchanged" / None).
+    """
+    # Копіюємо тільки id та колонки з 23 по 30, додаємо 4 нові колонки
+    new_row = [row[0] if len(row) > 0 else ""]
+    new_row.extend(row[j] if j < len(row) else "" for j in range(23, 31))
+    new_row += [""] * 4
+
+    # Відсіюємо рядки, де в колонці 'stock_status' (індекс 3) стоїть "0"
+    if new_row[3] == "0":
+        return None, "stock"
+
+    # 'Знижка%' (індекс 12): рандомне значення для товарів у наявності дорожчих за 800
+    try:
+        if new_row[1] and float(new_row[1]) > 0 and new_row[2] and float(new_row[2].replace(',', '.')) > 800:
+            new_row[12] = str(rng.choices(_DISCOUNT_CHOICES, weights=_DISCOUNT_WEIGHTS, k=1)[0])
+    except ValueError:
+        pass
+
+    # 'sale_price' (індекс 9) за формулою
+    try:
+        c_val = float(new_row[2].replace(',', '.') if new_row[2] else 0)
+        m_val = float(new_row[12] if new_row[12] else 0)
+        new_row[9] = str(int(round(c_val * (100 - m_val) / 100, 0))) if m_val > 0 else ""
+    except ValueError:
+        new_row[9] = ""
+
+    # Відсіюємо рядки без акції, де колонки 4 та 5 дорівнюють "0"
+    if new_row[9] == "" and new_row[4] == "0" and new_row[5] == "0":
+        return None, "unchanged"
+
+    # Дати акції (індекси 10 та 11)
+    try:
+        if new_row[12] and float(new_row[12]) > 0:
+            new_row[10] = today_formatted
+            new_row[11] = end_formatted
+    except ValueError:
+        pass
+
+    return new_row, None
+
+def prepare_for_website_upload(seed=None, debug_csv=None):
+    """
+    Готує дані зі зведеної таблиці для завантаження на сайт за один прохід:
+    zvedena.csv читається потоково, усі перетворення виконуються над рядком у пам'яті,
+    результат одразу пишеться у zalishky.csv та akcii.csv.
+
+    seed      — зерно генератора знижок (для відтворюваних запусків);
+                за замовчуванням settings["prepare_upload"]["seed"], інакше випадкове.
+    debug_csv — також записати проміжний na_sait.csv для налагодження;
+                за замовчуванням settings["prepare_upload"]["write_debug_csv"] (False).
     """
     # 0. Налаштування логування для дописування
     log_message_to_existing_file()
@@ -841,324 +1505,354 @@ def prepare_for_website_upload():
         logging.error("❌ Не вдалося завантажити налаштування. Процес перервано.")
         return
 
+    prepare_conf = settings.get("prepare_upload", {})
+    if seed is None:
+        seed = prepare_conf.get("seed")
+    if debug_csv is None:
+        debug_csv = prepare_conf.get("write_debug_csv", False)
+    rng = random.Random(seed)
+
     base_dir = os.path.join(os.path.dirname(__file__), "..")
     source_file_path = os.path.join(base_dir, settings["paths"]["csv_path_zvedena"])
     intermediate_file_path = os.path.join(base_dir, "csv", "process", "na_sait.csv")
+    zalishky_output_path = os.path.join(base_dir, "csv", "output", "zalishky.csv")
+    akcii_output_path = os.path.join(base_dir, "csv", "output", "akcii.csv")
+    output_paths = [zalishky_output_path, akcii_output_path] + ([intermediate_file_path] if debug_csv else [])
     
-    logging.info("⚙️ Запускаю підготовку даних для сайту...")
+    logging.info(f"⚙️ Запускаю підготовку даних для сайту (seed: {seed if seed is not None else 'випадковий'})...")
 
-    # Крок 1: Очищаємо проміжний файл na_sait.csv
-    try:
-        logging.info("⚙️ Крок 1: Очищаю файл 'na_sait.csv'...")
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as f:
-            pass
-        logging.info("✅ Файл 'na_sait.csv' успішно очищено.")
-    except Exception as e:
-        logging.error(f"❌ Помилка при очищенні файлу {os.path.basename(intermediate_file_path)}: {e}")
-        return
+    today = datetime.now()
+    seven_days_later = today + timedelta(days=9) # Тут змінюється кількість днів
+    today_formatted = today.strftime("%Y-%m-%dT00:00:00")
+    seven_days_later_formatted = seven_days_later.strftime("%Y-%m-%dT00:00:00")
+
+    # Визначаємо колонки для кожного файлу
+    zalishky_cols = [0, 1, 2]  # ID, stock_quantity, regular_price
+    akcii_cols = [0, 9, 10, 11] # ID, sale_price, sale_price_dates_from, sale_price_dates_to
+    # Використовуємо коректні назви заголовків для акцій
+    akcii_header = ["id", "sale_price", "date_on_sale_from", "date_on_sale_to"]
 
-    # Крок 2: Копіюємо необхідні колонки, включаючи id (колонка 0), замість SKU
+    stats = {"read": 0, "stock": 0, "unchanged": 0, "discounted": 0, "zalishky": 0, "akcii": 0}
+    start_time = time.time()
+    debug_outfile = None
     try:
-        logging.info("⚙️ Крок 2: Копіюю дані зі 'zvedena.csv'...")
         with open(source_file_path, 'r', newline='', encoding='utf-8') as infile, \
-             open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            
+             open(zalishky_output_path + ".temp", 'w', newline='', encoding='utf-8') as zalishky_outfile, \
+             open(akcii_output_path + ".temp", 'w', newline='', encoding='utf-8') as akcii_outfile:
+
             reader = csv.reader(infile)
-            writer = csv.writer(outfile)
-            
             try:
                 header = next(reader)
-                
-                # Замінюємо копіювання SKU (колонка 1) на ID (колонка 0)
-                columns_to_copy = [0] + list(range(23, min(31, len(header))))
-                new_header = [header[i] for i in columns_to_copy]
-                writer.writerow(new_header)
             except StopIteration:
                 logging.error("❌ Помилка: Вхідний файл порожній.")
                 return
-            
-            copied_count = 0
-            for row in reader:
-                # Копіюємо тільки id та колонки з 23 по 30
-                selected_columns = [row[0]] if len(row) > 0 else [""]
-                
-                for j in range(23, 31):
-                    if j < len(row):
-                        selected_columns.append(row[j])
-                    else:
-                        selected_columns.append("")
-                
-                if len(selected_columns) > 1:
-                    writer.writerow(selected_columns)
-                    copied_count += 1
-        
-        logging.info(f"✅ Крок 2 завершено. Скопійовано {copied_count} рядків.")
-    except FileNotFoundError:
-        logging.error(f"❌ Помилка: Вхідний файл {os.path.basename(source_file_path)} не знайдено.")
-        return
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час копіювання: {e}")
-        return
 
-    # Крок 3: Додаємо 4 нові колонки з назвами в кінець
-    try:
-        logging.info("⚙️ Крок 3: Додаю 4 нові колонки...")
-        with open(intermediate_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            rows = list(reader)
-        
-        new_header = header + ["sale_price", "sale_price_dates_from", "sale_price_dates_to", "Знижка%"]
-        
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(new_header)
-            for row in rows:
-                row += [""] * 4
-                writer.writerow(row)
-        
-        logging.info(f"✅ Крок 3 завершено. Додано 4 нові колонки. Рядків у файлі: {len(rows)}",)
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час додавання колонок: {e}")
-        return
+            # Заголовок: id, колонки 23–30 зведеної таблиці та 4 нові колонки
+            new_header = [header[i] for i in [0] + list(range(23, min(31, len(header))))]
+            new_header += ["sale_price", "sale_price_dates_from", "sale_price_dates_to", "Знижка%"]
 
-    # Крок 4: Видаляємо всі рядки, де в колонці з індексом 3 стоїть "0"
-    try:
-        logging.info("⚙️ Крок 4: Видаляю рядки з нульовими значеннями...")
-        with open(intermediate_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            rows = list(reader)
-
-        original_count = len(rows)
-        # Колонка 'stock_status' тепер має індекс 3 (раніше була 25)
-        filtered_rows = [row for row in rows if len(row) > 3 and row[3] != "0"]
-        deleted_count = original_count - len(filtered_rows)
-
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(header)
-            writer.writerows(filtered_rows)
-        
-        logging.info(f"✅ Крок 4 завершено. Видалено {deleted_count} рядків. Залишилось {len(filtered_rows)}.")
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час видалення рядків: {e}")
-        return
+            zalishky_writer = csv.writer(zalishky_outfile)
+            zalishky_writer.writerow([new_header[i] for i in zalishky_cols])
+            akcii_writer = csv.writer(akcii_outfile)
+            akcii_writer.writerow(akcii_header)
 
-    # Крок 5: Заповнюємо колонку з індексом 12 ("Знижка%") рандомними значеннями
-    try:
-        logging.info("⚙️ Крок 5: Заповнюю колонку 12 рандомними значеннями...")
-        with open(intermediate_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            rows = list(reader)
-        
-        random_choices = [0, 2, 3, 5]
-        weights = [94, 3, 2, 1]
-        
-        updated_count = 0
-        for row in rows:
-            try:
-                # 'stock_quantity' тепер індекс 1, 'regular_price' - індекс 2
-                if len(row) > 2 and row[1] and float(row[1]) > 0 and row[2] and float(row[2].replace(',', '.')) > 800:
-                    random_value = random.choices(random_choices, weights=weights, k=1)[0]
-                    # 'Знижка%' тепер індекс 12
-                    if len(row) > 12:
-                        row[12] = str(random_value)
-                        if random_value > 0:
-                            updated_count += 1
-            except (ValueError, IndexError):
-                continue
-        
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(header)
-            writer.writerows(rows)
-            
-        logging.info(f"✅ Крок 5 завершено. Успішно заповнено {updated_count} рядків.")
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час заповнення: {e}")
-        return
+            debug_writer = None
+            if debug_csv:
+                debug_outfile = open(intermediate_file_path + ".temp", 'w', newline='', encoding='utf-8')
+                debug_writer = csv.writer(debug_outfile)
+                debug_writer.writerow(new_header)
 
-    # Крок 6: Заповнюємо колонку з індексом 9 ("sale_price") за формулою
-    try:
-        logging.info("⚙️ Крок 6: Заповнюю колонку 9 за формулою...")
-        with open(intermediate_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            rows = list(reader)
+            for row in reader:
+                stats["read"] += 1
+                new_row, dropped = _prepare_upload_row(row, rng, today_formatted, seven_days_later_formatted)
+                if dropped:
+                    stats[dropped] += 1
+                    continue
 
-        updated_count = 0
-        for row in rows:
-            try:
-                # 'regular_price' тепер індекс 2, 'Знижка%' - індекс 12
-                c_val = float(row[2].replace(',', '.') if len(row) > 2 and row[2] else 0)
-                m_val = float(row[12] if len(row) > 12 and row[12] else 0)
-                
-                if m_val > 0:
-                    result = round(c_val * (100 - m_val) / 100, 0)
-                    # 'sale_price' тепер індекс 9
-                    if len(row) > 9:
-                        row[9] = str(int(result))
-                        updated_count += 1
-                else:
-                    if len(row) > 9:
-                        row[9] = ""
-            except (ValueError, IndexError):
-                if len(row) > 9:
-                    row[9] = ""
-                continue
-        
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(header)
-            writer.writerows(rows)
-            
-        logging.info(f"✅ Крок 6 завершено. Заповнено {updated_count} рядків.")
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час заповнення колонки 9: {e}")
-        return
+                if new_row[10]:
+                    stats["discounted"] += 1
+                if debug_writer:
+                    debug_writer.writerow(new_row)
 
-    # Крок 7: Видаляємо рядки, де колонка 9 пуста, а 4 та 5 дорівнюють "0"
-    try:
-        logging.info("⚙️ Крок 7: Видаляю рядки, де колонка 9 пуста, а 4 і 5 дорівнюють '0'...")
-        with open(intermediate_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            rows = list(reader)
-        
-        original_count = len(rows)
-        
-        filtered_rows = []
-        for row in rows:
-            # 'sale_price' тепер індекс 9, а 'tax_class' та 'visibility' - індекси 4 та 5
-            if not (len(row) > 9 and row[9] == "" and len(row) > 5 and row[4] == "0" and row[5] == "0"):
-                filtered_rows.append(row)
-        
-        deleted_count = original_count - len(filtered_rows)
+                # Дані в файл залишків
+                zalishky_writer.writerow([new_row[i] for i in zalishky_cols])
+                stats["zalishky"] += 1
 
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(header)
-            writer.writerows(filtered_rows)
+                # Дані в файл акцій, тільки якщо є значення в колонці sale_price
+                if new_row[9]:
+                    akcii_writer.writerow([new_row[i] for i in akcii_cols])
+                    stats["akcii"] += 1
 
-        logging.info(f"✅ Крок 7 завершено. Видалено {deleted_count} рядків. Залишилось {len(filtered_rows)}.")
+        if debug_outfile:
+            debug_outfile.close()
+        for path in output_paths:
+            os.replace(path + ".temp", path)
+    except FileNotFoundError:
+        logging.error(f"❌ Помилка: Вхідний файл {os.path.basename(source_file_path)} не знайдено.")
+        return
     except Exception as e:
-        logging.error(f"❌ Виникла помилка під час видалення рядків: {e}")
+        logging.error(f"❌ Виникла помилка під час підготовки даних: {e}", exc_info=True)
         return
+    finally:
+        if debug_outfile and not debug_outfile.closed:
+            debug_outfile.close()
+        for path in output_paths:
+            if os.path.exists(path + ".temp"):
+                os.remove(path + ".temp")
+
+    logging.info(f"✅ Прочитано {stats['read']} рядків зі зведеної таблиці за {time.time() - start_time:.2f} сек.")
+    logging.info(f"🗑️ Відсіяно: не в наявності — {stats['stock']}, без змін — {stats['unchanged']}.")
+    logging.info(f"🏷️ Знижку призначено {stats['discounted']} товарам.")
+    logging.info(f"✅ Створено 'zalishky.csv' ({stats['zalishky']} рядків) та 'akcii.csv' ({stats['akcii']} рядків).")
+    if debug_csv:
+        logging.info(f"📝 Проміжний файл для налагодження: {os.path.basename(intermediate_file_path)}")
+    logging.info("🎉 Підготовка даних для сайту завершена!")
+    print("✅ Підготовка даних для сайту завершена.")
 
-    # Крок 8: Додаємо дати в колонки 10 та 11
-    try:
-        logging.info("⚙️ Крок 8: Додаю дати в колонки 10 та 11...")
-        with open(intermediate_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            header = next(reader)
-            rows = list(reader)
+# --- SQL-БЕКЕНД ОНОВЛЕННЯ ЗАЛИШКІВ ТА ЦІН ---
+# Мета-поля, які створюються, якщо у товару їх ще немає: (значення з тимчасової таблиці, умова).
+# Залишок і статус — лише для товарів з _manage_stock = 'yes', як і при оновленні через REST.
+_SQL_STOCK_META = {
+    "_stock": ("t.stock_quantity", "t.manage_stock = 1"),
+    "_stock_status": ("t.stock_status", "t.manage_stock = 1"),
+    "_regular_price": ("t.regular_price", "1 = 1"),
+}
+
+def _sql_table_prefix(settings) -> str:
+    """Префікс таблиць WordPress з settings["db"]["table_prefix"] (за замовчуванням wp_)."""
+    prefix = settings.get("db", {}).get("table_prefix", "wp_")
+    if not re.fullmatch(r"\w+", prefix):
+        raise ValueError(f"Некоректний db.table_prefix: {prefix!r}")
+    return prefix
+
+def _sql_price(value) -> str:
+    """Ціна для мета-поля без втрати точності: '12345.670' → '12345.67', '1234567.0' → '1234567'."""
+    price = Decimal(str(value).strip().replace(",", "."))
+    if not price.is_finite():
+        raise ValueError(f"Некоректна ціна: {value!r}")
+    text = format(price, "f")
+    return text.rstrip("0").rstrip(".") if "." in text else text
+
+def _invalidate_product_transients(cursor, prefix: str = "wp_"):
+    """
+    Скидає транзієнти списків товарів WooCommerce у базі (в межах тієї ж транзакції):
+    нова product-transient-version робить недійсними кешовані запити, wc_products_onsale — видаляється.
+    """
+    cursor.execute(
+        f"UPDATE {prefix}options SET option_value = %s WHERE option_name = '_transient_product-transient-version'",
+        (str(int(time.time())),)
+    )
+    cursor.execute(
+        f"DELETE FROM {prefix}options WHERE option_name IN ('_transient_wc_products_onsale', '_transient_timeout_wc_products_onsale')"
+    )
+
+def _invalidate_object_cache(settings, product_ids):
+    """
+    Очищає об'єктний кеш і транзієнти кожного товару через WP-CLI
+    (clean_post_cache + wc_delete_product_transients), якщо задано settings["sql_update"]["wp_path"].
+    Викликається після коміту, тому помилки WP-CLI (немає wp, таймаут sql_update.wp_cli_timeout,
+    за замовчуванням 300 сек.) лише логуються — оновлення в базі вже збережено.
+    """
+    sql_conf = settings.get("sql_update", {})
+    wp_path = sql_conf.get("wp_path")
+    timeout = float(sql_conf.get("wp_cli_timeout", 300))
+    if not wp_path:
+        logging.warning("⚠️ sql_update.wp_path не задано — об'єктний кеш WordPress не очищено (лише транзієнти в базі).")
+        return
 
-        today = datetime.now()
-        seven_days_later = today + timedelta(days=9) # Тут змінюється кількість днів
-        
-        today_formatted = today.strftime("%Y-%m-%dT00:00:00")
-        seven_days_later_formatted = seven_days_later.strftime("%Y-%m-%dT00:00:00")
-        
-        updated_count = 0
-        for row in rows:
-            try:
-                # 'Знижка%' тепер індекс 12
-                if len(row) > 12 and row[12] and float(row[12]) > 0:
-                    # Нові колонки 'sale_price_dates_from' та 'sale_price_dates_to' - індекси 10 та 11
-                    if len(row) > 10:
-                        row[10] = today_formatted
-                    if len(row) > 11:
-                        row[11] = seven_days_later_formatted
-                    updated_count += 1
-            except (ValueError, IndexError):
-                continue
+    CHUNK = 500
+    for i in range(0, len(product_ids), CHUNK):
+        ids = ",".join(str(int(pid)) for pid in product_ids[i:i + CHUNK])
+        php = f"foreach ([{ids}] as $id) {{ clean_post_cache($id); wc_delete_product_transients($id); }}"
+        try:
+            result = subprocess.run(["wp", f"--path={wp_path}", "eval", php], capture_output=True, text=True, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.error(f"❌ WP-CLI не зміг очистити кеш товарів: {e}")
+            return
+        if result.returncode != 0:
+            logging.error(f"❌ WP-CLI не зміг очистити кеш товарів: {result.stderr.strip()[:300]}")
+            return
+    logging.info(f"🧹 Об'єктний кеш та транзієнти очищено для {len(product_ids)} товарів.")
 
-        with open(intermediate_file_path, 'w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(header)
-            writer.writerows(rows)
-        
-        logging.info(f"✅ Крок 8 завершено. Дати додано до {updated_count} рядків.")
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час додавання дат: {e}")
-        return
-        
-    # Крок 9: Розділяємо дані на два вихідні файли
+def _update_stock_prices_sql(settings, rows):
+    """
+    Оновлює _stock, _stock_status, _regular_price та _price напряму в базі WordPress:
+    рядки завантажуються у тимчасову таблицю, далі — кілька set-based UPDATE ... JOIN
+    у {prefix}postmeta та wc_product_meta_lookup в одній транзакції.
+    ID, яких уже немає серед товарів/варіацій у {prefix}posts, відкидаються (без осиротілих мета-записів).
+    _price та wc_product_meta_lookup рахуються як у WooCommerce is_on_sale(): акційна ціна діє,
+    якщо вона нижча за звичайну і поточний час у межах _sale_price_dates_from/_sale_price_dates_to.
+    _stock і _stock_status змінюються лише для товарів з _manage_stock = 'yes'.
+    Залишки та ціни поширюються на WPML-переклади товару (sql_update.propagate_translations, за замовчуванням так).
+    Повертає список ID оновлених товарів (без перекладів).
+    """
+    sql_conf = settings.get("sql_update", {})
+    prefix = _sql_table_prefix(settings)
+    values = []
+    for row in rows:
+        try:
+            stock = int(float(row["stock_quantity"]))
+            price = _sql_price(row["regular_price"])
+            values.append((int(row["id"]), stock, price))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            logging.warning(f"⚠️ ID {row.get('id')}: некоректні stock_quantity/regular_price — пропущено.")
+    if not values:
+        return []
+
+    conn = connect_wp_db(settings["db"])
     try:
-        logging.info("⚙️ Крок 9: Створюю два окремі файли для оновлення...")
-        
-        source_file_path = os.path.join(base_dir, "csv", "process", "na_sait.csv")
-        zalishky_output_path = os.path.join(base_dir, "csv", "output", "zalishky.csv")
-        akcii_output_path = os.path.join(base_dir, "csv", "output", "akcii.csv")
-        
-        # 9.1 Очищаємо вихідні файли
-        with open(zalishky_output_path, 'w', newline='', encoding='utf-8') as f:
-            pass
-        with open(akcii_output_path, 'w', newline='', encoding='utf-8') as f:
-            pass
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TEMPORARY TABLE tmp_stock_update (
+                    product_id BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+                    stock_quantity INT NOT NULL,
+                    regular_price VARCHAR(32) NOT NULL,
+                    stock_status VARCHAR(20) NOT NULL DEFAULT 'instock',
+                    manage_stock TINYINT NOT NULL DEFAULT 0,
+                    active_price VARCHAR(32) NULL,
+                    onsale TINYINT NOT NULL DEFAULT 0
+                )
+            """)
+            CHUNK = 1000
+            for i in range(0, len(values), CHUNK):
+                cursor.executemany(
+                    "INSERT IGNORE INTO tmp_stock_update (product_id, stock_quantity, regular_price) VALUES (%s, %s, %s)",
+                    values[i:i + CHUNK]
+                )
 
-        # 9.2 Копіюємо дані в два окремі файли
-        with open(source_file_path, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            
-            # Визначаємо колонки для кожного файлу
-            zalishky_cols = [0, 1, 2]  # ID, stock_quantity, regular_price
-            akcii_cols = [0, 9, 10, 11] # ID, sale_price, sale_price_dates_from, sale_price_dates_to
+            # Товари, видалені з сайту після експорту, не оновлюємо
+            cursor.execute(f"""
+                DELETE t FROM tmp_stock_update t
+                LEFT JOIN {prefix}posts p ON p.ID = t.product_id AND p.post_type IN ('product', 'product_variation')
+                WHERE p.ID IS NULL
+            """)
+            if cursor.rowcount:
+                logging.warning(f"⚠️ SQL: {cursor.rowcount} ID не знайдено серед товарів сайту — пропущено.")
+            cursor.execute("SELECT product_id FROM tmp_stock_update")
+            updated_ids = [record["product_id"] for record in cursor.fetchall()]
+
+            # WPML: ті самі значення для всіх перекладів товару (MySQL не дозволяє
+            # двічі відкрити тимчасову таблицю в одному запиті, тому через другу таблицю)
+            if sql_conf.get("propagate_translations", True):
+                cursor.execute("CREATE TEMPORARY TABLE tmp_stock_translations LIKE tmp_stock_update")
+                cursor.execute(f"""
+                    INSERT IGNORE INTO tmp_stock_translations (product_id, stock_quantity, regular_price)
+                    SELECT tr2.element_id, t.stock_quantity, t.regular_price
+                    FROM tmp_stock_update t
+                    JOIN {prefix}icl_translations tr1 ON tr1.element_id = t.product_id AND tr1.element_type = 'post_product'
+                    JOIN {prefix}icl_translations tr2 ON tr2.trid = tr1.trid AND tr2.element_id <> tr1.element_id
+                """)
+                cursor.execute("INSERT IGNORE INTO tmp_stock_update SELECT * FROM tmp_stock_translations")
+
+            # Статус наявності як у WooCommerce: 0 і менше — outofstock або onbackorder (якщо дозволено).
+            # Товари без керування запасами (_manage_stock <> 'yes') залишок і статус не змінюють
+            cursor.execute(f"""
+                UPDATE tmp_stock_update t
+                LEFT JOIN {prefix}postmeta ms ON ms.post_id = t.product_id AND ms.meta_key = '_manage_stock'
+                LEFT JOIN {prefix}postmeta bo ON bo.post_id = t.product_id AND bo.meta_key = '_backorders'
+                SET t.manage_stock = (COALESCE(ms.meta_value, 'no') = 'yes'),
+                    t.stock_status = CASE
+                    WHEN t.stock_quantity > 0 THEN 'instock'
+                    WHEN COALESCE(bo.meta_value, 'no') <> 'no' THEN 'onbackorder'
+                    ELSE 'outofstock' END
+            """)
+
+            # Акція активна як у WC_Product::is_on_sale(): ціна задана, нижча за звичайну,
+            # і зараз у межах дат акції (мета-дати — UNIX-час; порожні — без обмеження)
+            cursor.execute(f"""
+                UPDATE tmp_stock_update t
+                LEFT JOIN {prefix}postmeta sp ON sp.post_id = t.product_id AND sp.meta_key = '_sale_price'
+                LEFT JOIN {prefix}postmeta df ON df.post_id = t.product_id AND df.meta_key = '_sale_price_dates_from'
+                LEFT JOIN {prefix}postmeta dt ON dt.post_id = t.product_id AND dt.meta_key = '_sale_price_dates_to'
+                SET t.onsale = (
+                        COALESCE(sp.meta_value, '') <> ''
+                        AND CAST(sp.meta_value AS DECIMAL(19, 4)) < CAST(t.regular_price AS DECIMAL(19, 4))
+                        AND (COALESCE(df.meta_value, '') = '' OR CAST(df.meta_value AS UNSIGNED) <= UNIX_TIMESTAMP())
+                        AND (COALESCE(dt.meta_value, '') = '' OR CAST(dt.meta_value AS UNSIGNED) >= UNIX_TIMESTAMP())
+                    ),
+                    t.active_price = sp.meta_value
+            """)
+            cursor.execute("UPDATE tmp_stock_update SET active_price = IF(onsale = 1, active_price, regular_price)")
+
+            for meta_key, (source, condition) in _SQL_STOCK_META.items():
+                cursor.execute(f"""
+                    UPDATE {prefix}postmeta pm
+                    JOIN tmp_stock_update t ON t.product_id = pm.post_id
+                    SET pm.meta_value = {source}
+                    WHERE pm.meta_key = %s AND {condition}
+                """, (meta_key,))
+                cursor.execute(f"""
+                    INSERT INTO {prefix}postmeta (post_id, meta_key, meta_value)
+                    SELECT t.product_id, %s, {source}
+                    FROM tmp_stock_update t
+                    WHERE {condition}
+                      AND NOT EXISTS (SELECT 1 FROM {prefix}postmeta pm WHERE pm.post_id = t.product_id AND pm.meta_key = %s)
+                """, (meta_key, meta_key))
+
+            # Активна ціна: акційна, якщо акція діє зараз, інакше звичайна
+            cursor.execute(f"""
+                UPDATE {prefix}postmeta pm
+                JOIN tmp_stock_update t ON t.product_id = pm.post_id
+                SET pm.meta_value = t.active_price
+                WHERE pm.meta_key = '_price'
+            """)
+
+            # Таблиця пошуку WooCommerce (фільтри, сортування за ціною, наявність)
+            cursor.execute(f"""
+                UPDATE {prefix}wc_product_meta_lookup l
+                JOIN tmp_stock_update t ON t.product_id = l.product_id
+                SET l.stock_quantity = IF(t.manage_stock = 1, t.stock_quantity, l.stock_quantity),
+                    l.stock_status = IF(t.manage_stock = 1, t.stock_status, l.stock_status),
+                    l.onsale = t.onsale,
+                    l.min_price = t.active_price,
+                    l.max_price = t.active_price
+            """)
+
+            # Дата зміни — щоб інкрементальний експорт (modified_after) побачив ці товари
+            cursor.execute(f"""
+                UPDATE {prefix}posts p
+                JOIN tmp_stock_update t ON t.product_id = p.ID
+                SET p.post_modified = NOW(), p.post_modified_gmt = UTC_TIMESTAMP()
+            """)
+
+            cursor.execute("SELECT product_id FROM tmp_stock_update")
+            product_ids = [record["product_id"] for record in cursor.fetchall()]
+
+            _invalidate_product_transients(cursor, prefix)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-            try:
-                header = next(reader)
-            except StopIteration:
-                logging.error("❌ Помилка: Вхідний файл 'na_sait.csv' порожній.")
-                return
+    # Об'єктний кеш скидаємо після коміту, інакше WordPress може прочитати старі значення
+    _invalidate_object_cache(settings, product_ids)
+    logging.info(f"✅ SQL: оновлено {len(updated_ids)} товарів (разом з перекладами — {len(product_ids)} записів).")
+    return updated_ids
 
-            zalishky_header = [header[i] for i in zalishky_cols]
-            
-            # Використовуємо коректні назви заголовків для акцій
-            akcii_header = ["id", "sale_price", "date_on_sale_from", "date_on_sale_to"]
-
-            with open(zalishky_output_path, 'w', newline='', encoding='utf-8') as zalishky_outfile:
-                zalishky_writer = csv.writer(zalishky_outfile)
-                zalishky_writer.writerow(zalishky_header)
-                
-                with open(akcii_output_path, 'w', newline='', encoding='utf-8') as akcii_outfile:
-                    akcii_writer = csv.writer(akcii_outfile)
-                    akcii_writer.writerow(akcii_header)
-
-                    copied_zalishky_count = 0
-                    copied_akcii_count = 0
-                    
-                    for row in reader:
-                        # Копіюємо дані в файл залишків
-                        zalishky_row = [row[i] for i in zalishky_cols]
-                        zalishky_writer.writerow(zalishky_row)
-                        copied_zalishky_count += 1
-                        
-                        # Копіюємо дані в файл акцій, тільки якщо є значення в колонці sale_price
-                        # 'sale_price' тепер індекс 9
-                        if len(row) > 9 and row[9]:
-                            akcii_row = [row[i] for i in akcii_cols]
-                            akcii_writer.writerow(akcii_row)
-                            copied_akcii_count += 1
-        
-        logging.info(f"✅ Крок 9 завершено. Створено 'zalishky.csv' ({copied_zalishky_count} рядків) та 'akcii.csv' ({copied_akcii_count} рядків).")
-    except FileNotFoundError:
-        logging.error("❌ Помилка: Вхідний файл 'na_sait.csv' не знайдено.")
-        return
-    except Exception as e:
-        logging.error(f"❌ Виникла помилка під час створення вихідних файлів: {e}")
-        return
-
-    logging.info("🎉 Підготовка даних для сайту завершена!")
-    print("✅ Підготовка даних для сайту завершена.")
+def _post_update_batch(client, payloads, timeout, retry_conf, label):
+    """
+    Відправляє один пакет оновлень на /products/batch з повторами та поділом пакета.
+    Повертає (список результатів post_batch_with_retry, тривалість у секундах).
+    """
+    start_time = time.time()
+    outcomes = post_batch_with_retry(lambda items: client.post("products/batch", {"update": items}, timeout=timeout),
+                                     payloads, retry_conf, label=label)
+    return outcomes, time.time() - start_time
 
-def update_products(update_type):
+def update_products(update_type, force=False, resume=False, backend="rest"):
     """
     Оновлює залишки, ціни або акції товарів на сайті, використовуючи API.
     Тип оновлення залежить від вхідного аргументу:
     1: Оновлює залишки та ціни з файлу zalishky.csv.
     2: Оновлює акційні ціни з файлу akcii.csv.
+
+    Надсилаються лише рядки, значення яких відрізняються від останнього успішно
+    відправленого стану (знімок у paths.push_snapshot). force=True — надіслати все.
+    Результат кожного товару пишеться в журнал завдання; resume=True продовжує
+    перерване оновлення, пропускаючи вже відправлені товари.
+    backend="sql" (лише для типу 1) — запис залишків і цін напряму в базу однією транзакцією.
     """
     # 0. Налаштування логування для дописування
     log_message_to_existing_file()
@@ -1168,8 +1862,12 @@ def update_products(update_type):
         print("❌ Неможливо завантажити налаштування. Перевірте файл.")
         return
 
-    # Забезпечуємо таймаут для всіх запитів POST до WooCommerce API
-    WOO_API_TIMEOUT = 300 # Таймаут в секундах
+    # Параметри пакетного оновлення (settings["update"])
+    update_conf = settings.get("update", {})
+    WOO_API_TIMEOUT = update_conf.get("timeout", 300) # Таймаут в секундах
+    batch_size = max(1, min(100, int(update_conf.get("batch_size", 100))))
+    max_in_flight = max(1, int(update_conf.get("max_in_flight", 4)))
+    slow_response_sec = float(update_conf.get("slow_response_sec", 30))
 
     base_dir = "/var/www/scripts/update/csv/output"
 
@@ -1188,6 +1886,12 @@ def update_products(update_type):
         print(error_msg)
         return
 
+    if backend == "sql" and update_type != '1':
+        error_msg = "❌ SQL-бекенд підтримує лише оновлення залишків і цін (--update-products 1)."
+        logging.error(error_msg)
+        print(error_msg)
+        return
+
     url = settings.get("url")
     consumer_key = settings.get("consumer_key")
     consumer_secret = settings.get("consumer_secret")
@@ -1198,14 +1902,23 @@ def update_products(update_type):
         print(f"❌ {error_msg}")
         return
 
-    api_url = f"{url}/wp-json/wc/v3/products/batch"
+    # Знімок останнього успішно відправленого стану: {тип оновлення: {id: {поле: значення}}}
+    snapshot_path = get_state_path(settings, "push_snapshot", "csv/process/push_snapshot.json")
+    snapshot = load_json_state(snapshot_path)
+    pushed_state = snapshot.setdefault(str(update_type), {})
+    snapshot_changed = False
+
+    journal = open_batch_journal(settings, f"update_products_{update_type}", resume=resume)
+    retry_conf = settings.get("jobs", {})
 
     start_time = time.time()
     total_items = 0
     updated_count = 0
+    skipped_count = 0
+    resumed_count = 0
     error_count = 0
 
-    logging.info(f"🚀 Початок оновлення {log_message} товарів через API.")
+    logging.info(f"🚀 Початок оновлення {log_message} товарів через {'базу даних (SQL)' if backend == 'sql' else 'API'}.")
 
     try:
         if not os.path.exists(source_file_path):
@@ -1218,50 +1931,124 @@ def update_products(update_type):
 
         logging.info(f"🔎 Знайдено {total_items} товарів у файлі '{os.path.basename(source_file_path)}' для оновлення.")
 
-        BATCH_SIZE = 20
-        for i in range(0, total_items, BATCH_SIZE):
-            batch = data_to_update[i:i + BATCH_SIZE]
-            payloads = []
-
-            for row in batch:
-                product_id = row.get('id')
-                if not product_id:
-                    logging.warning(f"⚠️ Рядок {i + 1}: пропущено, не знайдено 'id'.")
-                    continue
-
-                payload = {"id": product_id}
-                for key in payload_keys:
-                    if key in row:
-                        payload[key] = row.get(key)
-                    else:
-                        logging.warning(f"⚠️ Рядок {i + 1} (ID: {product_id}): не знайдено колонку '{key}'.")
-                
-                payloads.append(payload)
-
-            if payloads:
-                try:
-                    response = requests.post(api_url, json={"update": payloads}, auth=(consumer_key, consumer_secret), timeout=WOO_API_TIMEOUT)
-                    response.raise_for_status()
-
-                    result = response.json()
-                    updated_count += len(result.get('update', []))
-                    batch_errors = len(result.get('errors', []))
-                    error_count += batch_errors
+        # Залишаємо лише рядки, що змінилися з останнього успішного оновлення
+        if not force:
+            changed_rows = []
+            for row in data_to_update:
+                previous = pushed_state.get(row.get('id') or "")
+                if previous is not None and all(previous.get(key) == row.get(key) for key in payload_keys):
+                    skipped_count += 1
+                else:
+                    changed_rows.append(row)
+            data_to_update = changed_rows
+            logging.info(f"⏭️ Без змін з останнього оновлення: {skipped_count}. До відправки: {len(data_to_update)}.")
+
+        # Пропускаємо товари, вже відправлені в перерваному запуску (--resume)
+        if journal.done:
+            remaining_rows = [row for row in data_to_update if not journal.is_done(row.get('id') or "")]
+            resumed_count = len(data_to_update) - len(remaining_rows)
+            data_to_update = remaining_rows
+            logging.info(f"♻️ Вже відправлено в попередньому запуску: {resumed_count}. Залишилось: {len(data_to_update)}.")
+
+        # SQL-бекенд: усі зміни однією транзакцією напряму в базі, REST-пакети не потрібні
+        if backend == "sql" and data_to_update:
+            updated_ids = {str(product_id) for product_id in _update_stock_prices_sql(settings, data_to_update)}
+            for row in data_to_update:
+                if str(row.get('id')) in updated_ids:
+                    pushed_state[str(row['id'])] = {key: row.get(key) for key in payload_keys if key in row}
+            updated_count = len(updated_ids)
+            error_count += len(data_to_update) - len(updated_ids)
+            snapshot_changed = bool(updated_ids)
+            data_to_update = []
+
+        # Формуємо пакети (WooCommerce приймає до 100 товарів в одному запиті)
+        batches = []
+        payloads = []
+        for row_number, row in enumerate(data_to_update, start=1):
+            product_id = row.get('id')
+            if not product_id:
+                logging.warning(f"⚠️ Рядок {row_number}: пропущено, не знайдено 'id'.")
+                continue
 
-                    if batch_errors > 0:
-                        for error in result['errors']:
-                            error_msg = f"❌ Помилка в пакеті {i}-{i+BATCH_SIZE}: {error.get('message', 'Невідома помилка')} (код: {error.get('code', 'N/A')})"
-                            logging.error(error_msg)
+            payload = {"id": product_id}
+            for key in payload_keys:
+                if key in row:
+                    payload[key] = row.get(key)
+                else:
+                    logging.warning(f"⚠️ Рядок {row_number} (ID: {product_id}): не знайдено колонку '{key}'.")
+            
+            payloads.append(payload)
+            if len(payloads) == batch_size:
+                batches.append(payloads)
+                payloads = []
+        if payloads:
+            batches.append(payloads)
+
+        # Пакети відправляються паралельно через спільний WooClient (пул з'єднань).
+        # Кількість пакетів "у польоті" адаптивна: якщо сервер відповідає повільніше
+        # за slow_response_sec, ліміт зменшується вдвічі, швидкі відповіді поступово його відновлюють.
+        in_flight_limit = max_in_flight
+        pending = {}
+        next_batch = 0
+        sent_items = 0
+        client = get_wc_api(settings)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            while next_batch < len(batches) or pending:
+                while next_batch < len(batches) and len(pending) < in_flight_limit:
+                    batch_label = f"{sent_items}-{sent_items + len(batches[next_batch])}"
+                    future = executor.submit(_post_update_batch, client, batches[next_batch], WOO_API_TIMEOUT, retry_conf, batch_label)
+                    pending[future] = batch_label
+                    sent_items += len(batches[next_batch])
+                    next_batch += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_label = pending.pop(future)
+                    outcomes, elapsed = future.result()
+                    batch_failed = any(result is None for _, result, _ in outcomes)
+
+                    if (batch_failed or elapsed > slow_response_sec) and in_flight_limit > 1:
+                        in_flight_limit = max(1, in_flight_limit // 2)
+                        logging.warning(f"🐢 Пакет {batch_label} оброблено за {elapsed:.1f} сек. Зменшую кількість паралельних пакетів до {in_flight_limit}.")
+                    elif not batch_failed and elapsed <= slow_response_sec and in_flight_limit < max_in_flight:
+                        in_flight_limit += 1
+
+                    for batch_payloads, result, error in outcomes:
+                        if result is None:
+                            error_msg = f"❌ Помилка з'єднання або запиту для пакета {batch_label} ({len(batch_payloads)} товарів): {error}"
                             print(error_msg)
-                    else:
-                        logging.info(f"✅ Пакет {i}-{i+BATCH_SIZE} успішно оновлено.")
-
-                except requests.exceptions.RequestException as e:
-                    error_msg = f"❌ Помилка з'єднання або запиту для пакета {i}-{i+BATCH_SIZE}: {e}"
-                    print(error_msg)
-                    logging.error(error_msg)
-                    error_count += len(payloads) 
-                    continue
+                            logging.error(error_msg)
+                            error_count += len(batch_payloads)
+                            journal.record([payload["id"] for payload in batch_payloads], "failed", error)
+                            continue
+
+                        updated_count += len(result.get('update', []))
+
+                        # Запам'ятовуємо відправлені значення товарів, оновлених без помилки
+                        sent_by_id = {str(payload["id"]): payload for payload in batch_payloads}
+                        done_ids = []
+                        for item in result.get('update', []):
+                            sent = sent_by_id.get(str(item.get('id')))
+                            if sent and not item.get('error'):
+                                pushed_state[str(sent["id"])] = {key: sent[key] for key in payload_keys if key in sent}
+                                snapshot_changed = True
+                                done_ids.append(sent["id"])
+                        done_set = {str(product_id) for product_id in done_ids}
+                        journal.record(done_ids, "done")
+                        journal.record([product_id for product_id in sent_by_id if product_id not in done_set], "failed", "API-помилка товару")
+
+                        batch_errors = len(result.get('errors', []))
+                        error_count += batch_errors
+
+                        if batch_errors > 0:
+                            for error in result['errors']:
+                                error_msg = f"❌ Помилка в пакеті {batch_label}: {error.get('message', 'Невідома помилка')} (код: {error.get('code', 'N/A')})"
+                                logging.error(error_msg)
+                                print(error_msg)
+                        else:
+                            logging.info(f"✅ Пакет {batch_label} успішно оновлено за {elapsed:.1f} сек.")
+
+        journal.finish()
     except FileNotFoundError as e:
         error_msg = f"❌ Помилка: {e}"
         print(error_msg)
@@ -1273,16 +2060,27 @@ def update_products(update_type):
         logging.error(error_msg)
         error_count += total_items
     finally:
+        if snapshot_changed:
+            try:
+                save_json_state(snapshot_path, snapshot)
+            except OSError as e:
+                logging.error(f"❌ Не вдалося зберегти знімок відправленого стану: {e}")
+
         end_time = time.time()
         elapsed_time = int(end_time - start_time)
 
         print(f"🎉 Оновлення {log_message} завершено. Оновлено {updated_count} товарів за {elapsed_time} сек.")
+        if skipped_count > 0:
+            print(f"⏭️ Пропущено без змін: {skipped_count}.")
         if error_count > 0:
             print(f"⚠️ Завершено з {error_count} помилками. Детальніше в лог-файлі.")
 
         logging.info(f"--- Підсумок оновлення {log_message} ---")
         logging.info(f"Статус: {'Успішно' if error_count == 0 else 'Завершено з помилками'}")
         logging.info(f"Кількість товарів: {updated_count} з {total_items}")
+        logging.info(f"Пропущено без змін: {skipped_count}")
+        if resumed_count:
+            logging.info(f"Вже відправлено в попередньому запуску (--resume): {resumed_count}")
         logging.info(f"Тривалість: {elapsed_time} сек.")
         if error_count > 0:
             logging.info(f"Кількість помилок: {error_count}. Детальні помилки дивіться вище.")
\ No newline at end of file
@@ -1,17 +1,20 @@
-import csv, os, time, requests, shutil, re, random, logging, html
+import csv, os, time, requests, shutil, re, logging, html
 import pandas as pd
 import mysql.connector
 import pymysql
 import mimetypes
-from bs4 import BeautifulSoup
 from PIL import Image
 from typing import Dict, Tuple, List, Optional, Any
 from scr.base_function import get_wc_api, load_settings, setup_new_log_file, log_message_to_existing_file, load_attributes_csv, \
                                 save_attributes_csv, load_category_csv, save_category_csv, load_poznachky_csv, \
-                                _process_batch_update, find_media_ids_for_sku, _process_batch_create, clear_directory, \
-                                download_product_images, move_gifs, convert_to_webp_square, sync_webp_column, copy_to_site, \
+                                _process_batch_update, find_media_ids_for_sku, _process_batch_create, clear_directory, open_batch_journal, connect_wp_db, \
+                                prefetch_media_ids, get_media_store, get_supplier_scraper, PageNotCachedError, \
+                                get_product_page_store, get_product_page, harvest_product_pages, find_product_link, \
+                                get_image_blob_store, get_state_path, download_product_images, move_gifs, convert_to_webp_square, \
+                                sync_webp_column, copy_to_site, \
                                 translate_text_deepl, get_deepl_usage, fill_wpml_translation_group, notify_user
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 
 def find_new_products():
@@ -141,11 +144,16 @@ def find_new_products():
     except Exception as e:
         logging.info(f"❌ Виникла непередбачена помилка: {e}")
 
-def find_product_data():
+def find_product_data(cache_only=False, resume=False, force=False):
     """
     Зчитує файл з новими товарами, переходить за URL-адресою,
     знаходить URL-адресу простого або варіативного товару,
     і записує знайдену URL-адресу в колонку B(1) в тимчасовий файл.
+    Сторінки завантажуються паралельно (settings['scraping']) з обмеженням швидкості на хост;
+    рядки записуються у вихідному порядку.
+    Результат кожного рядка одразу пишеться в журнал завдання: після збою resume=True
+    продовжує з місця зупинки без повторних запитів. Рядки, що вже мають URL у колонці B,
+    пропускаються (force=True — шукати заново).
     """
 
     # --- 1. Ініціалізація логування (підключаємо існуючий лог-файл) ---
@@ -157,15 +165,54 @@ def find_product_data():
     supliers_new_path = settings['paths']['csv_path_supliers_1_new']  # вхідний CSV (1.csv)
     site_url = settings['suppliers']['1']['site']                    # базовий URL сайту (щоб додавати відносні посилання)
     temp_file_path = supliers_new_path + '.temp'                     # тимчасовий файл під час запису
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    journal = open_batch_journal(settings, "find_product_data", resume=resume)
 
     # --- Лічильники і статистика ---
     total_rows = 0
+    already_resolved = 0
+    from_journal = 0
     found_variant_count = 0
     found_simple_count = 0
     not_found_count = 0
     found_variant_rows = []
     not_found_rows = []
 
+    def _scrape_row(item):
+        """
+        Завантажує сторінку пошуку для рядка; повертає (idx, row, found_url, found_type, error, restored),
+        де restored=True — результат узято з журналу перерваного запуску.
+        """
+        idx, row = item
+        search_url = row[0].strip()    # у вихідному файлі у колонці A може бути "посилання для пошуку"
+        file_sku = row[5].strip()      # артикул (SKU) з колонки, яка відповідає індексу 5
+
+        key = f"{idx}:{file_sku}"
+        # Запит рядка впав у перерваному запуску — повертаємо пошукове посилання з журналу і пробуємо знову
+        if search_url.startswith('Помилка запиту') and key in journal.failed:
+            search_url = journal.data.get(key, {}).get("search_url", "")
+            if search_url:
+                row[0] = search_url
+        # Якщо URL пустий або вже позначений як помилка запиту, рядок не обробляємо
+        if not search_url or search_url.startswith('Помилка запиту'):
+            return idx, row, None, 'skip', None, False
+        # Рядок уже оброблено в перерваному запуску — беремо результат з журналу
+        if journal.is_done(key):
+            saved = journal.data.get(key, {})
+            return idx, row, saved.get("url"), saved.get("type"), None, True
+        # URL уже знайдено попереднім запуском
+        if not force and len(row) > 1 and row[1].strip():
+            return idx, row, None, 'resolved', None, False
+        try:
+            response = scraper.get(search_url)
+        except PageNotCachedError as e:
+            logging.warning(f"Рядок {idx + 2}: {e}")
+            return idx, row, None, 'skip', None, False
+        except requests.RequestException as e:
+            return idx, row, None, None, e, False
+        found_url, found_type = find_product_link(response.text, file_sku, site_url, scraper.parser)
+        return idx, row, found_url, found_type, None, False
+
     try:
         # --- 3. Відкриваємо вхідний файл для читання ---
         with open(supliers_new_path, mode='r', encoding='utf-8') as input_file:
@@ -177,89 +224,56 @@ def find_product_data():
                 writer = csv.writer(output_file)
                 writer.writerow(headers) # записуємо заголовки у тимчасовий файл
 
-                # --- 5. Ітерація по рядках вхідного файлу ---
-                for idx, row in enumerate(reader):
+                # --- 5. Паралельна обробка рядків, результати — у порядку вхідного файлу ---
+                for idx, row, found_url, found_type, error, restored in scraper.map_ordered(_scrape_row, enumerate(reader)):
                     total_rows += 1
-                    # 5.1. Витягуємо ключові поля із рядка
-                    search_url = row[0].strip()    # у вихідному файлі у колонці A може бути "посилання для пошуку"
-                    file_sku = row[5].strip()      # артикул (SKU) з колонки, яка відповідає індексу 5
 
-                    # --- 6. Перевірка валідності URL для пошуку ---
-                    # Якщо URL пустий або вже позначений як помилка запиту, пропускаємо рядок
-                    if not search_url or search_url.startswith('Помилка запиту'):
+                    if found_type in ('skip', 'resolved'):
+                        if found_type == 'resolved':
+                            already_resolved += 1
                         writer.writerow(row)
                         continue
 
-                    try:
-                        # --- 7. Виконання HTTP-запиту до search_url і парсинг HTML ---
-                        response = requests.get(search_url)
-                        response.raise_for_status()
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        found_type = None  # 'variant' або 'simple'
-                        found_url = None  # сюди запишемо знайдену реальну URL-адресу товару
-                        
-                        # --- 8. Пошук варіативних товарів (input.variant_control[data-code]) ---
-                        # Шукаємо input теги з класом variant_control та атрибутом data-code,
-                        # порівнюємо data-code з file_sku — якщо співпадіння, беремо посилання у батьківському блоці.
-                        variant_inputs = soup.find_all('input', class_='variant_control', attrs={'data-code': True})
-                        for input_tag in variant_inputs:
-                            site_sku = input_tag.get('data-code', '').strip()
-                            if file_sku == site_sku:
-                                parent_div = input_tag.find_parent('div', class_='card-block')
-                                if parent_div:
-                                    link_tag = parent_div.find('h4', class_='card-title').find('a')
-                                    if link_tag and link_tag.has_attr('href'):
-                                        # Формуємо повний URL (додаємо site_url до відносного шляху)
-                                        found_url = site_url + link_tag['href']
-                                        found_type = 'variant'
-                                        break
-
-                        # --- 9. Якщо не знайшли серед варіантів — шукаємо прості товари ---
-                        if not found_url:
-                            # Для простих товарів шукаємо div з класом 'radio', беремо текст як SKU,
-                            # і за таким же підходом знаходимо посилання у блоці card-block.
-                            simple_divs = soup.find_all('div', class_='radio')
-                            for div_tag in simple_divs:
-                                site_sku = div_tag.get_text(strip=True).strip()
-                                if file_sku == site_sku:
-                                    parent_div = div_tag.find_parent('div', class_='card-block')
-                                    if parent_div:
-                                        link_tag = parent_div.find('h4', class_='card-title').find('a')
-                                        if link_tag and link_tag.has_attr('href'):
-                                            found_url = site_url + link_tag['href']
-                                            found_type = 'simple'
-                                            break
-
-                        # --- 10. Запис результату у колонку B (індекс 1) або логування якщо не знайдено ---
-                        if found_url:
-                            row[1] = found_url
-                            if found_type == 'variant':
-                                found_variant_count += 1
-                                found_variant_rows.append(idx + 2)  # +2, бо рядки CSV рахуються з 1 + заголовок
-                            elif found_type == 'simple':
-                                found_simple_count += 1
-                        else:
-                            not_found_count += 1
-                            not_found_rows.append(idx + 2)
+                    if restored:
+                        from_journal += 1
+                    elif error is not None:
+                        # Збій запиту (таймаут, 5xx) — failed: --resume повторить рядок
+                        journal.record([f"{idx}:{row[5].strip()}"], "failed", str(error), data={"search_url": row[0]})
+                    else:
+                        # Результат рядка — одразу в журнал (переживає аварійне завершення)
+                        journal.record([f"{idx}:{row[5].strip()}"], "done", data={"url": found_url, "type": found_type})
 
-                        # Записуємо (знайдений або незмінений) рядок у тимчасовий файл
+                    if error is not None:
+                        # --- 6. Обробка помилок HTTP-запиту: логування та маркування рядка ---
+                        logging.error(f"Рядок {idx + 2}: Помилка при запиті до урл: {error}")
+                        row[0] = f'Помилка запиту: {error}'  # позначаємо поле пошуку як помилкове
                         writer.writerow(row)
+                        continue
 
-                    except requests.RequestException as e:
-                        # --- 11. Обробка помилок HTTP-запиту: логування та маркування рядка ---
-                        logging.error(f"Рядок {idx + 2}: Помилка при запиті до урл: {e}")
-                        row[0] = f'Помилка запиту: {e}'  # позначаємо поле пошуку як помилкове
-                        writer.writerow(row)
-                    
-                    # --- 12. Додаткова пауза між запитами (рандомізована) для уникнення бана/DDOS ---
-                    time.sleep(random.uniform(1, 3))
+                    # --- 7. Запис результату у колонку B (індекс 1) або логування якщо не знайдено ---
+                    if found_url:
+                        row[1] = found_url
+                        if found_type == 'variant':
+                            found_variant_count += 1
+                            found_variant_rows.append(idx + 2)  # +2, бо рядки CSV рахуються з 1 + заголовок
+                        elif found_type == 'simple':
+                            found_simple_count += 1
+                    else:
+                        not_found_count += 1
+                        not_found_rows.append(idx + 2)
+
+                    # Записуємо (знайдений або незмінений) рядок у тимчасовий файл
+                    writer.writerow(row)
   
-        # --- 13. Після успішної обробки: заміна оригінального файлу тимчасовим ---
+        # --- 8. Після успішної обробки: заміна оригінального файлу тимчасовим ---
         os.replace(temp_file_path, supliers_new_path)
+        journal.finish()
 
-        # --- 14. Зведена статистика ---
+        # --- 9. Зведена статистика ---
         logging.info("=== ПІДСУМКОВА ІНФОРМАЦІЯ ===")
         logging.info(f"Всього рядків з товарами: {total_rows}")
+        if already_resolved or from_journal:
+            logging.info(f"Вже мали URL (пропущено): {already_resolved}, відновлено з журналу: {from_journal}")
         logging.info(
             f"Знайдено URL варіативних товарів: {found_variant_count}"
             + (f" (Рядки {', '.join(map(str, found_variant_rows))})" if found_variant_rows else "")
@@ -271,19 +285,52 @@ def find_product_data():
         )
 
     except FileNotFoundError as e:
-        # --- 15. Обробка помилки: вхідний файл не знайдено ---
+        # --- 10. Обробка помилки: вхідний файл не знайдено ---
         logging.error(f"Помилка: Файл не знайдено - {e}")
     except Exception as e:
-        # --- 16. Гарантійне прибирання: видаляємо тимчасовий файл при помилці, щоб не залишити сміття ---
+        # --- 11. Гарантійне прибирання: видаляємо тимчасовий файл при помилці, щоб не залишити сміття ---
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
         logging.error(f"Виникла непередбачена помилка: {e}")
+        logging.info("♻️ Оброблені рядки збережено в журналі — перезапустіть з --resume, щоб продовжити.")
+    finally:
+        scraper.close()
+
+def harvest_new_product_pages(force=False, cache_only=False):
+    """
+    Один раз завантажує та розбирає сторінки нових товарів (URL з колонки B файлу 1.csv)
+    і зберігає характеристики й посилання на зображення у сховищі сторінок.
+    parse_product_attributes та download_images_for_product далі читають ці записи замість мережі.
+    force=True — зібрати сторінки повторно, навіть якщо вони вже є у сховищі.
+    """
+    log_message_to_existing_file()
+    logging.info("ФУНКЦІЯ 2.1. Починаю збір сторінок нових товарів...")
+
+    settings = load_settings()
+    supliers_new_path = settings['paths']['csv_path_supliers_1_new']
 
-def parse_product_attributes():
+    items = []
+    try:
+        with open(supliers_new_path, mode='r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                product_url = row[1].strip() if len(row) > 1 else ''
+                if product_url and not product_url.startswith('Помилка запиту'):
+                    items.append((product_url, row[5].strip() if len(row) > 5 else ''))
+    except FileNotFoundError as e:
+        logging.error(f"Помилка: Файл не знайдено - {e}")
+        return
+
+    harvest_product_pages(items, settings, force=force, cache_only=cache_only)
+
+def parse_product_attributes(cache_only=False):
     """
     Парсить сторінки товарів, застосовує заміну з attribute.csv (блочна структура) 
     і додає нові невідомі значення одразу перед наступним блоком-заголовком.
     Логування включає підсумок доданих атрибутів по колонках.
+    Характеристики беруться зі сховища зібраних сторінок (--harvest-pages); відсутні сторінки
+    завантажуються через спільний кеш сторінок (cache_only=True — без мережі) і додаються у сховище.
     """
     log_message_to_existing_file()
     logging.info("ФУНКЦІЯ 3. Починаю парсинг сторінок товарів для вилучення атрибутів...")
@@ -329,6 +376,8 @@ def parse_product_attributes():
 
     # --- 6. Обробка CSV постачальника ---
     temp_file_path = supliers_new_path + '.temp'
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    pages = get_product_page_store(settings)
     try:
         with open(supliers_new_path, mode='r', encoding='utf-8') as input_file, \
              open(temp_file_path, mode='w', encoding='utf-8', newline='') as output_file:
@@ -353,18 +402,8 @@ def parse_product_attributes():
 
                 # --- 6.1 Парсинг сторінки ---
                 try:
-                    response = requests.get(product_url)
-                    response.raise_for_status()
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    characteristics_div = soup.find('div', id='w0-tab0')
-                    parsed_attributes = {}
-                    if characteristics_div and characteristics_div.find('table'):
-                        for tr in characteristics_div.find('table').find_all('tr'):
-                            cells = tr.find_all('td')
-                            if len(cells) == 2:
-                                key = cells[0].get_text(strip=True).replace(':', '')
-                                value = cells[1].get_text(strip=True)
-                                parsed_attributes[key] = value
+                    # Зібрана сторінка (--harvest-pages) або завантаження з додаванням у сховище
+                    parsed_attributes = get_product_page(product_url, pages, scraper, file_sku)["attributes"]
 
                     other_attributes = []
 
@@ -430,8 +469,6 @@ def parse_product_attributes():
                     logging.error(f"Непередбачена помилка парсингу для URL {product_url}: {e}")
                     writer.writerow(row)
 
-                time.sleep(random.uniform(1, 3))
-
         os.replace(temp_file_path, supliers_new_path)
         logging.info("Парсинг атрибутів завершено. Файл 1.csv оновлено.")
 
@@ -458,8 +495,11 @@ def parse_product_attributes():
 
     except Exception as e:
         logging.error(f"Виникла непередбачена помилка: {e}")
+        logging.info("♻️ Завантажені сторінки вже у сховищі — повторний запуск не запитуватиме їх знову.")
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
+    finally:
+        scraper.close()
 
 def apply_final_standardization():
     """
@@ -1025,7 +1065,7 @@ def assign_new_sku_to_products():
         if os.path.exists(temp_path):
             os.remove(temp_path)
 
-def download_images_for_product():
+def download_images_for_product(cache_only=False):
     """
     6 етапів:
       1. Очистка папок JPG та WEBP
@@ -1056,21 +1096,29 @@ def download_images_for_product():
     clear_directory(webp_path)
     logging.info("1. ✅ Очистка папок JPG та WEBP завершена.")
 
-    # 2️⃣ Завантаження
+    # 2️⃣ Завантаження (сторінки товарів — через кеш сторінок)
+    #    Товари обробляються паралельно (ліміт запитів — у скрапері), файли — через сховище за хешем вмісту
     rows = []
+    scraper = get_supplier_scraper(settings, cache_only=cache_only)
+    pages = get_product_page_store(settings)
+    blobs = get_image_blob_store(settings)
+
+    def _download_row(row):
+        if len(row) <= IMG_LIST:
+            row.extend([''] * (IMG_LIST - len(row) + 1))
+        url, sku, cat = row[URL].strip(), row[SKU].strip(), row[CAT].strip()
+        if url and sku and cat:
+            imgs = download_product_images(url, sku, cat, jpg_path, cat_map, scraper=scraper, blobs=blobs, pages=pages)
+            row[IMG_LIST] = ', '.join(imgs) if imgs else ''
+        return row
+
     with open(sl_new, 'r', encoding='utf-8') as f:
         reader = csv.reader(f)
         header = next(reader)
         rows.append(header)
-        for row in reader:
-            if len(row) <= IMG_LIST:
-                row.extend([''] * (IMG_LIST - len(row) + 1))
-            url, sku, cat = row[URL].strip(), row[SKU].strip(), row[CAT].strip()
-            if url and sku and cat:
-                imgs = download_product_images(url, sku, cat, jpg_path, cat_map)
-                row[IMG_LIST] = ', '.join(imgs) if imgs else ''
-            rows.append(row)
-            time.sleep(random.uniform(0.5, 1.5))
+        rows.extend(scraper.map_ordered(_download_row, reader))
+    blobs.save()
+    scraper.close()
 
     with open(sl_new, 'w', encoding='utf-8', newline='') as f:
         csv.writer(f).writerows(rows)
@@ -1081,7 +1129,8 @@ def download_images_for_product():
     logging.info("3. ✅ Переміщення GIF завершено.")
 
     # 4️⃣ WEBP
-    convert_to_webp_square(jpg_path, webp_path)
+    convert_to_webp_square(jpg_path, webp_path, settings.get("webp", {}),
+                           get_state_path(settings, "webp_cache", "csv/process/webp_cache"))
     logging.info("4. ✅ Конвертація JPG у WEBP завершена.")
 
     # 5️⃣ CSV sync
@@ -1218,10 +1267,44 @@ def create_new_products_import_file():
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
-def update_existing_products_batch():
+def _prefetch_product_attributes(wcapi, product_ids, settings):
+    """
+    Завантажує атрибути товарів пачками products?include=...&per_page=100
+    паралельними запитами. Повертає {id товару: список атрибутів}.
+    Товари, яких немає у відповіді, у словник не потрапляють.
+    """
+    chunks = [product_ids[i:i + 100] for i in range(0, len(product_ids), 100)]
+    if not chunks:
+        return {}
+
+    def _fetch(chunk):
+        response = wcapi.get("products", params={
+            "include": ",".join(str(pid) for pid in chunk),
+            "per_page": 100,
+            "lang": "all",
+            "_fields": "id,attributes",
+        })
+        if response.status_code != 200:
+            logging.warning(f"⚠️ Попереднє завантаження атрибутів: помилка {response.status_code} для {len(chunk)} товарів.")
+            return []
+        return response.json()
+
+    attributes_map = {}
+    start_time = time.time()
+    workers = max(1, int(settings.get("update", {}).get("max_in_flight", 4)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for products in executor.map(_fetch, chunks):
+            for product in products:
+                attributes_map[product.get("id")] = product.get("attributes", [])
+    logging.info(f"📥 Завантажено атрибути {len(attributes_map)} з {len(product_ids)} товарів "
+                 f"({len(chunks)} запитів, {time.time() - start_time:.1f} сек.).")
+    return attributes_map
+
+def update_existing_products_batch(resume=False):
     """
     Оновлює існуючі товари у WooCommerce на основі CSV-файлу old_prod_new_SHK.csv.
     Використовує глобальні атрибути WooCommerce із global_attr_map.
+    Результат кожного товару пишеться в журнал завдання; resume=True пропускає вже оновлені товари.
     """
 
     log_message_to_existing_file()
@@ -1244,11 +1327,15 @@ def update_existing_products_batch():
         logging.critical("❌ Не вдалося створити об'єкт WooCommerce API.")
         return
 
-    BATCH_SIZE = 5
+    journal = open_batch_journal(settings, "update_existing_products", resume=resume)
+    retry_conf = settings.get("jobs", {})
+
+    BATCH_SIZE = max(1, min(100, int(settings.get("update", {}).get("batch_size", 100))))
     products_to_update = []
     total_products_read = 0
     total_updated = 0
     total_skipped = 0
+    total_resumed = 0
     errors_list = []
     start_time = time.time()
 
@@ -1262,7 +1349,18 @@ def update_existing_products_batch():
             ACF_PREFIX = 'Мета: '
             ATTRIBUTE_PREFIX = 'attribute:'
 
-            for row in reader:
+            # --- Попереднє завантаження існуючих атрибутів одним проходом ---
+            rows = list(reader)
+            id_index = field_map.get('id', -1)
+            attr_indexes = [idx for header, idx in field_map.items() if header.startswith(ATTRIBUTE_PREFIX)]
+            ids_with_attributes = [
+                int(row[id_index].strip()) for row in rows
+                if row and row[id_index].strip().isdigit() and not journal.is_done(row[id_index].strip())
+                and any(idx < len(row) and row[idx].strip() for idx in attr_indexes)
+            ]
+            existing_attr_map = _prefetch_product_attributes(wcapi, ids_with_attributes, settings)
+
+            for row in rows:
                 total_products_read += 1
 
                 # --- Перевірка ID ---
@@ -1273,6 +1371,9 @@ def update_existing_products_batch():
                     continue
 
                 product_id = int(product_id_str)
+                if journal.is_done(product_id):
+                    total_resumed += 1
+                    continue
                 product_data = {"id": product_id}
                 meta_data = []
                 new_attributes = []
@@ -1342,7 +1443,10 @@ def update_existing_products_batch():
                 # --- Merge атрибутів з існуючими ---
                 if new_attributes:
                     try:
-                        existing_attributes = wcapi.get(f"products/{product_id}").json().get("attributes", [])
+                        existing_attributes = existing_attr_map.get(product_id)
+                        if existing_attributes is None:
+                            # Товар не потрапив у попереднє завантаження — запитуємо окремо
+                            existing_attributes = wcapi.get(f"products/{product_id}").json().get("attributes", [])
                         attr_map = {attr['name']: attr for attr in existing_attributes}
                         for new_attr in new_attributes:
                             name = new_attr['name']
@@ -1362,22 +1466,26 @@ def update_existing_products_batch():
                 products_to_update.append(product_data)
 
                 if len(products_to_update) >= BATCH_SIZE:
-                    total_updated += _process_batch_update(wcapi, products_to_update, errors_list)
+                    total_updated += _process_batch_update(wcapi, products_to_update, errors_list, journal, retry_conf)
                     products_to_update = []
 
             if products_to_update:
-                total_updated += _process_batch_update(wcapi, products_to_update, errors_list)
+                total_updated += _process_batch_update(wcapi, products_to_update, errors_list, journal, retry_conf)
 
     except Exception as e:
         logging.critical(f"❌ Критична помилка при обробці CSV: {e}", exc_info=True)
         return
 
+    journal.finish()
+
     # --- Підсумок ---
     elapsed_time = int(time.time() - start_time)
     logging.info("--- 🏁 Підсумок оновлення існуючих товарів ---")
     logging.info(f"Всього рядків: {total_products_read}")
     logging.info(f"Успішно оновлено: {total_updated}")
-    logging.info(f"Пропущено/з помилками: {total_products_read - total_updated}")
+    if total_resumed:
+        logging.info(f"Вже оновлено в попередньому запуску (--resume): {total_resumed}")
+    logging.info(f"Пропущено/з помилками: {total_products_read - total_updated - total_resumed}")
     logging.info(f"Загальна тривалість: {elapsed_time} сек.")
 
     if errors_list:
@@ -1387,8 +1495,63 @@ def update_existing_products_batch():
     else:
         logging.info("✅ Оновлення завершено без помилок.")
 
-def create_new_products_batch():
-    """Пакетне створення нових товарів у WooCommerce з CSV (використовує глобальні атрибути)."""
+def _load_existing_skus(settings):
+    """
+    Будує множину SKU, що вже існують на сайті, одним запитом:
+    1) SQL по _sku у wp_postmeta (якщо в settings є блок 'db');
+    2) інакше — зі свіжого zalishki.csv (не старшого за sku_index.max_age_minutes, за замовчуванням 60).
+    Повертає None, якщо жодне джерело недоступне (тоді перевірка йде через API для кожного SKU).
+    """
+    db_conf = settings.get("db")
+    if db_conf:
+        try:
+            conn = connect_wp_db(db_conf)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT DISTINCT pm.meta_value AS sku
+                        FROM wp_postmeta pm
+                        JOIN wp_posts p ON p.ID = pm.post_id
+                        WHERE pm.meta_key = '_sku' AND pm.meta_value <> ''
+                          AND p.post_type IN ('product', 'product_variation') AND p.post_status <> 'trash'
+                    """)
+                    skus = {record["sku"].strip() for record in cursor.fetchall()}
+            finally:
+                conn.close()
+            logging.info(f"📇 Індекс SKU з бази даних: {len(skus)} артикулів.")
+            return skus
+        except Exception as e:
+            logging.warning(f"⚠️ Не вдалося побудувати індекс SKU з бази: {e}. Пробую zalishki.csv.")
+
+    zalishki_path = settings.get("paths", {}).get("csv_path_zalishki")
+    max_age_minutes = float(settings.get("sku_index", {}).get("max_age_minutes", 60))
+    if zalishki_path and os.path.exists(zalishki_path):
+        age_minutes = (time.time() - os.path.getmtime(zalishki_path)) / 60
+        if age_minutes <= max_age_minutes:
+            with open(zalishki_path, mode='r', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                headers = next(reader, [])
+                if 'sku' in headers:
+                    sku_index = headers.index('sku')
+                    skus = {row[sku_index].strip() for row in reader if len(row) > sku_index and row[sku_index].strip()}
+                else:
+                    skus = None
+            if skus is not None:
+                logging.info(f"📇 Індекс SKU з {os.path.basename(zalishki_path)} ({int(age_minutes)} хв. тому): {len(skus)} артикулів.")
+                return skus
+            # Без заголовка 'sku' колонку не вгадуємо: хибний індекс зробив би всі SKU «новими»
+            logging.warning(f"⚠️ У {os.path.basename(zalishki_path)} немає колонки 'sku' — індекс SKU не використовується.")
+        else:
+            logging.warning(f"⚠️ {os.path.basename(zalishki_path)} застарів ({int(age_minutes)} хв.) — індекс SKU не використовується.")
+
+    logging.warning("⚠️ Індекс SKU недоступний. Існування кожного SKU перевірятиметься через API.")
+    return None
+
+def create_new_products_batch(resume=False):
+    """
+    Пакетне створення нових товарів у WooCommerce з CSV (використовує глобальні атрибути).
+    Результат кожного товару пишеться в журнал завдання; resume=True пропускає вже створені SKU.
+    """
 
     log_message_to_existing_file()
     logging.info("🚀 Починаю пакетне СТВОРЕННЯ нових товарів з SL_new_prod.csv...")
@@ -1445,11 +1608,16 @@ def create_new_products_batch():
         categories_map = {}
 
     # --- Ініціалізація ---
+    existing_skus = _load_existing_skus(settings)
+    journal = open_batch_journal(settings, "create_new_products", resume=resume)
+    retry_conf = settings.get("jobs", {})
+
     BATCH_SIZE = 50
     products_to_create = []
     total_products_read = 0
     total_created = 0
     total_skipped = 0
+    total_resumed = 0
     errors_list = []
     start_time = time.time()
 
@@ -1463,7 +1631,15 @@ def create_new_products_batch():
             headers = next(reader)
             field_map = {header: idx for idx, header in enumerate(headers)}
 
-            for row in reader:
+            # --- Попередній пошук зображень: один індекс uploads і пакетні SQL-запити ---
+            rows = list(reader)
+            image_index = field_map.get('image_name')
+            if image_index is not None:
+                image_skus = [row[field_map.get('sku', -1)].strip() for row in rows
+                              if len(row) > image_index and row[image_index].strip()]
+                prefetch_media_ids(image_skus, uploads_path, settings)
+
+            for row in rows:
                 total_products_read += 1
                 sku = row[field_map.get('sku', -1)].strip()
                 name = row[field_map.get('name', -1)].strip()
@@ -1473,15 +1649,25 @@ def create_new_products_batch():
                     total_skipped += 1
                     continue
 
+                if journal.is_done(sku):
+                    total_resumed += 1
+                    continue
+
                 # --- Перевірка, чи товар зі SKU вже існує у WooCommerce ---
-                try:
-                    existing_products = wcapi.get("products", params={"sku": sku}).json()
-                    if isinstance(existing_products, list) and existing_products:
+                if existing_skus is not None:
+                    if sku in existing_skus:
                         logging.warning(f"⚠️ Товар зі SKU {sku} вже існує — пропускаю.")
                         total_skipped += 1
                         continue
-                except Exception as e:
-                    logging.error(f"❌ Не вдалося перевірити SKU {sku} у WooCommerce: {e}")
+                else:
+                    try:
+                        existing_products = wcapi.get("products", params={"sku": sku}).json()
+                        if isinstance(existing_products, list) and existing_products:
+                            logging.warning(f"⚠️ Товар зі SKU {sku} вже існує — пропускаю.")
+                            total_skipped += 1
+                            continue
+                    except Exception as e:
+                        logging.error(f"❌ Не вдалося перевірити SKU {sku} у WooCommerce: {e}")
 
                 product_data = {"sku": sku, "name": name, "status": "draft"}
                 meta_data = []
@@ -1547,7 +1733,7 @@ def create_new_products_batch():
 
                     # --- зображення ---
                     elif key == 'image_name':
-                        images = find_media_ids_for_sku(wcapi, sku, uploads_path)
+                        images = find_media_ids_for_sku(wcapi, sku, uploads_path, settings)
 
                     # --- ціна, запаси, статус ---
                     elif key == 'regular_price':
@@ -1571,13 +1757,15 @@ def create_new_products_batch():
                     product_data['images'] = images
 
                 products_to_create.append(product_data)
+                if existing_skus is not None:
+                    existing_skus.add(sku)  # повтор SKU у цьому ж файлі теж пропускаємо
 
                 if len(products_to_create) >= BATCH_SIZE:
-                    total_created += _process_batch_create(wcapi, products_to_create, errors_list)
+                    total_created += _process_batch_create(wcapi, products_to_create, errors_list, journal, retry_conf)
                     products_to_create = []
 
             if products_to_create:
-                total_created += _process_batch_create(wcapi, products_to_create, errors_list)
+                total_created += _process_batch_create(wcapi, products_to_create, errors_list, journal, retry_conf)
 
     except FileNotFoundError:
         logging.critical(f"❌ Файл {csv_path} не знайдено.")
@@ -1586,11 +1774,15 @@ def create_new_products_batch():
         logging.critical(f"❌ Критична помилка при читанні CSV: {e}", exc_info=True)
         return
 
+    journal.finish()
+
     elapsed_time = int(time.time() - start_time)
     logging.info("--- 🏁 Підсумок створення нових товарів ---")
     logging.info(f"Всього прочитано рядків: {total_products_read}")
     logging.info(f"Успішно створено товарів: {total_created}")
-    logging.info(f"Пропущено/з помилками: {total_products_read - total_created}")
+    if total_resumed:
+        logging.info(f"Вже створено в попередньому запуску (--resume): {total_resumed}")
+    logging.info(f"Пропущено/з помилками: {total_products_read - total_created - total_resumed}")
     logging.info(f"Загальна тривалість: {elapsed_time} сек.")
 
     if errors_list:
@@ -1603,6 +1795,18 @@ def create_new_products_batch():
     # Повідомлення користувачу
     notify_user("Готово ✅", "Пакетне оновлення завершено", sound=True)
 
+def _pick_media_hit(items: List[Dict[str, Any]], filename: str) -> Tuple[Optional[int], bool]:
+    """
+    Вибирає вкладення з результатів wp/v2/media?search=: (id, True) — ім'я файлу source_url збігається
+    з filename (як у update_image_seo_by_sku); інакше (id першого результату, False) — такий id
+    не можна записувати у спільне сховище media ID, бо пошук нечіткий (ABC123-2.webp для ABC123.webp).
+    """
+    for it in items:
+        src = it.get("source_url", "") or it.get("guid", {}).get("rendered", "")
+        if filename.lower() in os.path.basename(src).lower():
+            return it.get("id"), True
+    return (items[0].get("id") if items else None), False
+
 def update_image_seo_from_csv():
     """
     Оновлює SEO-атрибути зображень українських товарів з файлу csv_path_sl_new_prod.
@@ -1659,16 +1863,7 @@ def update_image_seo_from_csv():
         logging.critical(f"❌ Не вдалося створити об'єкт WooCommerce API: {e}")
         return
 
-    base_url = settings.get("url", "").rstrip("/")
-    wp_login = settings.get("login")
-    wp_pass = settings.get("pass")
-
-    # 🧠 Створюємо один Session для всіх HTTP-запитів
-    session = requests.Session()
-    if wp_login and wp_pass:
-        session.auth = (wp_login, wp_pass)
-    session.headers.update({"Content-Type": "application/json"})
-    session.verify = True
+    media_store = get_media_store(settings, wcapi)  # кеш slug → media ID між запусками
 
     updated_count = 0
     failed_count = 0
@@ -1716,20 +1911,22 @@ def update_image_seo_from_csv():
 
         wc_images_update = []
 
-        # --- Оновлення кожного зображення через один session ---
+        # --- Оновлення кожного зображення через спільний клієнт ---
         for img in images:
             img_id = img.get("id")
             src = img.get("src")
 
             if not img_id and src:
                 filename = os.path.basename(src)
+                file_slug = os.path.splitext(filename)[0]
+                img_id = media_store.get(file_slug)
                 try:
-                    media_search = session.get(
-                        f"{base_url}/wp-json/wp/v2/media",
-                        params={"search": filename}
-                    )
-                    if media_search.status_code == 200 and media_search.json():
-                        img_id = media_search.json()[0].get("id")
+                    if not img_id:
+                        media_search = wcapi.wp("GET", "media", params={"search": filename})
+                        if media_search.status_code == 200 and media_search.json():
+                            img_id, exact = _pick_media_hit(media_search.json(), filename)
+                            if exact:
+                                media_store.put(file_slug, img_id)
                 except Exception as e:
                     logging.warning(f"Рядок {idx}, SKU {sku}: не вдалося знайти медіа через WP API: {e}")
 
@@ -1740,10 +1937,10 @@ def update_image_seo_from_csv():
             wc_images_update.append({"id": img_id, "alt": alt, "name": safe_title})
 
             try:
-                media_endpoint = f"{base_url}/wp-json/wp/v2/media/{img_id}"
-                session.put(
-                    media_endpoint,
-                    json={
+                wcapi.wp(
+                    "PUT",
+                    f"media/{img_id}",
+                    data={
                         "title": safe_title,
                         "alt_text": alt,
                         "caption": caption,
@@ -1768,9 +1965,6 @@ def update_image_seo_from_csv():
                 logging.error(f"Рядок {idx}, SKU {sku}: WooCommerce PUT exception: {e}")
                 failed_count += len(wc_images_update)
 
-    # --- Закриваємо сесію ---
-    session.close()
-
     logging.info(f"🎯 Оновлення SEO (UA) завершено. Успішно оновлено: {updated_count}, не вдалося: {failed_count}.")
     # Повідомлення користувачу
     notify_user("Готово ✅", "Пакетне оновлення завершено", sound=True)
@@ -1944,14 +2138,11 @@ def translate_and_prepare_new_prod_csv():
 def upload_ru_translation_to_wp():
     """
     Створює RU переклад для кожного продукту UA через WPML.
-    Усі HTTP-запити до WooCommerce REST API виконуються через один requests.Session (keep-alive).
+    Усі HTTP-запити до WooCommerce REST API виконуються через спільний WooClient (keep-alive).
     """
 
-    import requests
-    import json
-
     log_message_to_existing_file()
-    logging.info("🚀 Початок імпорту RU перекладів через WPML (одна Session)...")
+    logging.info("🚀 Початок імпорту RU перекладів через WPML...")
 
     # --- Налаштування ---
     settings = load_settings()
@@ -1971,11 +2162,8 @@ def upload_ru_translation_to_wp():
         logging.critical("❌ В settings.json відсутні url / consumer_key / consumer_secret.")
         return
 
-    # --- Один Session для ВСІХ запитів до WooCommerce ---
-    session = requests.Session()
-    session.auth = (ck, cs)
-    session.headers.update({"Accept": "application/json", "Content-Type": "application/json"})
-    session.verify = True  # SSL
+    # --- Спільний клієнт для ВСІХ запитів до WooCommerce ---
+    wcapi = get_wc_api(settings)
 
     created_count = 0
     skipped_count = 0
@@ -2004,8 +2192,8 @@ def upload_ru_translation_to_wp():
 
                 # --- 1) Отримати оригінальний продукт UA за SKU ---
                 try:
-                    resp = session.get(
-                        f"{base_url}/wp-json/wc/v3/products",
+                    resp = wcapi.get(
+                        "products",
                         params={"sku": sku, "lang": "uk"},
                         timeout=30
                     )
@@ -2046,8 +2234,8 @@ def upload_ru_translation_to_wp():
                         continue
 
                     try:
-                        c_resp = session.get(
-                            f"{base_url}/wp-json/wc/v3/products/categories/{cat_id}",
+                        c_resp = wcapi.get(
+                            f"products/categories/{cat_id}",
                             params={"lang": "ru"},
                             timeout=20
                         )
@@ -2080,8 +2268,8 @@ def upload_ru_translation_to_wp():
                         options_ru = attr_terms_cache[attr_id]
                     else:
                         try:
-                            a_resp = session.get(
-                                f"{base_url}/wp-json/wc/v3/products/attributes/{attr_id}/terms",
+                            a_resp = wcapi.get(
+                                f"products/attributes/{attr_id}/terms",
                                 params={"lang": "ru", "per_page": 100},
                                 timeout=20
                             )
@@ -2128,9 +2316,9 @@ def upload_ru_translation_to_wp():
 
                 # --- 5) Створюємо RU продукт ---
                 try:
-                    p_resp = session.post(
-                        f"{base_url}/wp-json/wc/v3/products",
-                        data=json.dumps(translated_data),
+                    p_resp = wcapi.post(
+                        "products",
+                        translated_data,
                         timeout=40
                     )
                 except Exception as e:
@@ -2151,12 +2339,6 @@ def upload_ru_translation_to_wp():
     except Exception as e:
         logging.error(f"❌ Критична помилка під час імпорту перекладів: {e}", exc_info=True)
 
-    finally:
-        try:
-            session.close()
-            logging.info("🔒 HTTPS Session закрито.")
-        except Exception:
-            pass
     # Повідомлення користувачу
     notify_user("Готово ✅", "Пакетне оновлення завершено", sound=True)
 
@@ -2217,7 +2399,8 @@ def update_image_seo_ru_from_csv():
         logging.critical(f"❌ Не вдалося створити об'єкт WooCommerce API: {e}")
         return
 
-    base_url = settings.get("url", "").rstrip("/")
+    media_store = get_media_store(settings, wcapi)  # кеш slug → media ID між запусками
+
     wp_login = settings.get("login")
     wp_pass = settings.get("pass")
 
@@ -2269,27 +2452,28 @@ def update_image_seo_ru_from_csv():
         img_id = main_image.get("id")
         src = main_image.get("src")
 
+        if not img_id and src:
+            img_id = media_store.get(os.path.splitext(os.path.basename(src))[0])
+
         if not img_id and src and wp_login and wp_pass:
             filename = os.path.basename(src)
             try:
-                media_search = requests.get(
-                    f"{base_url}/wp-json/wp/v2/media",
-                    params={"search": filename},
-                    auth=(wp_login, wp_pass)
-                )
+                media_search = wcapi.wp("GET", "media", params={"search": filename}, auth=(wp_login, wp_pass))
                 if media_search.status_code == 200 and media_search.json():
-                    img_id = media_search.json()[0].get("id")
+                    img_id, exact = _pick_media_hit(media_search.json(), filename)
+                    if exact:
+                        media_store.put(os.path.splitext(filename)[0], img_id)
             except Exception as e:
                 logging.warning(f"Рядок {idx}, SKU {sku}: не вдалося знайти медіа через WP API: {e}")
 
         # --- Оновлюємо лише головне зображення ---
         if img_id:
             try:
-                media_endpoint = f"{base_url}/wp-json/wp/v2/media/{img_id}"
-                wp_resp = requests.put(
-                    media_endpoint,
+                wp_resp = wcapi.wp(
+                    "PUT",
+                    f"media/{img_id}",
                     auth=(wp_login, wp_pass),
-                    json={
+                    data={
                         "title": title,
                         "alt_text": alt,
                         "caption": caption,
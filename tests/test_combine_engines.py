@@ -0,0 +1,105 @@
+"""
+Рушії об'єднання зведеної таблиці ("python" і "vectorized") мають давати однакові рядки,
+лічильники постачальників і однакові помилки на даних з tests/fixtures/combine.
+"""
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+pytest.importorskip("pandas")
+products = pytest.importorskip("scr.products")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "combine")
+
+
+@pytest.fixture(scope="module")
+def combine_inputs(tmp_path_factory):
+    settings = {
+        "paths": {
+            "csv_path_zalishki": os.path.join(FIXTURES_DIR, "zalishki.csv"),
+            "csv_path_zvedena": str(tmp_path_factory.mktemp("combine") / "zvedena.csv"),
+        },
+        "suppliers": {
+            "1": {"csv_path": os.path.join(FIXTURES_DIR, "supplier_1.csv"), "delimiter": ";"},
+            "2": {"csv_path": os.path.join(FIXTURES_DIR, "supplier_2.csv")},
+            "3": {"csv_name": os.path.join(FIXTURES_DIR, "supplier_3.csv")},
+            "4": {"csv_path": os.path.join(FIXTURES_DIR, "supplier_4.csv")},
+        },
+        "column_zvedena_name": {str(i): f"col_{i}" for i in range(28)},
+    }
+    config = products._combine_config(settings)
+    supplier_data = products._load_supplier_data(config["supplier_list"])
+    selected_rows, _ = products._read_zalishki_rows(config["zalishki_path"], config["zalishki_columns"])
+    return selected_rows, supplier_data, config["suppliers_to_process"]
+
+
+def _run(combine, selected_rows, supplier_data, suppliers_to_process):
+    """(рядки, лічильники) або ('error', тип, текст) — щоб порівнювати і результати, і помилки."""
+    try:
+        return combine(copy.deepcopy(selected_rows), copy.deepcopy(supplier_data), suppliers_to_process)
+    except Exception as e:
+        return "error", type(e).__name__, str(e)
+
+
+def _both(selected_rows, supplier_data, suppliers_to_process):
+    python = _run(products._combine_rows_python, selected_rows, supplier_data, suppliers_to_process)
+    vectorized = _run(products._combine_rows_vectorized, selected_rows, supplier_data, suppliers_to_process)
+    assert python == vectorized
+    return python
+
+
+def test_fixture_rows_identical(combine_inputs):
+    rows, counts = _both(*combine_inputs)
+    assert [row[0] for row in rows] == ["107", "102", "104", "103", "106", "101", "105"]
+    assert all(len(row) == 28 for row in rows)
+    assert counts == {"1": 5, "2": 3, "3": 4, "4": 4}
+    by_id = {row[0]: row for row in rows}
+    assert by_id["101"][11:14] == ["A1", "101", "6"]        # повторений ключ — останній рядок
+    assert by_id["101"][23:28] == ["9", "95", "1", "1", "1"]
+    assert by_id["104"][23:28] == ["0", "12.5", "0", "1", "0"]  # без постачальників — ціна з H
+    assert by_id["103"][23:28] == ["1", "40", "1", "1", "1"]    # 'Yes ', G='abc' і H='' → 0
+
+
+def test_empty_input_identical(combine_inputs):
+    _, supplier_data, suppliers_to_process = combine_inputs
+    assert _both([], supplier_data, suppliers_to_process) == ([], {"1": 0, "2": 0, "3": 0, "4": 0})
+
+
+def _drop_supplier(rows, data):
+    del data["3"]
+
+
+def _empty_supplier(rows, data):
+    data["2"] = {}
+
+
+def _bad_supplier_price(rows, data):
+    data["1"]["A6"][1] = "12,5"
+
+
+def _bad_supplier_stock(rows, data):
+    data["2"]["B7"][2] = "n/a"
+
+
+def _bad_sort_key(rows, data):
+    rows[3][1] = "x"
+
+
+@pytest.mark.parametrize("mutate, expect_error", [
+    (_drop_supplier, False),
+    (_empty_supplier, False),
+    (_bad_supplier_price, True),
+    (_bad_supplier_stock, True),
+    (_bad_sort_key, True),
+], ids=lambda value: getattr(value, "__name__", str(value)))
+def test_error_cases_identical(combine_inputs, mutate, expect_error):
+    selected_rows, supplier_data, suppliers_to_process = copy.deepcopy(combine_inputs)
+    mutate(selected_rows, supplier_data)
+    result = _both(selected_rows, supplier_data, suppliers_to_process)
+    assert (result[0] == "error") is expect_error
+    if expect_error:
+        assert result[1] == "ValueError"
@@ -0,0 +1,75 @@
+"""
+Рушії розбору HTML постачальника (bs4 / lxml) мають давати однаковий результат
+на сторінках з tests/fixtures/supplier_pages — і для WooCommerce, і для OpenCart.
+"""
+import glob
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "supplier_pages")
+PAGES = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html")))
+SITE_URL = "https://supplier.example.com"
+
+
+@pytest.fixture(params=["scr.base_function", "scr.oc_base_function"])
+def module(request):
+    return pytest.importorskip(request.param)
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_backends_extract_identical_results(module, path):
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    assert module.extract_search_results(html, "bs4") == module.extract_search_results(html, "lxml")
+    assert module.parse_product_page(html, "bs4") == module.parse_product_page(html, "lxml")
+
+
+@pytest.mark.parametrize("parser", ["bs4", "lxml"])
+def test_search_results(module, parser):
+    assert module.extract_search_results(_read("search_variant.html"), parser) == {
+        "variant": [("10452-50", "/product/krem-dlia-ruk-10452"), ("10452-100", "/product/krem-dlia-ruk-10452")],
+        "simple": [("20011", "/product/shampun-20011")],
+    }
+    assert module.extract_search_results(_read("search_simple.html"), parser) == {
+        "variant": [],
+        "simple": [("S4", "/product/mylo-s4"), ("S5", "/product/gel-s5"), ("S6", "/product/nested-s6")],
+    }
+
+
+@pytest.mark.parametrize("parser", ["bs4", "lxml"])
+def test_find_product_link_ignores_script_and_style_text(module, parser):
+    html = '<div class="card-block"><h4 class="card-title"><a href="/p/s4">S4</a></h4>' \
+           '<div class="radio">S4<script>var a=1</script></div></div>'
+    assert module.find_product_link(html, "S4", SITE_URL, parser) == (SITE_URL + "/p/s4", "simple")
+    assert module.find_product_link(_read("search_simple.html"), "S5", SITE_URL, parser) == \
+        (SITE_URL + "/product/gel-s5", "simple")
+    assert module.find_product_link(_read("search_variant.html"), "10452-100", SITE_URL, parser) == \
+        (SITE_URL + "/product/krem-dlia-ruk-10452", "variant")
+    assert module.find_product_link(_read("search_simple.html"), "S7", SITE_URL, parser) == (None, None)
+
+
+@pytest.mark.parametrize("parser", ["bs4", "lxml"])
+def test_product_page(module, parser):
+    assert module.parse_product_page(_read("product.html"), parser) == {
+        "attributes": {
+            "Бренд": "ExampleCosmetics",
+            "Об'єм": "50 мл",
+            "Країна": "Україна",
+            "Призначення": "Для сухої шкіри",
+        },
+        "main_image": "https://cdn.example.com/img/10452-main.jpg",
+        "thumbs": ["https://cdn.example.com/img/10452-1.jpg", "https://cdn.example.com/img/10452-2.png"],
+    }
+    assert module.parse_product_page(_read("empty.html"), parser) == {"attributes": {}, "main_image": None, "thumbs": []}